@@ -1,24 +1,253 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.expression import UpdateBase
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from collections import OrderedDict
+from contextlib import contextmanager
+import contextvars
+import hashlib
+import hmac
 import os
+import threading
+import time
 
 load_dotenv()
 
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+# Two engines on the same database. Routers use the async one (get_async_db), so
+# a request waiting on the database or a model doesn't hold a threadpool thread.
+# Background job workers, the export stream, migrations and scripts keep the
+# sync one (SessionLocal, get_db), and so does CPU-heavy work a router hands to
+# a thread (run_in_session): the analytics builds and the import's chunks.
+#
+#   DATABASE_URL        the database, as a sync URL (postgresql://, sqlite:///)
+#   DATABASE_ASYNC_URL  the same database for the async engine; by default derived
+#                       from DATABASE_URL (asyncpg for Postgres, aiosqlite for SQLite)
+#
+# Heavy read-only endpoints can go to a replica instead (get_read_db,
+# get_async_read_db). After a user's request commits on the primary, that
+# user's reads stay on the primary for a while, so they see their own writes
+# through the replication lag (the AI job queue, which is only read on the primary,
+# doesn't count: see not_user_data). The worker that took the write remembers it; the
+# response also carries an X-Last-Write marker, signed with SECRET_KEY, which
+# the frontend sends back so every other worker knows too (LastWriteMiddleware).
+# Keep the window above the worst replication lag plus clock skew between hosts.
+#
+#   DATABASE_READ_URL             the replica, as a sync URL; unset = reads use the primary
+#   DATABASE_READ_ASYNC_URL       the replica for the async engine, derived like DATABASE_ASYNC_URL
+#   DATABASE_READ_STICKY_SECONDS  how long a user's reads stay on the primary after a write, default 5
+#
+# Pool settings, applied to each engine, so a worker can open up to twice
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections:
+#
+#   DB_POOL_SIZE             connections kept open, default 5
+#   DB_MAX_OVERFLOW          extra connections opened during a burst and closed after, default 10
+#   DB_POOL_TIMEOUT          seconds to wait for a free connection before failing, default 30
+#   DB_POOL_RECYCLE          seconds before a connection is replaced, default 300; keep it under
+#                            the server's idle timeout, or the pool hands out dead connections
+#   DB_POOL_PRE_PING         1 to test each connection as it's checked out, default 1
+#   DB_STATEMENT_TIMEOUT_MS  Postgres statement_timeout on every connection, default 0 (none)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL)
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"no async driver for {backend} — set DATABASE_ASYNC_URL")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == "postgresql":
+        # asyncpg takes ssl=, not libpq's sslmode= (Neon URLs carry both sslmode and channel_binding)
+        query = dict(url.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        query.pop("channel_binding", None)
+        url = url.set(query=query)
+    return url
+
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
+def pool_options(url):
+    url = make_url(url)
+    options = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    # an in-memory SQLite database lives in one connection, so it gets no sized pool
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+    return options
+
+
+def _set_statement_timeout(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET statement_timeout = {STATEMENT_TIMEOUT_MS}")
+    cursor.close()
+    dbapi_connection.commit()  # a SET inside a rolled-back transaction is undone
+
+
+def create_engines(url, async_override=None):
+    """A sync and an async engine on the same database, both with the pool settings above."""
+    async_target = async_override or async_url(url)
+    sync_engine = create_engine(url, **pool_options(url))
+    async_engine = create_async_engine(async_target, **pool_options(async_target))
+    if STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+        # a SET on each new connection, not a startup option: poolers like PgBouncer reject those
+        for target in (sync_engine, async_engine.sync_engine):
+            event.listen(target, "connect", _set_statement_timeout)
+    return sync_engine, async_engine
+
+
+engine, async_engine = create_engines(DATABASE_URL, os.getenv("DATABASE_ASYNC_URL"))
+
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_STICKY_SECONDS = float(os.getenv("DATABASE_READ_STICKY_SECONDS", "5"))
+WRITE_MARKER_KEY = (os.getenv("SECRET_KEY") or "").encode()
+if DATABASE_READ_URL:
+    read_engine, async_read_engine = create_engines(DATABASE_READ_URL, os.getenv("DATABASE_READ_ASYNC_URL"))
+else:
+    read_engine, async_read_engine = engine, async_engine
+
+# every pool, by the name metrics, logs and /test-db use for it
+POOLS = {"sync": engine, "async": async_engine.sync_engine}
+if DATABASE_READ_URL:
+    POOLS.update({"read": read_engine, "async_read": async_read_engine.sync_engine})
+
+# the user the current request is for, set by the auth dependencies
+request_user_id = contextvars.ContextVar("request_user_id", default=None)
+# what LastWriteMiddleware knows about the current request's writes. A dict, so a
+# commit on a threadpool thread (which runs in a copy of the context) still fills it in
+_request_writes = contextvars.ContextVar("request_writes", default=None)
+_last_write = OrderedDict()  # user id -> time.time() of their last commit here, oldest first
+# set while committing rows that only the primary is read for (the AI job queue), so
+# the commit doesn't send the user's other reads to the primary
+_not_user_data = contextvars.ContextVar("not_user_data", default=False)
+_last_write_lock = threading.Lock()
+
+
+def _sign_write(user_id, written):
+    signature = hmac.new(WRITE_MARKER_KEY, f"{user_id}:{written}".encode(), hashlib.sha256).hexdigest()
+    return f"{written}.{signature[:32]}"
+
+
+def _marker_time(user_id, marker):
+    # when the user's last write was, from an X-Last-Write marker this app signed; None if it's not one
+    written, _, signature = (marker or "").rpartition(".")
+    if not WRITE_MARKER_KEY or not signature or not hmac.compare_digest(_sign_write(user_id, written), marker):
+        return None
+    try:
+        return float(written)
+    except ValueError:
+        return None
+
+
+@contextmanager
+def not_user_data():
+    """Commits inside this block don't count as the current user's writes."""
+    token = _not_user_data.set(True)
+    try:
+        yield
+    finally:
+        _not_user_data.reset(token)
+
+
+def _record_write(conn):
+    user_id = request_user_id.get()
+    if user_id is None or _not_user_data.get():
+        return
+    now = time.time()
+    with _last_write_lock:
+        _last_write[user_id] = now
+        _last_write.move_to_end(user_id)
+        # past the window an entry decides nothing, so the map only holds recent writers
+        while _last_write and now - next(iter(_last_write.values())) >= READ_STICKY_SECONDS:
+            _last_write.popitem(last=False)
+    writes = _request_writes.get()
+    if writes is not None and WRITE_MARKER_KEY:
+        writes["marker"] = _sign_write(user_id, f"{now:.3f}")
+
+
+def reads_from_primary(user_id):
+    if user_id is None:
+        return False
+    # the later of this worker's own record and a write on another worker, which
+    # the client echoed back; either one alone can be the stale one
+    writes = _request_writes.get()
+    written = max(filter(None, (_last_write.get(user_id), _marker_time(user_id, writes and writes["echoed"]))),
+                  default=None)
+    return written is not None and time.time() - written < READ_STICKY_SECONDS
+
+
+class LastWriteMiddleware:
+    """
+    Carry a user's last write between workers through the client: a request that
+    committed answers with a signed X-Last-Write marker, and requests that send it
+    back read from the primary until the sticky window has passed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        echoed = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-last-write"), None)
+        writes = {"echoed": echoed, "marker": None}
+        token = _request_writes.set(writes)
+
+        async def send_marker(message):
+            if message["type"] == "http.response.start" and writes["marker"]:
+                message["headers"] = [*message.get("headers", []), (b"x-last-write", writes["marker"].encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_marker)
+        finally:
+            _request_writes.reset(token)
+
+
+if DATABASE_READ_URL:
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "commit", _record_write)
+
+
+def _read_session_class(primary, replica):
+    class ReadSession(Session):
+        # picked per statement, so the auth dependency has set the user by the
+        # time the endpoint's first query runs; anything that writes goes to the primary
+        def get_bind(self, mapper=None, clause=None, **kw):
+            if self._flushing or isinstance(clause, UpdateBase) or reads_from_primary(request_user_id.get()):
+                return primary
+            return replica
+    return ReadSession
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit off: reading an expired attribute would need a lazy load, which
+# an AsyncSession can't do outside run_sync
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# bound to the primary, so code that picks SQL by db.bind.dialect keeps working;
+# the replica has to be the same kind of database
+ReadSessionLocal = sessionmaker(class_=_read_session_class(engine, read_engine), bind=engine, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_engine, sync_session_class=_read_session_class(async_engine.sync_engine, async_read_engine.sync_engine),
+    autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -26,4 +255,31 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+async def run_in_session(fn, *args, read=False):
+    """
+    Await fn(session, *args) on a threadpool thread, in a sync session of its own
+    (the read one with read=True). For CPU-heavy work, which under run_sync would
+    hold up the event loop and every request on it. fn commits what it writes.
+    """
+    def call():
+        # like the async sessions, objects stay readable after fn's commit without a reload
+        with (ReadSessionLocal if read else SessionLocal)(expire_on_commit=False) as db:
+            return fn(db, *args)
+    return await run_in_threadpool(call)
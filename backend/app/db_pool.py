@@ -0,0 +1,131 @@
+# Connection pool diagnostics: a warning for every connection held longer than
+# DB_POOL_HOLD_WARN_MS, naming the endpoint that held it; live pool stats for
+# /test-db; and a warm-up that opens DB_POOL_SIZE connections on each engine at
+# startup (replica pools included), so the first burst after a deploy doesn't
+# pay for the TLS handshakes.
+#
+#   DB_POOL_HOLD_WARN_MS  hold time that gets logged on the "app.db_pool" logger, default 2000;
+#                         0 turns the log off
+#   DB_POOL_WARMUP        set to 0 to skip the warm-up, default 1
+#
+# A connection held for a whole request is what runs the pool dry in a burst:
+# a slow statement, or a session kept open across an LLM call.
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from sqlalchemy import event
+from dotenv import load_dotenv
+from app.database import POOL_SIZE
+
+load_dotenv()
+
+HOLD_WARN_MS = float(os.getenv("DB_POOL_HOLD_WARN_MS", "2000"))
+WARMUP = os.getenv("DB_POOL_WARMUP", "1") == "1"
+
+logger = logging.getLogger("app.db_pool")
+
+# the ASGI scope of the request being handled; its route is filled in once the
+# router has matched, which is before any endpoint or dependency checks out
+_scope = contextvars.ContextVar("db_pool_scope", default=None)
+
+
+class RequestScopeMiddleware:
+    """Remember which request is running, for the hold-time log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
+
+
+def _watch(engine, name):
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        connection_record.info["checked_out_by"] = _scope.get()
+
+    def checkin(dbapi_connection, connection_record):
+        start = connection_record.info.pop("checked_out_at", None)
+        scope = connection_record.info.pop("checked_out_by", None)
+        if start is None:
+            return
+        held_ms = (time.perf_counter() - start) * 1000
+        if held_ms < HOLD_WARN_MS:
+            return
+        route = getattr(scope.get("route"), "path", None) if scope else None
+        logger.warning(json.dumps({
+            "pool": name,
+            "held_ms": round(held_ms, 1),
+            # no scope: a job worker or the startup warm-up
+            "method": scope["method"] if scope else None,
+            "route": route or (scope["path"] if scope else "background"),
+        }))
+
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+
+
+def stats(engine):
+    """What the pool holds right now; QueuePool reports everything, SQLite's pools less."""
+    pool = engine.pool
+    result = {"class": type(pool).__name__}
+    for key, method in (("size", "size"), ("checked_in", "checkedin"), ("checked_out", "checkedout"),
+                        ("overflow", "overflow"), ("timeout_s", "timeout")):
+        if hasattr(pool, method):
+            result[key] = getattr(pool, method)()
+    result["recycle_s"] = pool._recycle
+    result["pre_ping"] = pool._pre_ping
+    return result
+
+
+def warm_up(engine):
+    # all at once, so the pool really opens that many instead of reusing the first
+    connections = []
+    try:
+        for _ in range(POOL_SIZE):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def warm_up_async(async_engine):
+    connections = []
+    try:
+        for _ in range(POOL_SIZE):
+            connections.append(await async_engine.connect())
+    finally:
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+
+async def start(engines, async_engines):
+    """Startup hook: open the pools' connections ahead of the first requests."""
+    if not WARMUP:
+        return
+    start_time = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(warm_up, engine) for engine in engines),
+                         *(warm_up_async(async_engine) for async_engine in async_engines))
+    logger.info(f"opened {POOL_SIZE} connections per pool in {time.perf_counter() - start_time:.2f}s")
+
+
+def install(app, pools):
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    if HOLD_WARN_MS:
+        for name, engine in pools.items():
+            _watch(engine, name)
+        app.add_middleware(RequestScopeMiddleware)
@@ -1,10 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.database import engine, async_engine, read_engine, async_read_engine, POOLS, Base
+from app.database import DATABASE_READ_URL, LastWriteMiddleware
 import app.models
+from app import db_pool, metrics, migrate, profiling
 import os
 
 Base.metadata.create_all(bind=engine)
+migrate.upgrade()
 
 app = FastAPI(title="Smart Khata AI",
               docs_url="/docs" if os.getenv("ENV") == "development" else None,
@@ -20,24 +23,54 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-from app.routers import auth, customers, transactions, ai, community
+if DATABASE_READ_URL:
+    # the X-Last-Write marker, so a user's reads after a write skip the replica on every worker
+    app.add_middleware(LastWriteMiddleware)
+
+# outermost, so the time spent in CORS and the routers is all counted
+metrics.install(app, POOLS)
+profiling.install(app)
+db_pool.install(app, POOLS)
+
+from app.routers import auth, customers, transactions, ai, community, imports, export
+from app.routers import metrics as metrics_router
 
 app.include_router(auth.router)
 app.include_router(customers.router)
 app.include_router(transactions.router)
 app.include_router(ai.router)
 app.include_router(community.router)
+app.include_router(imports.router)
+app.include_router(export.router)
+app.include_router(metrics_router.router)
+
+
+from app.services import jobs, passwords
+
+@app.on_event("startup")
+async def start_background_work():
+    # a set: without a replica the read engines are the primary ones
+    await db_pool.start({engine, read_engine}, {async_engine, async_read_engine})
+    jobs.start_workers()
+    await passwords.start_pool()
+
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    await jobs.stop_workers()
+    passwords.stop_pool()
+    metrics.process_exit()
 
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "welcome to Smart khata AI"}
 
 
-from app.database import engine
-
 @app.get("/test-db")
-def test_db():
-    with engine.connect() as conn:
-        return {"status": "PostgreSQL connected successfully"}
\ No newline at end of file
+async def test_db():
+    async with async_engine.connect() as conn:
+        # stats taken while this request holds a connection, so checked_out is at least 1
+        return {"status": "PostgreSQL connected successfully",
+                "pools": {name: db_pool.stats(pool_engine) for name, pool_engine in POOLS.items()}}
\ No newline at end of file
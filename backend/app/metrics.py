@@ -0,0 +1,150 @@
+# Prometheus metrics, served by the /metrics router. They cover request latency
+# and status per route, the database pool, LLM calls per provider, and cache
+# lookups.
+#
+#   PROMETHEUS_MULTIPROC_DIR  set when running more than one worker (uvicorn --workers,
+#                             gunicorn): every process writes its samples there and
+#                             /metrics adds them up. Use an empty directory and wipe it
+#                             before each start, or counters carry over from old pids
+#   METRICS_TOKEN             when set, /metrics wants "Authorization: Bearer <token>"
+#
+# Pool gauges are summed over live workers. A worker that exits cleanly removes
+# its own share (see process_exit); one that gets killed leaves it behind until
+# the directory is wiped.
+import os
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16)  # same bounds as llm_providers.LATENCY_BUCKETS
+
+REQUESTS = Counter("http_requests_total", "Requests handled", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to handle a request, streamed body included",
+                            ["method", "route"], buckets=REQUEST_BUCKETS)
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled", multiprocess_mode="livesum")
+
+# pool: async (the routers), sync (job workers, export stream), or read and async_read
+# when a replica is configured
+POOL_SIZE = Gauge("db_pool_size", "Connections the pool keeps open", ["pool"], multiprocess_mode="livesum")
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections in use", ["pool"], multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size", ["pool"],
+                      multiprocess_mode="livesum")
+POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Time to get a connection from the pool", ["pool"],
+                              buckets=POOL_WAIT_BUCKETS)
+
+# outcome: success, timeout, error, cancelled (lost a hedge race) or skipped (breaker open)
+LLM_CALLS = Counter("llm_calls_total", "Calls to AI providers", ["provider", "outcome"])
+LLM_SECONDS = Histogram("llm_call_duration_seconds", "Latency of successful AI provider calls",
+                        ["provider"], buckets=LLM_BUCKETS)
+LLM_FALLBACKS = Counter("llm_fallbacks_total", "Answers that came from the hardcoded fallback text", ["kind"])
+
+# result: hit, disk_hit (llm cache only) or miss
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups", ["cache", "result"])
+
+# role: leader (ran the work) or coalesced (waited on a leader's identical work instead)
+SINGLE_FLIGHT_CALLS = Counter("singleflight_calls_total", "Calls through single-flight coalescing",
+                              ["flight", "role"])
+
+
+def record_llm_call(provider, outcome, seconds=None):
+    LLM_CALLS.labels(provider, outcome).inc()
+    if seconds is not None:
+        LLM_SECONDS.labels(provider).observe(seconds)
+
+
+def record_cache(cache, result):
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def record_flight(flight, role):
+    SINGLE_FLIGHT_CALLS.labels(flight, role).inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware, so streamed responses are timed to their last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_PROGRESS.dec()
+            # the route template, not the path, so ids don't each get a series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.labels(scope["method"], route, str(status)).inc()
+            REQUEST_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - start)
+
+
+def _instrument_pool(engine, name):
+    pool = engine.pool
+    size, checked_out, overflow = POOL_SIZE.labels(name), POOL_CHECKED_OUT.labels(name), POOL_OVERFLOW.labels(name)
+    wait = POOL_WAIT_SECONDS.labels(name)
+
+    def update():
+        # QueuePool has both; the SQLite pools may not. Overflow is read at each
+        # checkout and checkin, so it lags by one event when a connection closes
+        if hasattr(pool, "size"):
+            size.set(pool.size())
+        if hasattr(pool, "overflow"):
+            overflow.set(max(pool.overflow(), 0))
+
+    def checkout(*args):
+        checked_out.inc()
+        update()
+
+    def checkin(*args):
+        checked_out.dec()
+        update()
+
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+    update()
+
+    # the pool has no event before a checkout, so the wait is timed around the
+    # method every pool class implements to hand out a connection
+    do_get = pool._do_get
+
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            wait.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_do_get
+
+
+def install(app, pools):
+    app.add_middleware(MetricsMiddleware)
+    for name, engine in pools.items():
+        _instrument_pool(engine, name)
+
+
+def process_exit():
+    # drop this worker's pool gauges from the multiprocess totals
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
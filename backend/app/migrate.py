@@ -0,0 +1,165 @@
+# Bring an existing database up to the models. create_all only creates missing
+# tables, so columns and indexes added to a table that already exists are added
+# here, followed by whatever backfill the new columns need; ledger stats are also
+# rebuilt if any customer has no stats row. Every step checks what is already
+# there, so it is safe to run on each start (main.py does) and from several
+# workers at once. By hand, from backend/:
+#   python -m app.migrate          apply what is missing
+#   python -m app.migrate --check  only list it; exits 1 if anything is missing
+#
+# On Postgres, indexes are built CONCURRENTLY so writes carry on while a big
+# table is indexed, and upgrades are serialised with an advisory lock. Run it
+# once by hand before deploying a release that adds indexes to a large ledger,
+# rather than leaving the build to the app's startup.
+import sys
+from contextlib import contextmanager
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import DBAPIError
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.services.ledger import rebuild_ledger_stats
+
+# columns whose values have to be computed for the rows already in the table
+BACKFILLS = {
+    "customer_ledger_stats": ("owner_id", "score", "last_activity"),
+}
+LOCK_KEY = 4815162342  # pg_advisory_lock id for upgrades
+
+
+def _postgres():
+    return engine.dialect.name == "postgresql"
+
+
+@contextmanager
+def _upgrade_lock():
+    if not _postgres():
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+
+
+def _invalid_indexes():
+    # Postgres indexes left unusable by an interrupted concurrent build
+    if not _postgres():
+        return set()
+    with engine.connect() as conn:
+        return {name for (name,) in conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+        ))}
+
+
+def pending():
+    """([(table, column)], [index]) the models have and the database lacks."""
+    inspector = inspect(engine)
+    invalid = _invalid_indexes()
+    columns, indexes = [], []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue  # create_all makes it whole
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        columns += [(table, column) for column in table.columns if column.name not in existing]
+        existing = {i["name"] for i in inspector.get_indexes(table.name)} - invalid
+        indexes += [index for index in table.indexes if index.name not in existing]
+    return columns, indexes
+
+
+def _add_column(table, column):
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+        return True
+    except DBAPIError:
+        # another worker got there first
+        if column.name in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+            return False
+        raise
+
+
+def _create_index(index):
+    if _postgres():
+        # CONCURRENTLY can't run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))  # an invalid leftover
+            index.dialect_options["postgresql"]["concurrently"] = True
+            try:
+                index.create(conn)
+            finally:
+                index.dialect_options["postgresql"]["concurrently"] = False
+        return True
+    try:
+        with engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+        return True
+    except DBAPIError:
+        if index.name in {i["name"] for i in inspect(engine).get_indexes(index.table.name)}:
+            return False
+        raise
+
+
+def customers_without_stats():
+    """How many customers have no customer_ledger_stats row, e.g. from before the table existed."""
+    c, s = models.Customer, models.CustomerLedgerStats
+    db = SessionLocal()
+    try:
+        return db.query(func.count(c.id)).outerjoin(s, s.customer_id == c.id).filter(
+            s.customer_id.is_(None)
+        ).scalar()
+    finally:
+        db.close()
+
+
+def upgrade():
+    """Add missing columns and indexes, then backfill. Returns what was done, as text."""
+    done, backfill = [], set()
+    with _upgrade_lock():
+        columns, indexes = pending()
+        for table, column in columns:
+            if _add_column(table, column):
+                done.append(f"added column {table.name}.{column.name}")
+                if column.name in BACKFILLS.get(table.name, ()):
+                    backfill.add(table.name)
+        for index in indexes:
+            if _create_index(index):
+                done.append(f"created index {index.name} on {index.table.name}")
+
+        # a new stats column needs every row recomputed, and so does a database from
+        # before the stats table, where no customer has a row yet
+        if "customer_ledger_stats" in backfill or customers_without_stats():
+            db = SessionLocal()
+            try:
+                count = rebuild_ledger_stats(db)
+                db.commit()
+            finally:
+                db.close()
+            done.append(f"rebuilt ledger stats for {count} customers")
+    return done
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    if "--check" in sys.argv:
+        columns, indexes = pending()
+        missing = customers_without_stats()
+        for table, column in columns:
+            print(f"❌ missing column {table.name}.{column.name}")
+        for index in indexes:
+            print(f"❌ missing index {index.name} on {index.table.name}")
+        if missing:
+            print(f"❌ {missing} customers without ledger stats")
+        if columns or indexes or missing:
+            print("\nRun `python -m app.migrate` to add them.")
+            sys.exit(1)
+        print("✅ Database is up to date.")
+        sys.exit(0)
+
+    steps = upgrade()
+    for step in steps:
+        print(f"✅ {step}")
+    if not steps:
+        print("✅ Database is up to date.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index, or_
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -24,7 +24,14 @@ class Customer(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     owner = relationship("User", back_populates="customers")
-    transactions = relationship("Transaction", back_populates="customer")
+    transactions = relationship("Transaction", back_populates="customer", order_by="Transaction.id")
+    ledger_stats = relationship("CustomerLedgerStats", back_populates="customer", uselist=False)
+
+    __table_args__ = (
+        Index("ix_customers_owner_name", "owner_id", "name", "id"),  # a shop's customers; list sorted by name
+        Index("ix_customers_owner_phone", "owner_id", "phone"),  # import matches customers by phone
+        Index("ix_customers_area_phone", "area", "phone"),  # community risk refresh
+    )
 
 
 class Transaction(Base):
@@ -36,4 +43,93 @@ class Transaction(Base):
     date_given = Column(DateTime)
     date_repaid = Column(DateTime, nullable=True)
     is_repaid = Column(Boolean, default=False)
-    customer = relationship("Customer", back_populates="transactions")        
\ No newline at end of file
+    customer = relationship("Customer", back_populates="transactions")
+
+    __table_args__ = (
+        Index("ix_transactions_customer_date", "customer_id", "date_given", "id"),  # history pages, newest first
+    )
+
+
+# Credit still owed. Queries for unpaid transactions filter on this exact
+# expression, which is what lets the planner use the partial index below.
+UNPAID = or_(Transaction.is_repaid == False, Transaction.is_repaid.is_(None))
+
+Index("ix_transactions_unpaid", Transaction.customer_id, Transaction.date_given,
+      postgresql_where=UNPAID, sqlite_where=UNPAID)  # oldest unpaid / overdue per customer
+
+
+class CustomerLedgerStats(Base):
+    # running totals per customer, kept in sync by the transaction endpoints
+    # so scores and dues don't need a scan of the whole ledger
+    __tablename__ = "customer_ledger_stats"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    total_count = Column(Integer, default=0)
+    repaid_count = Column(Integer, default=0)
+    unpaid_amount = Column(Float, default=0)
+    delay_sum = Column(Integer, default=0)  # sum of (date_repaid - date_given).days
+    delay_count = Column(Integer, default=0)
+    # copies kept so a shop's customer list can be sorted and paged off one index
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    score = Column(Integer, default=50)  # score_from_stats of the numbers above
+    last_activity = Column(DateTime)  # latest date_given/date_repaid, or when the customer was added
+    customer = relationship("Customer", back_populates="ledger_stats")
+
+    __table_args__ = (
+        Index("ix_ledger_stats_owner_due", "owner_id", "unpaid_amount", "customer_id"),
+        Index("ix_ledger_stats_owner_score", "owner_id", "score", "customer_id"),
+        Index("ix_ledger_stats_owner_activity", "owner_id", "last_activity", "customer_id"),
+    )
+
+
+class CommunityRiskIndex(Base):
+    # one row per (phone, area) summed over every shop's customers,
+    # refreshed whenever one of those customers or their ledger changes
+    __tablename__ = "community_risk_index"
+    phone = Column(String, primary_key=True)
+    area = Column(String, primary_key=True, index=True)
+    name = Column(String)
+    report_count = Column(Integer, default=0)
+    score_sum = Column(Integer, default=0)  # average = score_sum / report_count
+    total_due = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ShopLedgerVersion(Base):
+    # bumped on every ledger write, used to key cached analytics per shop
+    __tablename__ = "shop_ledger_versions"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=0)
+
+
+class AIJob(Base):
+    # LLM work done outside the request cycle (see services/jobs.py)
+    __tablename__ = "ai_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)  # "cashflow_insight" or "reminder_message"
+    dedupe_key = Column(String, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    payload = Column(Text)  # JSON
+    status = Column(String, default="pending", index=True)  # pending, running, done, failed
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)  # finished jobs are deleted after this
+
+
+class LedgerImport(Base):
+    # one bulk ledger upload, resumable from rows_done (see services/ledger_import.py)
+    __tablename__ = "ledger_imports"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(String, default="running")  # running, interrupted, failed, done
+    rows_done = Column(Integer, default=0)  # input rows committed so far, rows with errors included
+    customers_created = Column(Integer, default=0)
+    transactions_created = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(Text, default="[]")  # JSON list of {"row", "error"}, capped
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,181 @@
+# Opt-in request profiling. When it's on, every response carries a Server-Timing
+# header (wall time, SQL statements and their time, LLM time), which shows up
+# in the browser's network tab. Each request is also logged as one JSON line on
+# the "app.profiling" logger. Requests slower than PROFILING_SLOW_MS are logged
+# as a warning instead, with the statements they ran, slowest first.
+#
+#   PROFILING                  set to 1 to turn it on, default off
+#   PROFILING_SLOW_MS          slow-request threshold in milliseconds, default 1000
+#   PROFILING_SLOW_STATEMENTS  statements kept per request for that log, default 20
+#
+# Server-Timing goes out with the response headers, so for streamed responses
+# it only covers the time until the first byte; the log line covers the whole
+# stream. count_queries() and assert_max_queries() work whether profiling is on
+# or not; benchmarks/query_counts.py uses them to catch N+1 loads.
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from dotenv import load_dotenv
+from app.database import POOLS
+
+load_dotenv()
+
+PROFILING = os.getenv("PROFILING", "0") == "1"
+SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", "1000"))
+SLOW_STATEMENTS = int(os.getenv("PROFILING_SLOW_STATEMENTS", "20"))
+
+logger = logging.getLogger("app.profiling")
+
+# the profile of the request being handled; sync endpoints and dependencies run
+# in the threadpool with a copy of the request's context, so they see it too
+_current = contextvars.ContextVar("profile", default=None)
+_sequence = itertools.count()  # tie-breaker, statements never get compared
+# every engine, replicas included; events go on the sync engine underneath an async one
+ENGINES = tuple(POOLS.values())
+
+
+class Profile:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.slowest = []  # heap of (seconds, n, statement), the SLOW_STATEMENTS slowest
+
+    def add_statement(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        entry = (seconds, next(_sequence), statement)
+        if len(self.slowest) < SLOW_STATEMENTS:
+            heapq.heappush(self.slowest, entry)
+        elif SLOW_STATEMENTS:
+            heapq.heappushpop(self.slowest, entry)
+
+    def server_timing(self, seconds):
+        return (f'app;dur={seconds * 1000:.1f}, '
+                f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries", '
+                f'llm;dur={self.llm_seconds * 1000:.1f};desc="{self.llm_calls} calls"')
+
+
+def record_llm(seconds):
+    """Count an LLM call against the current request, if it's being profiled."""
+    profile = _current.get()
+    if profile is not None:
+        profile.llm_calls += 1
+        profile.llm_seconds += seconds
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._profiling_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    start = getattr(context, "_profiling_start", None)
+    if profile is not None and start is not None:
+        profile.add_statement(statement, time.perf_counter() - start)
+
+
+def _log(scope, status, profile, seconds):
+    route = scope.get("route")
+    line = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(route, "path", None),
+        "status": status,
+        "ms": round(seconds * 1000, 1),
+        "sql_queries": profile.sql_count,
+        "sql_ms": round(profile.sql_seconds * 1000, 1),
+        "llm_calls": profile.llm_calls,
+        "llm_ms": round(profile.llm_seconds * 1000, 1),
+    }
+    if seconds * 1000 < SLOW_MS:
+        logger.info(json.dumps(line))
+        return
+    line["slow"] = True
+    line["statements"] = [
+        {"ms": round(s * 1000, 1), "sql": " ".join(statement.split())[:500]}
+        for s, _, statement in sorted(profile.slowest, reverse=True)
+    ]
+    logger.warning(json.dumps(line))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware, so streamed responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = Profile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = profile.server_timing(time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _log(scope, status, profile, time.perf_counter() - start)
+
+
+def install(app):
+    """Wire profiling into the app if PROFILING is on."""
+    if not PROFILING:
+        return
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    for target in ENGINES:
+        event.listen(target, "before_cursor_execute", _before_execute)
+        event.listen(target, "after_cursor_execute", _after_execute)
+    app.add_middleware(ProfilingMiddleware)
+
+
+@contextmanager
+def count_queries():
+    """Collect every statement run on either engine, from any thread, while inside."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for target in ENGINES:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in ENGINES:
+            event.remove(target, "before_cursor_execute", record)
+
+
+@contextmanager
+def assert_max_queries(limit, label="block"):
+    """Raise AssertionError, listing the statements, if more than limit run inside."""
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > limit:
+        listing = "\n".join(f"  {n + 1}. {' '.join(s.split())[:200]}" for n, s in enumerate(statements))
+        raise AssertionError(f"{label} ran {len(statements)} queries, budget is {limit}:\n{listing}")
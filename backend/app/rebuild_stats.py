@@ -0,0 +1,45 @@
+# Backfill / repair customer_ledger_stats from the transactions table,
+# then community_risk_index from those stats. Safe to run from cron as a periodic refresher.
+#   python -m app.rebuild_stats          rebuild every customer's stats row and the risk index
+#   python -m app.rebuild_stats --check  only report rows that don't match
+import sys
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.services.ledger import rebuild_ledger_stats, check_ledger_stats
+from app.services.community import rebuild_risk_index
+
+
+def rebuild():
+    db = SessionLocal()
+    try:
+        count = rebuild_ledger_stats(db)
+        db.commit()
+        print(f"✅ Rebuilt ledger stats for {count} customers.")
+        count = rebuild_risk_index(db)
+        db.commit()
+        print(f"✅ Rebuilt community risk index ({count} phone/area entries).")
+    finally:
+        db.close()
+
+
+def check():
+    db = SessionLocal()
+    try:
+        mismatches = check_ledger_stats(db)
+    finally:
+        db.close()
+
+    for m in mismatches:
+        print(f"❌ Customer {m['customer_id']}: expected {m['expected']}, found {m['actual']}")
+    if mismatches:
+        print(f"\n{len(mismatches)} customers out of sync — run `python -m app.rebuild_stats` to fix.")
+        return 1
+    print("✅ Ledger stats match the transactions table.")
+    return 0
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    if "--check" in sys.argv:
+        sys.exit(check())
+    rebuild()
@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models
-from app.routers.auth import get_current_user
-from app.services.aitbaar_score import calculate_score
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db, run_in_session
+from app import models, schemas
+from app.routers.auth import get_principal
+from app.services.ledger import get_ledger_summaries, get_ledger_summary, get_oldest_unpaid, summary_score
+from app.services.insights import (
+    delays_by_week_of_month, collections_by_month, collections_since, repayment_halves
+)
 from app.services.cashflow import calculate_cashflow
-from app.services.ai_agent import generate_whatsapp_message, generate_cashflow_insight
+from app.services.ai_agent import (
+    generate_whatsapp_message, stream_cashflow_insight, cashflow_fallback
+)
+from app.services import llm_providers, jobs
+from app.services.cache import analytics_cache, analytics_flights, llm_cache, llm_flights, shop_cache_key
 from pydantic import BaseModel
+from typing import List, Optional
 from datetime import datetime
-from collections import defaultdict
+import asyncio
+import json
+import os
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
@@ -16,105 +29,281 @@ class MessageRequest(BaseModel):
     customer_id: int
     language: str = "roman_urdu"
 
+class BatchMessageRequest(BaseModel):
+    customer_ids: Optional[List[int]] = None  # default: every customer with dues
+    language: str = "roman_urdu"
+
+# how many reminder messages a batch generates at the same time
+REMINDER_BATCH_CONCURRENCY = int(os.getenv("REMINDER_BATCH_CONCURRENCY", "5"))
+
 
 @router.get("/cashflow")
-def get_cashflow_insight(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_cashflow_insight(
+    db: AsyncSession = Depends(get_async_db),
+    read_db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customers = db.query(models.Customer).filter(
-        models.Customer.owner_id == current_user.id
-    ).all()
+    # the numbers are cached until the shop's ledger changes (or the TTL runs out).
+    # The AI insight is made by a background job, so this never waits on the model:
+    # it returns the insight for the current numbers if ready, otherwise the last
+    # one the shop got (or the static summary if it has none), plus the job id to
+    # poll at /ai/jobs/{id}. The numbers come from the replica; the job is queued
+    # on the primary
+    key, cashflow = await cashflow_numbers(read_db, current_user)
+    insight = await db.run_sync(queue_cashflow_insight, current_user, cashflow, key)
+    return {**cashflow, **insight}
+
+
+async def cashflow_numbers(db, current_user):
+    # (cache key, cashflow); the sync helpers get the AsyncSession's session through run_sync
+    key = await db.run_sync(lambda session: shop_cache_key("cashflow", session, current_user.id))
+    cashflow = analytics_cache.get(key)
+    if cashflow is None:
+        cashflow = await analytics_flights.do(key, lambda: build_analytics(key, build_cashflow, current_user))
+    return key, cashflow
+
+
+async def build_analytics(key, build, current_user):
+    # run once for identical requests in flight (see SingleFlight), on a thread with
+    # a read session of its own: the build is CPU work the event loop shouldn't wait
+    # on, and the callers' sessions can close before the shared work is done
+    return await run_in_session(lambda db: analytics_cache.set(key, build(db, current_user)), read=True)
+
+
+def queue_cashflow_insight(db, current_user, cashflow, key):
+    job = jobs.enqueue(db, "cashflow_insight", current_user.id,
+                       {"cashflow": cashflow, "shop_name": current_user.shop_name}, key)
+    if job.status == jobs.DONE:
+        return {"ai_insight": json.loads(job.result), "insight_status": "ready", "insight_job_id": job.id}
+    last = jobs.last_result(db, current_user.id, "cashflow_insight")
+    # jobs only store what a model wrote; the static summary is never saved as a result
+    return {
+        "ai_insight": last if last is not None else cashflow_fallback(cashflow),
+        "insight_status": "stale" if last is not None else "pending",
+        "insight_job_id": job.id
+    }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/cashflow/stream")
+async def stream_cashflow(
+    db: AsyncSession = Depends(get_async_db),
+    read_db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    """
+    Server-sent events version of /ai/cashflow: a "cashflow" event with the numbers
+    right away, then "token" events as the model writes the insight, then "done"
+    with the full text. If the model fails, "insight" carries the static summary
+    and replaces anything streamed so far.
+    """
+    key, cashflow = await cashflow_numbers(read_db, current_user)
+    ready = await db.run_sync(jobs.find_result, key)
+    owner_id, shop_name = current_user.id, current_user.shop_name
+
+    async def events():
+        yield _sse("cashflow", cashflow)
+        if ready is not None:
+            insight = ready
+            yield _sse("token", {"text": insight})
+        else:
+            parts = []
+            try:
+                async for text in stream_cashflow_insight(cashflow, shop_name):
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+                insight = "".join(parts).strip()
+            except Exception:
+                insight = cashflow_fallback(cashflow)
+                yield _sse("insight", {"text": insight})
+            else:
+                # /ai/cashflow picks this up instead of queueing the same insight again
+                await run_in_threadpool(jobs.save_result, "cashflow_insight", owner_id, key, insight)
+        yield _sse("done", {"ai_insight": insight})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: no keeps nginx from holding the events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def build_cashflow(db, current_user):
+    summaries = get_ledger_summaries(db, models.Customer.owner_id == current_user.id)
+    oldest_unpaid = get_oldest_unpaid(db, current_user.id)
 
     customers_data = []
-    for c in customers:
-        score = calculate_score(c.transactions)
+    for c, summary in summaries:
         customers_data.append({
             "id": c.id,
             "name": c.name,
-            "aitbaar_score": score,
-            "transactions": c.transactions
+            "aitbaar_score": summary_score(summary),
+            "oldest_unpaid": oldest_unpaid.get(c.id),
+            **summary
         })
 
-    cashflow = calculate_cashflow(customers_data)
+    return calculate_cashflow(customers_data)
 
-    try:
-        insight = generate_cashflow_insight(cashflow, current_user.shop_name)
-    except Exception as e:
-        insight = f"AI insight unavailable right now. Total outstanding: Rs.{cashflow['total_outstanding']:,.0f}, at-risk: Rs.{cashflow['at_risk_amount']:,.0f}."
 
-    return {**cashflow, "ai_insight": insight}
+async def load_customer_due(db, customer_id, owner_id):
+    # (customer, total_due) or (None, None) if the customer isn't in this shop
+    customer = await db.scalar(select(models.Customer).where(
+        models.Customer.id == customer_id,
+        models.Customer.owner_id == owner_id
+    ).limit(1))
+    if not customer:
+        return None, None
+    return customer, (await db.run_sync(get_ledger_summary, customer.id))["total_due"]
 
 
 @router.post("/message")
-def get_whatsapp_message(
+async def get_whatsapp_message(
     request: MessageRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customer = db.query(models.Customer).filter(
-        models.Customer.id == request.customer_id,
-        models.Customer.owner_id == current_user.id
-    ).first()
+    customer, total_due = await load_customer_due(db, request.customer_id, current_user.id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    message = await reminder_message(customer.name, total_due, current_user.shop_name, request.language)
+    return {"customer_name": customer.name, "amount_due": total_due, "message": message}
 
-    unpaid = [t for t in customer.transactions if not t.is_repaid]
-    total_due = sum(t.amount for t in unpaid)
 
+async def reminder_message(customer_name, total_due, shop_name, language):
     try:
-        message = generate_whatsapp_message(
-            customer_name=customer.name,
+        return await generate_whatsapp_message(
+            customer_name=customer_name,
             amount_due=total_due,
-            shop_name=current_user.shop_name,
-            language=request.language
+            shop_name=shop_name,
+            language=language
         )
     except Exception as e:
-        message = f"Assalam o Alaikum {customer.name} bhai, aap ki taraf se Rs.{total_due:,.0f} baaki hain. Meherbani farma ke jald ada kar dein. Shukriya — {current_user.shop_name}"
+        return f"Assalam o Alaikum {customer_name} bhai, aap ki taraf se Rs.{total_due:,.0f} baaki hain. Meherbani farma ke jald ada kar dein. Shukriya — {shop_name}"
+
+
+def load_batch_targets(db, owner_id, customer_ids):
+    # [(id, name, total_due)] — the given customers, or everyone with dues
+    criteria = [models.Customer.owner_id == owner_id]
+    if customer_ids is not None:
+        criteria.append(models.Customer.id.in_(customer_ids))
+    else:
+        criteria.append(models.CustomerLedgerStats.unpaid_amount > 0)
+    return [
+        (c.id, c.name, summary["total_due"])
+        for c, summary in get_ledger_summaries(db, *criteria)
+    ]
+
+
+@router.post("/messages/batch")
+async def get_whatsapp_messages_batch(
+    request: BatchMessageRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    targets = await db.run_sync(load_batch_targets, current_user.id, request.customer_ids)
+    shop_name = current_user.shop_name
+    limit = asyncio.Semaphore(REMINDER_BATCH_CONCURRENCY)
+
+    async def generate(customer_id, name, total_due):
+        async with limit:
+            message = await reminder_message(name, total_due, shop_name, request.language)
+        return {"customer_id": customer_id, "customer_name": name, "amount_due": total_due, "message": message}
+
+    async def stream():
+        # one JSON line per customer, in the order the messages finish
+        tasks = [asyncio.ensure_future(generate(*t)) for t in targets]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(len(targets))}
+    )
 
-    return {"customer_name": customer.name, "amount_due": total_due, "message": message}
+
+@router.post("/message/job")
+async def queue_whatsapp_message(
+    request: MessageRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    # like /ai/message, but returns a job to poll at /ai/jobs/{id} instead of waiting
+    customer, total_due = await load_customer_due(db, request.customer_id, current_user.id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    payload = {
+        "customer_name": customer.name,
+        "amount_due": total_due,
+        "shop_name": current_user.shop_name,
+        "language": request.language
+    }
+    key = f"reminder:{current_user.id}:{customer.id}:{request.language}:{total_due}"
+    job = await db.run_sync(jobs.enqueue, "reminder_message", current_user.id, payload, key)
+    return jobs.job_view(job)
+
+
+@router.get("/jobs/stats")
+async def get_job_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    return await db.run_sync(jobs.stats)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    job = await db.run_sync(jobs.get_job, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.job_view(job)
 
 
 @router.get("/intelligence")
-def get_business_intelligence(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_business_intelligence(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customers = db.query(models.Customer).filter(
-        models.Customer.owner_id == current_user.id
-    ).all()
-
-    # flatten all transactions with customer info attached
-    all_transactions = []
-    for c in customers:
-        for t in c.transactions:
-            all_transactions.append({
-                "customer_id": c.id,
-                "customer_name": c.name,
-                "amount": t.amount,
-                "type": t.type,
-                "date_given": t.date_given,
-                "date_repaid": t.date_repaid,
-                "is_repaid": t.is_repaid
-            })
+    key = await db.run_sync(lambda session: shop_cache_key("intelligence", session, current_user.id))
+    result = analytics_cache.get(key)
+    if result is None:
+        result = await analytics_flights.do(
+            key, lambda: build_analytics(key, build_business_intelligence, current_user))
+    return result
+
+
+def build_business_intelligence(db, current_user):
+    summaries = get_ledger_summaries(db, models.Customer.owner_id == current_user.id)
+    customers = [c for c, _ in summaries]
 
     # 1. Payment velocity by week of month
     # Week 1 is usually salary week so customers pay fast
     # Week 3 is usually when money gets tight
-    week_delays = defaultdict(list)
-    for t in all_transactions:
-        if t["is_repaid"] and t["date_repaid"] and t["date_given"]:
-            week_num = min(4, (t["date_given"].day - 1) // 7 + 1)
-            delay = (t["date_repaid"] - t["date_given"]).days
-            week_delays[week_num].append(delay)
+    week_delays = delays_by_week_of_month(db, current_user.id)
 
     week_labels = {1: "Week 1", 2: "Week 2", 3: "Week 3", 4: "Week 4"}
     payment_by_week = []
     for week in [1, 2, 3, 4]:
-        delays = week_delays.get(week, [])
-        avg = round(sum(delays) / len(delays), 1) if delays else None
+        delay_sum, count = week_delays.get(week, (0, 0))
+        avg = round(delay_sum / count, 1) if count else None
         payment_by_week.append({
             "week": week_labels[week],
             "avgDays": avg,
-            "transactions": len(delays)
+            "transactions": count
         })
 
     filled = [w for w in payment_by_week if w["avgDays"] is not None]
@@ -122,51 +311,40 @@ def get_business_intelligence(
     best_week = min(filled, key=lambda x: x["avgDays"]) if filled else None
 
     # 2. Monthly collection pattern — which months have bad collections historically
-    monthly_data = defaultdict(lambda: {"total": 0, "collected": 0, "count": 0})
-    for t in all_transactions:
-        if t["date_given"]:
-            month_key = t["date_given"].strftime("%b")
-            monthly_data[month_key]["total"] += t["amount"]
-            monthly_data[month_key]["count"] += 1
-            if t["is_repaid"]:
-                monthly_data[month_key]["collected"] += t["amount"]
+    monthly_data = collections_by_month(db, current_user.id)
 
     month_order = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
     monthly_pattern = []
-    for month in month_order:
-        if month in monthly_data:
-            d = monthly_data[month]
-            rate = round((d["collected"] / d["total"]) * 100) if d["total"] > 0 else 0
+    for month_num, month in enumerate(month_order, start=1):
+        if month_num in monthly_data:
+            total, collected, count = monthly_data[month_num]
+            rate = round((collected / total) * 100) if total > 0 else 0
             monthly_pattern.append({
                 "month": month,
                 "collectionRate": rate,
-                "totalAmount": d["total"],
-                "collectedAmount": d["collected"],
-                "transactions": d["count"]
+                "totalAmount": total,
+                "collectedAmount": collected,
+                "transactions": count
             })
 
     danger_months = [m for m in monthly_pattern if m["collectionRate"] < 60]
 
     # 3. Customer trend — compare first half vs second half of repayment history
     # if someone is paying slower recently, catch it before they default completely
+    halves = repayment_halves(db, current_user.id)
     customer_trends = []
-    for c in customers:
-        paid = sorted(
-            [t for t in c.transactions if t.is_repaid and t.date_repaid and t.date_given],
-            key=lambda t: t.date_given
-        )
-        score = calculate_score(c.transactions)
-        total_due = sum(t.amount for t in c.transactions if not t.is_repaid)
+    for c, summary in summaries:
+        paid_count, early_sum, recent_sum = halves.get(c.id, (0, 0, 0))
+        score = summary_score(summary)
+        total_due = summary["total_due"]
 
-        if len(paid) < 4:
+        if paid_count < 4:
             trend = "insufficient_data"
             trend_label = "New Customer"
         else:
-            half = len(paid) // 2
-            early = paid[:half]
-            recent = paid[half:]
-            early_avg = sum((t.date_repaid - t.date_given).days for t in early) / len(early)
-            recent_avg = sum((t.date_repaid - t.date_given).days for t in recent) / len(recent)
+            half = paid_count // 2
+            early_avg = early_sum / half
+            recent_avg = recent_sum / (paid_count - half)
 
             if recent_avg > early_avg * 1.5:
                 trend = "deteriorating"
@@ -222,23 +400,20 @@ def get_business_intelligence(
             }
 
     # 5. Cash flow history for the last 6 months
-    cashflow_history = []
+    months = []
     for i in range(5, -1, -1):
         month_offset = today.month - i
         year = today.year
         if month_offset <= 0:
             month_offset += 12
             year -= 1
-        label = datetime(year, month_offset, 1).strftime("%b")
-
-        month_txns = [
-            t for t in all_transactions
-            if t["date_given"] and
-            t["date_given"].month == month_offset and
-            t["date_given"].year == year
-        ]
-        collected = sum(t["amount"] for t in month_txns if t["is_repaid"])
-        outstanding = sum(t["amount"] for t in month_txns if not t["is_repaid"])
+        months.append((year, month_offset))
+
+    history = collections_since(db, current_user.id, datetime(*months[0], 1))
+    cashflow_history = []
+    for year, month in months:
+        label = datetime(year, month, 1).strftime("%b")
+        collected, outstanding = history.get((year, month), (0, 0))
         cashflow_history.append({"month": label, "collected": collected, "outstanding": outstanding})
 
     return {
@@ -255,3 +430,18 @@ def get_business_intelligence(
         "deteriorating_count": len([c for c in customer_trends if c["trend"] == "deteriorating"]),
         "improving_count": len([c for c in customer_trends if c["trend"] == "improving"])
     }
+
+
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: schemas.Principal = Depends(get_principal)):
+    return {
+        "analytics": analytics_cache.stats(),
+        "llm": llm_cache.stats(),
+        "coalescing": {"analytics": analytics_flights.stats(), "llm": llm_flights.stats()}
+    }
+
+
+@router.get("/providers")
+async def get_provider_status(current_user: schemas.Principal = Depends(get_principal)):
+    # circuit breaker state, failures by type and latency histogram per AI provider
+    return llm_providers.status()
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, request_user_id
 from app import models, schemas
-from passlib.context import CryptContext
+from app.services.cache import MemoryBackend
+from app.metrics import record_cache
+from app.services.passwords import (
+    hash_password, hash_password_async, verify_password_async, PasswordPoolBusy
+)
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -17,14 +22,22 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-security = HTTPBearer()
+# Principals of recently seen users, so authenticated requests don't need a
+# users query each time.
+#
+#   AUTH_CACHE_SIZE          users kept per process, default 10000
+#   AUTH_CACHE_TTL           seconds, default 300 (0 = off). Also how long another worker
+#                            can keep seeing a user's old name/shop after it changes
+#   AUTH_TRUST_TOKEN_CLAIMS  1 = on a cache miss, build the principal from the claims in
+#                            the token instead of querying; default 0
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "0") == "1"
+CLAIMS = ("name", "shop_name", "city")
 
-def hash_password(password):
-    return pwd_context.hash(password)
+principal_cache = MemoryBackend(int(os.getenv("AUTH_CACHE_SIZE", "10000")))
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+security = HTTPBearer()
 
 def create_token(data: dict):
     to_encode = data.copy()
@@ -32,27 +45,72 @@ def create_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    token = credentials.credentials
+def _token_payload(credentials):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("sub") is None:
             raise HTTPException(status_code=401, detail="Invalid token")
     except JWTError:
         raise HTTPException(status_code=401, detail="Token expired or invalid")
-    
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+    return payload
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # the full ORM user — only for endpoints that need more than get_principal gives
+    payload = _token_payload(credentials)
+    request_user_id.set(int(payload["sub"]))
+    user = await db.scalar(select(models.User).where(models.User.id == int(payload["sub"])).limit(1))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+async def get_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.Principal:
+    payload = _token_payload(credentials)
+    user_id = int(payload["sub"])
+    request_user_id.set(user_id)  # for the read routing in app.database
+    principal = principal_cache.get(user_id)
+    record_cache("principal", "miss" if principal is None else "hit")
+    if principal is not None:
+        return principal
+
+    if TRUST_TOKEN_CLAIMS and all(k in payload for k in CLAIMS):
+        principal = schemas.Principal(id=user_id, **{k: payload[k] for k in CLAIMS})
+    else:
+        user = await db.scalar(select(models.User).where(models.User.id == user_id).limit(1))
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal = principal_for(user)
+    if PRINCIPAL_CACHE_TTL > 0:
+        principal_cache.set(user_id, principal, PRINCIPAL_CACHE_TTL)
+    return principal
+
+def principal_for(user):
+    return schemas.Principal(id=user.id, **{k: getattr(user, k) for k in CLAIMS})
+
+def invalidate_principal(user_id):
+    # call after changing or deleting a user row (only clears this process's cache)
+    principal_cache.delete(user_id)
+
+async def _password_work(coro):
+    # bcrypt runs in the password process pool; when that is saturated, shed load
+    try:
+        return await coro
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Too many logins right now, please try again",
+                            headers={"Retry-After": "1"})
+
+async def _find_user(db, email):
+    return await db.scalar(select(models.User).where(models.User.email == email).limit(1))
+
 @router.post("/register")
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.email == user.email).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # hashing runs in the password pool
+    existing = await _find_user(db, user.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     new_user = models.User(
@@ -60,32 +118,38 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         shop_name=user.shop_name,
         email=user.email,
         city=user.city,
-        hashed_password=hash_password(user.password)
+        hashed_password=await _password_work(hash_password_async(user.password))
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"message": "Account created successfully"}
 
 @router.post("/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+async def login(user: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = await _find_user(db, user.email)
+    if not db_user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    token = create_token({"sub": str(db_user.id)})
-    return {
+    matches, new_hash = await _password_work(verify_password_async(user.password, db_user.hashed_password))
+    if not matches:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    # name/shop/city ride along as claims (see AUTH_TRUST_TOKEN_CLAIMS)
+    claims = {k: getattr(db_user, k) for k in CLAIMS}
+    token = create_token({"sub": str(db_user.id), **claims})
+    response = {
         "access_token": token,
         "token_type": "bearer",
-        "user": {
-            "id": db_user.id,
-            "name": db_user.name,
-            "shop_name": db_user.shop_name,
-            "city": db_user.city
-        }
+        "user": {"id": db_user.id, **claims}
     }
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made — store it at the new cost
+        db_user.hashed_password = new_hash
+        await db.commit()
+        invalidate_principal(db_user.id)
+    return response
 
 @router.get("/me")
-def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: models.User = Depends(get_current_user)):
     return {
         "id": current_user.id,
         "name": current_user.name,
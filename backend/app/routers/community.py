@@ -1,54 +1,39 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models
-from app.routers.auth import get_current_user
-from app.services.aitbaar_score import calculate_score
-from collections import defaultdict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_read_db
+from app import models, schemas
+from app.routers.auth import get_principal
+from app.services.community import get_area_risks
 
 router = APIRouter(prefix="/community", tags=["community"])
 
 @router.get("/risk")
-def get_community_risk(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_community_risk(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
     # Get current shopkeeper's area
-    current_customers = db.query(models.Customer).filter(
+    my_areas = set(await db.scalars(select(models.Customer.area).where(
         models.Customer.owner_id == current_user.id
-    ).all()
+    ).distinct()))
 
-    my_areas = set(c.area for c in current_customers)
-
-    # Find all customers in same areas across ALL shopkeepers
-    all_customers_in_area = db.query(models.Customer).filter(
-        models.Customer.area.in_(my_areas),
-        models.Customer.owner_id != current_user.id  # exclude own customers
-    ).all()
-
-    # Group by phone number (same person across shops)
-    phone_map = defaultdict(list)
-    for c in all_customers_in_area:
-        score = calculate_score(c.transactions)
-        phone_map[c.phone].append({
-            "name": c.name,
-            "area": c.area,
-            "aitbaar_score": score,
-            "total_due": sum(t.amount for t in c.transactions if not t.is_repaid)
-        })
+    # Same phone across ALL shopkeepers in those areas, read from the risk index
+    # with the current shopkeeper's own customers excluded
+    area_risks = await db.run_sync(get_area_risks, my_areas, exclude_owner_id=current_user.id)
 
     # Flag customers reported by 2+ shops with low scores
     community_risks = []
-    for phone, reports in phone_map.items():
-        avg_score = sum(r["aitbaar_score"] for r in reports) / len(reports)
-        if len(reports) >= 2 and avg_score < 50:
+    for r in area_risks:
+        avg_score = r["score_sum"] / r["report_count"]
+        if avg_score < 50:
             community_risks.append({
-                "phone": phone,
-                "name": reports[0]["name"],
-                "area": reports[0]["area"],
-                "reported_by_shops": len(reports),
+                "phone": r["phone"],
+                "name": r["name"],
+                "area": r["area"],
+                "reported_by_shops": r["report_count"],
                 "average_aitbaar_score": round(avg_score),
-                "total_due_across_shops": sum(r["total_due"] for r in reports),
+                "total_due_across_shops": r["total_due"],
                 "risk_level": "High" if avg_score < 30 else "Medium"
             })
 
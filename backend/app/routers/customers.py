@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models
-from app.routers.auth import get_current_user
-from app.services.aitbaar_score import calculate_score
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import DateTime, and_, delete, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.database import get_async_db, get_async_read_db
+from app import models, schemas
+from app.routers.auth import get_principal
+from app.services.ledger import (
+    get_ledger_summary, summary_score, overdue_criterion,
+    create_ledger_stats, delete_ledger_stats
+)
+from app.services.community import refresh_risk_entry
+from app.services.cache import bump_ledger_version
 from pydantic import BaseModel
+from datetime import datetime
 from typing import Optional
+import base64
+import json
 
 router = APIRouter(prefix="/customers", tags=["customers"])
 
@@ -14,39 +24,150 @@ class CustomerCreate(BaseModel):
     phone: str
     area: Optional[str] = None  # was missing — caused area to never save
 
+
+# sort: (column, tie-breaker, default order) — each pair is the tail of an
+# (owner_id, column, id) index, so a page is a short index range scan
+SORTS = {
+    "total_due": (models.CustomerLedgerStats.unpaid_amount, models.CustomerLedgerStats.customer_id, "desc"),
+    "score": (models.CustomerLedgerStats.score, models.CustomerLedgerStats.customer_id, "desc"),
+    "name": (models.Customer.name, models.Customer.id, "asc"),
+    "last_activity": (models.CustomerLedgerStats.last_activity, models.CustomerLedgerStats.customer_id, "desc"),
+}
+MAX_PAGE = 200
+
+
+def _encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, expected_head):
+    # cursors carry what they were made for, so one can't be replayed against another sort
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or values[:-2] != expected_head or len(values) != len(expected_head) + 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values[-2:]
+
+
+def _after(column, tie, order, nulls_after, cursor, head):
+    # keyset condition: rows strictly after the cursor's (value, id) in this order.
+    # NULL values (no name, no activity) sort where the dialect puts them, as in the
+    # index; nulls_after says whether that is after every value in this order
+    value, last_id = _decode_cursor(cursor, head)
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if value is None:
+        # the page ended among the NULLs, which only have the id left to order by
+        among_nulls = and_(column.is_(None), tie < last_id if order == "desc" else tie > last_id)
+        return among_nulls if nulls_after else or_(among_nulls, column.isnot(None))
+    if isinstance(column.type, DateTime):
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if order == "desc":
+        after = tuple_(column, tie) < tuple_(value, last_id)
+    else:
+        after = tuple_(column, tie) > tuple_(value, last_id)
+    return or_(after, column.is_(None)) if nulls_after else after
+
+
+async def _owned_customer(db, customer_id, owner_id, *options):
+    customer = await db.scalar(select(models.Customer).where(
+        models.Customer.id == customer_id,
+        models.Customer.owner_id == owner_id
+    ).options(*options).limit(1))
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer
+
+
 @router.get("/")
-def get_customers(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_customers(
+    response: Response,
+    sort: str = "total_due",
+    order: Optional[str] = None,
+    area: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    has_dues: Optional[bool] = None,
+    overdue: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customers = db.query(models.Customer).filter(
-        models.Customer.owner_id == current_user.id
-    ).all()
-
-    result = []
-    for c in customers:
-        transactions = c.transactions
-        score = calculate_score(transactions)
-        total_due = sum(t.amount for t in transactions if not t.is_repaid)
-        result.append({
-            "id": c.id,
-            "name": c.name,
-            "phone": c.phone,
-            "area": c.area,  # was missing
-            "aitbaar_score": score,
-            "total_due": total_due,
-            "total_transactions": len(transactions)
-        })
-
-    result.sort(key=lambda x: x["total_due"], reverse=True)
-    return result
+    """
+    The shop's customers with dues and Aitbaar score, filtered and sorted in SQL.
+    sort is total_due (default), score, name or last_activity; order asc/desc.
+    With limit, returns one page and the cursor for the next in the X-Next-Cursor
+    header (absent on the last page); without it, every matching customer.
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+    column, tie, default_order = SORTS[sort]
+    order = order or default_order
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+    # customers joined with their ledger stats — no per-customer transaction loads.
+    # Every customer has a stats row (created with it, or by app.migrate / rebuild_stats).
+    # The shop is filtered on the sort column's own table (both carry owner_id), so
+    # the planner walks that table's (owner_id, column, id) index and stops at limit.
+    c, s = models.Customer, models.CustomerLedgerStats
+    owner = c.owner_id if column.class_ is c else s.owner_id
+    query = select(c, s).join(s, s.customer_id == c.id).where(owner == current_user.id)
+    if area is not None:
+        query = query.where(c.area == area)
+    if min_score is not None:
+        query = query.where(s.score >= min_score)
+    if max_score is not None:
+        query = query.where(s.score <= max_score)
+    if has_dues is not None:
+        query = query.where(s.unpaid_amount > 0 if has_dues else s.unpaid_amount <= 0)
+    if overdue:
+        query = query.where(await db.run_sync(overdue_criterion, datetime.utcnow()))
+    if cursor:
+        # Postgres sorts NULLs above every value, SQLite below
+        nulls_after = (db.bind.dialect.name == "postgresql") == (order == "asc")
+        query = query.where(_after(column, tie, order, nulls_after, cursor, [sort, order]))
+
+    if order == "desc":
+        query = query.order_by(column.desc(), tie.desc())
+    else:
+        query = query.order_by(column.asc(), tie.asc())
+    if limit:
+        rows = (await db.execute(query.limit(limit + 1))).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_customer, last_stats = rows[-1]
+            value = getattr(last_customer if column.class_ is c else last_stats, column.key)
+            response.headers["X-Next-Cursor"] = _encode_cursor([sort, order, value, last_customer.id])
+    else:
+        rows = (await db.execute(query)).all()
+
+    return [
+        {
+            "id": customer.id,
+            "name": customer.name,
+            "phone": customer.phone,
+            "area": customer.area,  # was missing
+            "aitbaar_score": stats.score,
+            "total_due": stats.unpaid_amount,
+            "total_transactions": stats.total_count
+        }
+        for customer, stats in rows
+    ]
 
 
 @router.post("/")
-def add_customer(
+async def add_customer(
     customer: CustomerCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
     new = models.Customer(
         name=customer.name,
@@ -55,27 +176,69 @@ def add_customer(
         owner_id=current_user.id
     )
     db.add(new)
-    db.commit()
-    db.refresh(new)
+    await db.flush()
+    # the ledger services are sync; run_sync gives them the session underneath
+    await db.run_sync(create_ledger_stats, new.id, current_user.id)
+    await db.run_sync(refresh_risk_entry, new.phone, new.area)
+    await db.run_sync(bump_ledger_version, current_user.id)
+    await db.commit()
+    await db.refresh(new)
     return {"message": "Customer added", "id": new.id}
 
 
+async def _transaction_page(db, customer_id, limit, cursor=None, status=None):
+    # newest first, keyset on (date_given, id); returns (transactions, next cursor or None)
+    t = models.Transaction
+    query = select(t).where(t.customer_id == customer_id)
+    if status == "unpaid":
+        query = query.where(models.UNPAID)
+    elif status == "repaid":
+        query = query.where(t.is_repaid == True)
+    if cursor:
+        query = query.where(_after(t.date_given, t.id, "desc", cursor, ["transactions", status]))
+    rows = (await db.scalars(query.order_by(t.date_given.desc(), t.id.desc()).limit(limit + 1))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(["transactions", status, rows[-1].date_given, rows[-1].id])
+
+
+def _transaction_view(t):
+    return {
+        "id": t.id,
+        "amount": t.amount,
+        "type": t.type,
+        "date_given": t.date_given,
+        "date_repaid": t.date_repaid,
+        "is_repaid": t.is_repaid
+    }
+
+
 @router.get("/{customer_id}")
-def get_customer_detail(
+async def get_customer_detail(
     customer_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    response: Response,
+    transactions_limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customer = db.query(models.Customer).filter(
-        models.Customer.id == customer_id,
-        models.Customer.owner_id == current_user.id
-    ).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-
-    transactions = customer.transactions
-    score = calculate_score(transactions)
-    total_due = sum(t.amount for t in transactions if not t.is_repaid)
+    """
+    A customer with dues, score and transactions. With transactions_limit only the
+    newest ones are included, and X-Next-Cursor continues at /{id}/transactions.
+    """
+    if transactions_limit:
+        customer = await _owned_customer(db, customer_id, current_user.id)
+        transactions, next_cursor = await _transaction_page(db, customer.id, transactions_limit)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+    else:
+        # loaded up front: an AsyncSession can't lazy-load customer.transactions
+        customer = await _owned_customer(db, customer_id, current_user.id,
+                                         selectinload(models.Customer.transactions))
+        transactions = customer.transactions
+    summary = await db.run_sync(get_ledger_summary, customer.id)
+    score = summary_score(summary)
+    total_due = summary["total_due"]
 
     return {
         "id": customer.id,
@@ -84,37 +247,51 @@ def get_customer_detail(
         "area": customer.area,  # was missing
         "aitbaar_score": score,
         "total_due": total_due,
-        "transactions": [
-            {
-                "id": t.id,
-                "amount": t.amount,
-                "type": t.type,
-                "date_given": t.date_given,
-                "date_repaid": t.date_repaid,
-                "is_repaid": t.is_repaid
-            } for t in transactions
-        ]
+        "transactions": [_transaction_view(t) for t in transactions]
     }
 
 
+@router.get("/{customer_id}/transactions")
+async def get_customer_transactions(
+    customer_id: int,
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    """
+    A customer's transactions newest first, one page at a time; status is unpaid
+    or repaid to filter. The next page's cursor is in the X-Next-Cursor header.
+    """
+    if status not in (None, "unpaid", "repaid"):
+        raise HTTPException(status_code=400, detail="status must be unpaid or repaid")
+    customer = await _owned_customer(db, customer_id, current_user.id)
+
+    transactions, next_cursor = await _transaction_page(db, customer.id, limit, cursor, status)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_transaction_view(t) for t in transactions]
+
+
 @router.delete("/{customer_id}")
-def delete_customer(
+async def delete_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customer = db.query(models.Customer).filter(
-        models.Customer.id == customer_id,
-        models.Customer.owner_id == current_user.id
-    ).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    customer = await _owned_customer(db, customer_id, current_user.id)
 
     # Delete transactions first due to foreign key constraint
-    db.query(models.Transaction).filter(
+    await db.execute(delete(models.Transaction).where(
         models.Transaction.customer_id == customer_id
-    ).delete()
+    ))
+    await db.run_sync(delete_ledger_stats, customer_id)
 
-    db.delete(customer)
-    db.commit()
+    await db.delete(customer)
+    await db.flush()
+    await db.run_sync(refresh_risk_entry, customer.phone, customer.area)
+    await db.run_sync(bump_ledger_version, current_user.id)
+    await db.commit()
     return {"message": "Customer deleted successfully"}
\ No newline at end of file
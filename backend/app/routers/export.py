@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app import schemas
+from app.routers.auth import get_principal
+from app.services.export import export_rows, gzipped
+from datetime import date
+from typing import List, Optional
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+
+@router.get("/ledger")
+async def export_ledger(
+    request: Request,
+    format: str = "csv",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    customer_id: Optional[List[int]] = Query(None),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    """
+    The shop's whole ledger, streamed: CSV (default) or NDJSON, gzipped when the
+    client accepts it. date_from/date_to (inclusive) filter on date_given;
+    customer_id can be repeated.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    body = export_rows(current_user.id, format, date_from, date_to, customer_id)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {
+        "Content-Disposition": f'attachment; filename="ledger.{format}"',
+        "Vary": "Accept-Encoding"
+    }
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.requests import ClientDisconnect
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, run_in_session
+from app import models, schemas
+from app.routers.auth import get_principal
+from app.services import ledger_import
+from typing import Optional
+import codecs
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+
+async def _lines(request):
+    # the request body as text lines, read as it arrives
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()  # drops the BOM Excel adds
+    pending = ""
+    async for data in request.stream():
+        pending += decoder.decode(data)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _records(request, format):
+    # one record per line, blank lines skipped; a CSV record whose quoted field is
+    # still open at the line break carries on to the next line
+    record = None
+    async for line in _lines(request):
+        if record is not None:
+            record += "\n" + line
+            # the line starts inside the open field: checking it alone is the same as
+            # checking the whole record, and stays linear when a quote never closes
+            still_open = ledger_import.unclosed_quote('"' + line)
+        elif line.strip():
+            record = line
+            still_open = format == "csv" and ledger_import.unclosed_quote(line)
+        else:
+            continue
+        if not still_open:
+            yield record
+            record = None
+    if record is not None:
+        yield record  # the quote never closed: reported as that row's error
+
+
+@router.post("/ledger")
+async def import_ledger(
+    request: Request,
+    format: str = "csv",
+    import_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    """
+    Stream a CSV or NDJSON ledger (see services/ledger_import.py for the fields).
+    To resume a broken upload, send the same file again with its import_id:
+    rows already committed are skipped.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    if import_id is None:
+        imp = await db.run_sync(ledger_import.create_import, current_user.id)
+    else:
+        imp = await db.run_sync(ledger_import.resume_import, import_id, current_user.id)
+        if imp is None:
+            raise HTTPException(status_code=409, detail="Import not found, already finished or still running")
+    import_id, skip = imp.id, imp.rows_done
+
+    header = None
+    row = 0
+    chunk = []
+    status = ledger_import.DONE
+    # validating chunks and rebuilding the stats at the end is CPU work, done on threads
+    try:
+        async for line in _records(request, format):
+            if format == "csv" and header is None:
+                header = ledger_import.parse_header(line)
+                continue
+            row += 1
+            if row <= skip:
+                continue
+            chunk.append(line)
+            if len(chunk) >= ledger_import.CHUNK_ROWS:
+                await run_in_session(ledger_import.import_chunk, import_id, row - len(chunk) + 1, chunk, header)
+                chunk = []
+        if chunk:
+            await run_in_session(ledger_import.import_chunk, import_id, row - len(chunk) + 1, chunk, header)
+    except ClientDisconnect:
+        status = ledger_import.INTERRUPTED
+    except Exception:
+        status = ledger_import.FAILED
+        raise
+    finally:
+        view = await run_in_session(
+            lambda session: ledger_import.import_view(ledger_import.finish_import(session, import_id, status)))
+    return view
+
+
+@router.get("/")
+async def list_imports(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    imports = await db.scalars(select(models.LedgerImport).where(
+        models.LedgerImport.owner_id == current_user.id
+    ).order_by(models.LedgerImport.id.desc()))
+    return [ledger_import.import_view(imp) for imp in imports]
+
+
+@router.get("/{import_id}")
+async def get_import(
+    import_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
+):
+    imp = await db.run_sync(ledger_import.get_import, import_id, current_user.id)
+    if not imp:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return ledger_import.import_view(imp)
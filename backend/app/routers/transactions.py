@@ -1,8 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models
-from app.routers.auth import get_current_user
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.database import get_async_db
+from app import models, schemas
+from app.routers.auth import get_principal
+from app.services.ledger import record_transaction, unrecord_transaction
+from app.services.community import refresh_risk_entry
+from app.services.cache import bump_ledger_version
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional
@@ -18,15 +24,15 @@ class MarkRepaid(BaseModel):
     transaction_id: int
 
 @router.post("/")
-def add_transaction(
+async def add_transaction(
     txn: TransactionCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    customer = db.query(models.Customer).filter(
+    customer = await db.scalar(select(models.Customer).where(
         models.Customer.id == txn.customer_id,
         models.Customer.owner_id == current_user.id
-    ).first()
+    ).limit(1))
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
@@ -38,22 +44,39 @@ def add_transaction(
         is_repaid=False
     )
     db.add(new_txn)
-    db.commit()
+    await db.run_sync(record_transaction, new_txn)
+    await db.run_sync(refresh_risk_entry, customer.phone, customer.area)
+    await db.run_sync(bump_ledger_version, current_user.id)
+    await db.commit()
     return {"message": "Transaction added"}
 
 @router.patch("/repaid/{transaction_id}")
-def mark_as_repaid(
+async def mark_as_repaid(
     transaction_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(get_principal)
 ):
-    txn = db.query(models.Transaction).filter(
+    # the customer comes in the same query: an AsyncSession can't lazy-load txn.customer
+    txn = await db.scalar(select(models.Transaction).where(
         models.Transaction.id == transaction_id
-    ).first()
+    ).options(joinedload(models.Transaction.customer)).limit(1))
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    txn.is_repaid = True
-    txn.date_repaid = datetime.utcnow()
-    db.commit()
-    return {"message": "Marked as repaid"}
\ No newline at end of file
+    # flipped only if it isn't repaid yet, so of two concurrent calls (a double click)
+    # one changes the row and the other finds nothing to do, as a repeat call does
+    now = datetime.utcnow()
+    t = models.Transaction
+    flipped = await db.execute(update(t).where(
+        t.id == transaction_id, t.is_repaid.isnot(True)
+    ).values(is_repaid=True, date_repaid=now).execution_options(synchronize_session=False))
+    if flipped.rowcount:
+        # take the old state out of the customer's stats and add the new one back
+        await db.run_sync(unrecord_transaction, txn)
+        set_committed_value(txn, "is_repaid", True)
+        set_committed_value(txn, "date_repaid", now)
+        await db.run_sync(record_transaction, txn)
+        await db.run_sync(refresh_risk_entry, txn.customer.phone, txn.customer.area)
+        await db.run_sync(bump_ledger_version, txn.customer.owner_id)
+    await db.commit()
+    return {"message": "Marked as repaid"}
@@ -9,4 +9,11 @@ class UserCreate(BaseModel):
 
 class UserLogin(BaseModel):
     email: str
-    password: str    
\ No newline at end of file
+    password: str
+
+class Principal(BaseModel):
+    # the authenticated user as most endpoints need it, without an ORM object
+    id: int
+    name: Optional[str] = None
+    shop_name: Optional[str] = None
+    city: Optional[str] = None
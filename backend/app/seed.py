@@ -1,11 +1,11 @@
 from app.database import SessionLocal
 from app import models
-from passlib.context import CryptContext
+from app.services.ledger import rebuild_ledger_stats
+from app.services.community import rebuild_risk_index
+from app.services.passwords import hash_password
 from datetime import datetime, timedelta
 import random
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 LAHORE_AREAS = ["Model Town", "Gulberg", "DHA", "Johar Town", "Bahria Town"]
 
 # Customers that appear across multiple shops (these will trigger risk flags)
@@ -86,7 +86,7 @@ def seed():
             shop_name=shopkeeper_data["shop_name"],
             email=shopkeeper_data["email"],
             city=shopkeeper_data["city"],
-            hashed_password=pwd_context.hash(shopkeeper_data["password"])
+            hashed_password=hash_password(shopkeeper_data["password"])
         )
         db.add(user)
         db.commit()
@@ -125,6 +125,12 @@ def seed():
             db.commit()
             print(f"   → Added customer: {customer.name} ({c_data['behavior']})")
 
+    # transactions were inserted directly, so build their ledger stats in one go
+    rebuild_ledger_stats(db)
+    db.commit()
+    rebuild_risk_index(db)
+    db.commit()
+
     print("\n✅ Seed complete — 3 shopkeepers, 15 customers, 120 transactions.")
     db.close()
 
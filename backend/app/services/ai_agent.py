@@ -1,25 +1,39 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Primary — GitHub Models (GPT-4o)
-github_client = OpenAI(
-    base_url="https://models.inference.ai.azure.com",
-    api_key=os.getenv("GITHUB_TOKEN")
-)
-
-# Fallback — Groq (Llama 3.1)
-try:
-    from groq import Groq
-    groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    GROQ_AVAILABLE = True
-except Exception:
-    GROQ_AVAILABLE = False
-
-
-def generate_whatsapp_message(customer_name, amount_due, shop_name, language="roman_urdu"):
+import time
+from app import profiling
+from app.metrics import LLM_FALLBACKS
+from app.services import llm_providers
+from app.services.cache import llm_cache, llm_flights, bucket_amount, LLM_MESSAGE_TTL, LLM_INSIGHT_TTL
+
+
+def _cache_key(max_tokens, cache_prompt):
+    models = "|".join(p.model for p in llm_providers.PROVIDERS)
+    return llm_cache.key(f"{models}|{max_tokens}", cache_prompt)
+
+
+async def _complete(prompt, max_tokens, cache_prompt, ttl):
+    """
+    Ask GitHub Models, hedged with Groq. Returns None if both fail.
+    Answers are cached under cache_prompt (the prompt with amounts bucketed), and
+    a call for a key that is already being asked waits for that answer.
+    """
+    key = _cache_key(max_tokens, cache_prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    return await llm_flights.do(key, lambda: _ask_model(prompt, max_tokens, key, ttl))
+
+
+async def _ask_model(prompt, max_tokens, key, ttl):
+    start = time.perf_counter()
+    text = await llm_providers.complete(prompt, max_tokens)
+    seconds = time.perf_counter() - start
+    profiling.record_llm(seconds)
+    if text is not None:
+        llm_cache.set(key, text, seconds, ttl)
+    return text
+
+
+def _whatsapp_prompt(customer_name, amount_due, shop_name, language):
     if language == "roman_urdu":
         lang_instruction = """Write ONLY in Roman Urdu (Urdu words written in English letters).
 Example style: 'Assalam o Alaikum Imran bhai, aap ki taraf se 1500 rupay baaki hain. Meherbani kar ke jald ada kar dein. Shukriya.'
@@ -27,7 +41,7 @@ Do NOT use Hindi words like 'kripaya' or 'dhanyawaad'. Use proper Pakistani Urdu
     else:
         lang_instruction = "Write in simple professional English."
 
-    prompt = f"""Generate a short WhatsApp payment reminder message.
+    return f"""Generate a short WhatsApp payment reminder message.
 Shop: {shop_name}
 Customer: {customer_name}
 Amount due: Rs. {amount_due}
@@ -40,68 +54,91 @@ Rules:
 - Do not use formal Hindi words
 - Return the message text only, no quotes around it"""
 
-    # Try GitHub Models first
-    try:
-        response = github_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"GitHub Models failed: {e}, falling back to Groq")
-
-    # Fallback to Groq
-    if GROQ_AVAILABLE:
-        try:
-            response = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=150
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Groq also failed: {e}")
+
+async def generate_whatsapp_message(customer_name, amount_due, shop_name, language="roman_urdu"):
+    prompt = _whatsapp_prompt(customer_name, amount_due, shop_name, language)
+    cache_prompt = _whatsapp_prompt(customer_name, bucket_amount(amount_due), shop_name, language)
+
+    message = await _complete(prompt, 150, cache_prompt, LLM_MESSAGE_TTL)
+    if message is not None:
+        return message
 
     # Last resort — hardcoded fallback
+    LLM_FALLBACKS.labels("message").inc()
     if language == "roman_urdu":
         return f"Assalam o Alaikum {customer_name} bhai, aap ki taraf se Rs. {amount_due:,.0f} baaki hain. Meherbani kar ke jald ada kar dein. Shukriya — {shop_name}"
     else:
         return f"Dear {customer_name}, this is a reminder that Rs. {amount_due:,.0f} is outstanding at {shop_name}. Kindly arrange payment at your earliest convenience. Thank you."
 
 
-def generate_cashflow_insight(cashflow_data, shop_name):
-    prompt = f"""You are a financial advisor for a small Pakistani shopkeeper.
+def _cashflow_prompt(total_outstanding, at_risk_amount, shortage_warning, customers_at_risk, shop_name):
+    return f"""You are a financial advisor for a small Pakistani shopkeeper.
 Shop: {shop_name}
-Total outstanding: Rs. {cashflow_data['total_outstanding']}
-At risk amount: Rs. {cashflow_data['at_risk_amount']}
-Shortage warning: {cashflow_data['shortage_warning']}
-Customers at risk: {len(cashflow_data['customers_at_risk'])}
+Total outstanding: Rs. {total_outstanding}
+At risk amount: Rs. {at_risk_amount}
+Shortage warning: {shortage_warning}
+Customers at risk: {customers_at_risk}
 
 Give 2-3 short practical action points in simple English.
 Under 80 words. Plain text only. No bullet points."""
 
-    # Try GitHub Models first
+
+def _cashflow_prompts(cashflow_data, shop_name):
+    # (prompt sent to the model, prompt used for the cache key)
+    prompt = _cashflow_prompt(
+        cashflow_data['total_outstanding'], cashflow_data['at_risk_amount'],
+        cashflow_data['shortage_warning'], len(cashflow_data['customers_at_risk']), shop_name
+    )
+    cache_prompt = _cashflow_prompt(
+        bucket_amount(cashflow_data['total_outstanding']), bucket_amount(cashflow_data['at_risk_amount']),
+        cashflow_data['shortage_warning'], len(cashflow_data['customers_at_risk']), shop_name
+    )
+    return prompt, cache_prompt
+
+
+def cashflow_fallback(cashflow_data):
+    LLM_FALLBACKS.labels("insight").inc()
+    return f"Total outstanding is Rs. {cashflow_data['total_outstanding']:,.0f} with Rs. {cashflow_data['at_risk_amount']:,.0f} at risk. Focus on collecting from high-risk customers this week."
+
+
+async def generate_cashflow_insight(cashflow_data, shop_name):
+    """
+    The model's insight for the cashflow numbers. Raises if no provider could
+    answer, so the job that asked fails instead of storing cashflow_fallback()
+    as the answer; responses put the fallback in themselves.
+    """
+    prompt, cache_prompt = _cashflow_prompts(cashflow_data, shop_name)
+
+    insight = await _complete(prompt, 200, cache_prompt, LLM_INSIGHT_TTL)
+    if insight is None:
+        raise RuntimeError("no AI provider answered")
+    return insight
+
+
+async def stream_cashflow_insight(cashflow_data, shop_name):
+    """
+    Yield the insight in chunks as the model writes it (a cached answer, or one
+    another caller is already waiting for, comes as one chunk).
+    Raises if no provider could answer — callers fall back to cashflow_fallback().
+    """
+    prompt, cache_prompt = _cashflow_prompts(cashflow_data, shop_name)
+    key = _cache_key(200, cache_prompt)
+    cached = llm_cache.get(key)
+    if cached is None:
+        # e.g. the job worker making the same insight for /ai/cashflow; streams themselves
+        # don't register, their chunks can't be shared with callers that arrive midway
+        joined = llm_flights.join(key)
+        cached = await joined if joined is not None else None
+    if cached is not None:
+        yield cached
+        return
+
+    start = time.perf_counter()
+    parts = []
     try:
-        response = github_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=200
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"GitHub Models failed: {e}, falling back to Groq")
-
-    # Fallback to Groq
-    if GROQ_AVAILABLE:
-        try:
-            response = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Groq also failed: {e}")
-
-    return f"Total outstanding is Rs. {cashflow_data['total_outstanding']:,.0f} with Rs. {cashflow_data['at_risk_amount']:,.0f} at risk. Focus on collecting from high-risk customers this week."
\ No newline at end of file
+        async for text in llm_providers.stream(prompt, 200):
+            parts.append(text)
+            yield text
+    finally:
+        profiling.record_llm(time.perf_counter() - start)
+    llm_cache.set(key, "".join(parts).strip(), time.perf_counter() - start, LLM_INSIGHT_TTL)
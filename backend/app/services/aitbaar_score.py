@@ -1,24 +1,32 @@
+import numpy as np
+
+
 def calculate_score(transactions):
     if not transactions:
         return 50  # neutral score for new customers
 
     total = len(transactions)
     repaid = [t for t in transactions if t.is_repaid]
-    unpaid = [t for t in transactions if not t.is_repaid]
-
-    if total == 0:
-        return 50
 
-    repayment_rate = len(repaid) / total
-
-    # Calculate average delay in days
+    # Calculate delay in days for every repaid transaction
     delays = []
     for t in repaid:
         if t.date_repaid and t.date_given:
             delay = (t.date_repaid - t.date_given).days
             delays.append(delay)
 
-    avg_delay = sum(delays) / len(delays) if delays else 30
+    return score_from_stats(total, len(repaid), sum(delays), len(delays))
+
+
+def score_from_stats(total, repaid_count, delay_sum, delay_count):
+    # Same formula as calculate_score, but from pre-aggregated ledger numbers
+    # so callers can get them from one grouped SQL query instead of loading rows
+    if total == 0:
+        return 50  # neutral score for new customers
+
+    repayment_rate = repaid_count / total
+
+    avg_delay = delay_sum / delay_count if delay_count else 30
 
     # Score formula
     score = (repayment_rate * 60)  # 60 points for repayment rate
@@ -31,4 +39,27 @@ def calculate_score(transactions):
     else:
         score += 0
 
-    return round(min(max(score, 0), 100))  # clamp between 0-100
\ No newline at end of file
+    return round(min(max(score, 0), 100))  # clamp between 0-100
+
+
+def scores_from_stats_batch(total, repaid_count, delay_sum, delay_count):
+    # score_from_stats for many customers at once — arguments are equal-length arrays
+    total = np.asarray(total, dtype=np.int64)
+    repaid_count = np.asarray(repaid_count, dtype=np.int64)
+    delay_sum = np.asarray(delay_sum, dtype=np.float64)
+    delay_count = np.asarray(delay_count, dtype=np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        repayment_rate = np.where(total > 0, repaid_count / np.maximum(total, 1), 0.0)
+        avg_delay = np.where(delay_count > 0, delay_sum / np.maximum(delay_count, 1), 30.0)
+
+    score = repayment_rate * 60
+    score += np.select(
+        [avg_delay <= 7, avg_delay <= 14, avg_delay <= 30],
+        [40, 30, 15],
+        default=0
+    )
+    # np.rint rounds half to even, same as round()
+    score = np.rint(np.clip(score, 0, 100)).astype(np.int64)
+    return np.where(total > 0, score, 50)  # neutral score for new customers
+
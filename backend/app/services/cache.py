@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+from dotenv import load_dotenv
+from sqlalchemy.dialects import postgresql, sqlite
+from app import models
+from app.metrics import record_cache, record_flight
+
+load_dotenv()
+
+# Per-shop cache for the analytics endpoints (/ai/cashflow, /ai/intelligence).
+# Keys include the shop's ledger version, so any write to the ledger makes the
+# old entries unreachable; the TTL covers results that depend on today's date.
+#
+#   ANALYTICS_CACHE_BACKEND  memory (default, per worker) or sqlite (shared by workers)
+#   ANALYTICS_CACHE_PATH     sqlite file, default analytics_cache.db
+#   ANALYTICS_CACHE_SIZE     max entries before LRU eviction, default 1000
+#   ANALYTICS_CACHE_TTL      seconds, default 900
+
+
+def _json_default(value):
+    # what the database drivers hand back besides JSON types: Postgres sums are Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} can't be cached")
+
+
+def _plain(value):
+    """value as it comes back from JSON, which is how every backend returns it."""
+    return json.loads(json.dumps(value, default=_json_default))
+
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        # returns how many entries were evicted to make room
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+            self.entries.move_to_end(key)
+            evicted = 0
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteBackend:
+    # a local file every uvicorn worker on the box can read and write
+    def __init__(self, max_entries, path):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_last_used ON cache_entries (last_used)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE cache_entries SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=_json_default), now + ttl, now)
+            )
+            evicted = self.conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self.conn.commit()
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache_entries")
+            self.conn.commit()
+
+
+class AnalyticsCache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            record_cache("analytics", "miss")
+        else:
+            self.hits += 1
+            record_cache("analytics", "hit")
+        return value
+
+    def set(self, key, value):
+        # stored and returned as plain JSON types, so the caller that built it gets what
+        # later hits get from either backend (floats, str keys, lists) and not driver types
+        value = _plain(value)
+        self.evictions += self.backend.set(key, value, self.ttl)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+def _make_cache():
+    max_entries = int(os.getenv("ANALYTICS_CACHE_SIZE", "1000"))
+    ttl = int(os.getenv("ANALYTICS_CACHE_TTL", "900"))
+    if os.getenv("ANALYTICS_CACHE_BACKEND", "memory") == "sqlite":
+        path = os.getenv("ANALYTICS_CACHE_PATH", "analytics_cache.db")
+        return AnalyticsCache(SQLiteBackend(max_entries, path), ttl)
+    return AnalyticsCache(MemoryBackend(max_entries), ttl)
+
+
+analytics_cache = _make_cache()
+
+
+# --- LLM response cache -------------------------------------------------------
+# Content-addressed: the key is a hash of model + rendered prompt, so the same
+# customer/amount/shop/language never goes to the model twice while cached.
+#
+#   LLM_CACHE_SIZE           in-memory entries, default 500
+#   LLM_CACHE_PATH           on-disk tier that survives restarts, default llm_cache.db ("" = memory only)
+#   LLM_CACHE_DISK_SIZE      on-disk entries, default 10000
+#   LLM_CACHE_MESSAGE_TTL    seconds for reminder messages, default 86400
+#   LLM_CACHE_INSIGHT_TTL    seconds for cashflow insights, default 3600
+#   LLM_CACHE_AMOUNT_BUCKET  round amounts to this many rupees when building the key,
+#                            default 0 (off). Cached text may then quote an amount up to
+#                            one bucket away from the current one.
+
+
+class LLMCache:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+            record_cache("llm", "hit")
+        elif self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                record_cache("llm", "disk_hit")
+                self.memory.set(key, entry, entry["expires_at"] - time.time())
+        if entry is None:
+            self.misses += 1
+            record_cache("llm", "miss")
+            return None
+        self.saved_seconds += entry["latency"]
+        return entry["text"]
+
+    def set(self, key, text, latency, ttl):
+        entry = {"text": text, "latency": latency, "expires_at": time.time() + ttl}
+        self.memory.set(key, entry, ttl)
+        if self.disk is not None:
+            self.disk.set(key, entry, ttl)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "saved_seconds": round(self.saved_seconds, 2)
+        }
+
+
+def _make_llm_cache():
+    memory = MemoryBackend(int(os.getenv("LLM_CACHE_SIZE", "500")))
+    path = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+    disk = SQLiteBackend(int(os.getenv("LLM_CACHE_DISK_SIZE", "10000")), path) if path else None
+    return LLMCache(memory, disk)
+
+
+llm_cache = _make_llm_cache()
+LLM_MESSAGE_TTL = int(os.getenv("LLM_CACHE_MESSAGE_TTL", "86400"))
+LLM_INSIGHT_TTL = int(os.getenv("LLM_CACHE_INSIGHT_TTL", "3600"))
+LLM_AMOUNT_BUCKET = float(os.getenv("LLM_CACHE_AMOUNT_BUCKET", "0"))
+
+
+def bucket_amount(amount):
+    if not LLM_AMOUNT_BUCKET:
+        return amount
+    return round(amount / LLM_AMOUNT_BUCKET) * LLM_AMOUNT_BUCKET
+
+
+# --- single-flight -------------------------------------------------------------
+# Identical work that is already running isn't started again: a dashboard load, a
+# double click or a second tab that asks for the same numbers or the same model
+# answer waits on the first caller's task and gets its result (or its exception).
+# Keyed like the caches above, so calls only join work that would have produced
+# the same entry. Per process, like the memory caches.
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}  # key -> task doing the work
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, work):
+        """Await work() for key, or the call of it that is already running."""
+        joined = self.join(key)
+        if joined is not None:
+            return await joined
+        self.leaders += 1
+        record_flight(self.name, "leader")
+        task = asyncio.ensure_future(work())
+        self.calls[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        # shielded: a caller that is cancelled (its client went away) leaves the work to the others
+        return await asyncio.shield(task)
+
+    def join(self, key):
+        """An awaitable for key's running work, or None if nothing is running."""
+        task = self.calls.get(key)
+        # a task from another event loop can't be awaited here (only in tests, one loop per client)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        self.coalesced += 1
+        record_flight(self.name, "coalesced")
+        return asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, so a failure nobody waited for isn't logged as unhandled
+
+    def stats(self):
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+analytics_flights = SingleFlight("analytics")
+llm_flights = SingleFlight("llm")
+
+
+# --- per-shop ledger version -------------------------------------------------
+
+def get_ledger_version(db, owner_id):
+    row = db.query(models.ShopLedgerVersion.version).filter(
+        models.ShopLedgerVersion.owner_id == owner_id
+    ).first()
+    return row[0] if row else 0
+
+
+def bump_ledger_version(db, owner_id):
+    # call in the same DB transaction as any change to the shop's customers or transactions.
+    # One INSERT ... ON CONFLICT, so two first writes of a shop can't both insert the row
+    v = models.ShopLedgerVersion
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(v).values(owner_id=owner_id, version=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=["owner_id"], set_={"version": v.version + 1}))
+
+
+def shop_cache_key(name, db, owner_id):
+    return f"{name}:{owner_id}:{get_ledger_version(db, owner_id)}"
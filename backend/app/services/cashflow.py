@@ -1,46 +1,37 @@
 from datetime import datetime, timedelta
 
-def calculate_cashflow(customers_with_transactions):
+def calculate_cashflow(customers_with_ledger):
+    # each customer dict carries its ledger summary (see services/ledger.py)
+    # plus the date of its oldest unpaid transaction
     total_outstanding = 0
     customers_at_risk = []
     upcoming_collections = []
     today = datetime.utcnow()
 
-    for customer in customers_with_transactions:
-        transactions = customer["transactions"]
-        unpaid = [t for t in transactions if not t.is_repaid]
-        
+    for customer in customers_with_ledger:
+        unpaid_count = customer["total_transactions"] - customer["repaid_count"]
+
         # Skip customers with nothing owed
-        if not unpaid:
+        if not unpaid_count:
             continue
 
-        customer_due = sum(t.amount for t in unpaid)
+        customer_due = customer["total_due"]
         total_outstanding += customer_due
 
         # Calculate average repayment delay from actual paid history
-        paid_transactions = [
-            t for t in transactions
-            if t.is_repaid and t.date_repaid and t.date_given
-        ]
-
-        if paid_transactions:
+        if customer["delay_count"]:
             # Real average delay based on actual behavior
-            total_delay = sum(
-                (t.date_repaid - t.date_given).days
-                for t in paid_transactions
-            )
-            avg_delay = total_delay / len(paid_transactions)
+            avg_delay = customer["delay_sum"] / customer["delay_count"]
         else:
             # No history yet — assume 30 days (conservative default)
             avg_delay = 30
 
-        # Find the oldest unpaid transaction
-        # This is the one most likely to be overdue
-        oldest_unpaid = min(unpaid, key=lambda t: t.date_given)
-        days_credit_has_been_outstanding = (today - oldest_unpaid.date_given).days
+        # The oldest unpaid transaction is the one most likely to be overdue
+        oldest_unpaid = customer["oldest_unpaid"]
+        days_credit_has_been_outstanding = (today - oldest_unpaid).days
 
         # Expected payment date = when credit was given + avg delay
-        expected_date = oldest_unpaid.date_given + timedelta(days=avg_delay)
+        expected_date = oldest_unpaid + timedelta(days=avg_delay)
 
         # How many days until expected payment
         # Positive = still waiting (future)
@@ -0,0 +1,126 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import models
+from app.services.ledger import get_ledger_summaries
+from app.services.aitbaar_score import scores_from_stats_batch
+
+
+def score_summaries(customers_with_summaries):
+    summaries = [summary for _, summary in customers_with_summaries]
+    return scores_from_stats_batch(
+        [s["total_transactions"] for s in summaries],
+        [s["repaid_count"] for s in summaries],
+        [s["delay_sum"] for s in summaries],
+        [s["delay_count"] for s in summaries]
+    )
+
+
+def _index_rows(customers_with_summaries):
+    # aggregate scored customers into {(phone, area): row values}
+    rows = {}
+    scores = score_summaries(customers_with_summaries)
+    for (c, summary), score in zip(customers_with_summaries, scores):
+        if c.phone is None or c.area is None:
+            continue  # never matched by an area lookup anyway
+        row = rows.setdefault((c.phone, c.area), {
+            "phone": c.phone,
+            "area": c.area,
+            "name": c.name,
+            "report_count": 0,
+            "score_sum": 0,
+            "total_due": 0,
+            "updated_at": datetime.utcnow(),
+        })
+        row["report_count"] += 1
+        row["score_sum"] += int(score)
+        row["total_due"] += summary["total_due"]
+    return rows
+
+
+def _upsert(db, rows):
+    # one multi-row INSERT ... ON CONFLICT for a list of index rows
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(models.CommunityRiskIndex).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["phone", "area"],
+        set_={k: stmt.excluded[k] for k in rows[0] if k not in ("phone", "area")}
+    ))
+
+
+def refresh_risk_entry(db, phone, area):
+    """Recompute one (phone, area) row after a customer or its ledger changed. Caller commits."""
+    refresh_risk_entries(db, [(phone, area)])
+
+
+def refresh_risk_entries(db, pairs, batch=500):
+    """refresh_risk_entry for many (phone, area) pairs, reading them in batches. Caller commits."""
+    pairs = sorted({(p, a) for p, a in pairs if p is not None and a is not None})
+    for i in range(0, len(pairs), batch):
+        wanted = set(pairs[i:i + batch])
+        customers = get_ledger_summaries(
+            db,
+            models.Customer.phone.in_({p for p, _ in wanted}),
+            models.Customer.area.in_({a for _, a in wanted})
+        )
+        rows = _index_rows([(c, s) for c, s in customers if (c.phone, c.area) in wanted])
+        if rows:
+            _upsert(db, list(rows.values()))
+        for phone, area in wanted - rows.keys():
+            # no customers left for this pair
+            db.query(models.CommunityRiskIndex).filter(
+                models.CommunityRiskIndex.phone == phone,
+                models.CommunityRiskIndex.area == area
+            ).delete(synchronize_session=False)
+
+
+def rebuild_risk_index(db):
+    """Rebuild the whole index from customers + ledger stats. Caller commits."""
+    rows = _index_rows(get_ledger_summaries(db))
+    db.query(models.CommunityRiskIndex).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.CommunityRiskIndex, list(rows.values()))
+    return len(rows)
+
+
+def get_area_risks(db, areas, exclude_owner_id):
+    """
+    Per-phone totals over the index rows of the given areas, with exclude_owner_id's
+    own customers taken out. Only phones still reported by 2+ customers are returned,
+    as dicts with phone, name, area, report_count, score_sum and total_due.
+    """
+    r = models.CommunityRiskIndex
+    # own customers can only lower the counts, so HAVING >= 2 is safe to do first
+    rows = db.query(
+        r.phone,
+        func.min(r.name),
+        func.min(r.area),
+        func.sum(r.report_count),
+        func.sum(r.score_sum),
+        func.sum(r.total_due)
+    ).filter(r.area.in_(areas)).group_by(r.phone).having(
+        func.sum(r.report_count) >= 2
+    ).order_by(r.phone).all()
+
+    own = defaultdict(lambda: {"report_count": 0, "score_sum": 0, "total_due": 0})
+    for (phone, _), row in _index_rows(get_ledger_summaries(
+        db,
+        models.Customer.owner_id == exclude_owner_id,
+        models.Customer.area.in_(areas)
+    )).items():
+        for k in own[phone]:
+            own[phone][k] += row[k]
+
+    result = []
+    for phone, name, area, count, score_sum, total_due in rows:
+        mine = own.get(phone, {"report_count": 0, "score_sum": 0, "total_due": 0})
+        if count - mine["report_count"] >= 2:
+            result.append({
+                "phone": phone,
+                "name": name,
+                "area": area,
+                "report_count": count - mine["report_count"],
+                "score_sum": score_sum - mine["score_sum"],
+                "total_due": total_due - mine["total_due"],
+            })
+    return result
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import zlib
+from datetime import timedelta
+from sqlalchemy import select
+from app import models
+from app.database import SessionLocal
+
+# Ledger export, one row per transaction with its customer, in the same columns
+# /imports/ledger reads. Rows come off a server-side cursor (yield_per), so
+# memory stays flat however big the ledger is. Customers without transactions
+# get a row with the transaction columns empty, unless a date range is given.
+
+COLUMNS = ["customer_id", "phone", "name", "area", "transaction_id", "amount", "type",
+           "date_given", "date_repaid", "is_repaid"]
+FETCH_ROWS = 2000       # rows per cursor fetch
+FLUSH_BYTES = 64 * 1024  # response chunk size
+
+
+def _statement(owner_id, date_from, date_to, customer_ids):
+    c, t = models.Customer, models.Transaction
+    stmt = select(c.id, c.phone, c.name, c.area, t.id, t.amount, t.type,
+                  t.date_given, t.date_repaid, t.is_repaid)
+    if date_from is None and date_to is None:
+        stmt = stmt.outerjoin(t, t.customer_id == c.id)
+    else:
+        stmt = stmt.join(t, t.customer_id == c.id)
+        if date_from is not None:
+            stmt = stmt.where(t.date_given >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(t.date_given < date_to + timedelta(days=1))  # date_to is inclusive
+    stmt = stmt.where(c.owner_id == owner_id)
+    if customer_ids:
+        stmt = stmt.where(c.id.in_(customer_ids))
+    return stmt.order_by(c.id, t.id).execution_options(yield_per=FETCH_ROWS)
+
+
+def _record(row):
+    record = dict(zip(COLUMNS, row))
+    for k in ("date_given", "date_repaid"):
+        if record[k] is not None:
+            record[k] = record[k].isoformat()
+    if record["transaction_id"] is None:
+        record["is_repaid"] = None
+    return record
+
+
+def export_rows(owner_id, fmt="csv", date_from=None, date_to=None, customer_ids=None):
+    """
+    Yield the shop's ledger as text chunks of CSV (with header) or NDJSON.
+    Opens its own session, since the response outlives the request's.
+    """
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, COLUMNS, lineterminator="\n")
+        writer.writeheader()
+
+    with SessionLocal() as db:
+        for row in db.execute(_statement(owner_id, date_from, date_to, customer_ids)):
+            record = _record(row)
+            if writer:
+                writer.writerow(record)
+            else:
+                buffer.write(json.dumps(record) + "\n")
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzipped(chunks):
+    # gzip a text stream chunk by chunk, without holding the whole body
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,85 @@
+from sqlalchemy import func, case, and_, extract
+from app import models
+from app.services.ledger import delay_days
+
+# Grouped queries behind /ai/intelligence. Each one returns a handful of
+# aggregated rows, so the router never has to load the shop's transactions.
+
+
+def _shop_transactions(db, owner_id, *columns):
+    t = models.Transaction
+    return db.query(*columns).select_from(t).join(
+        models.Customer, models.Customer.id == t.customer_id
+    ).filter(models.Customer.owner_id == owner_id)
+
+
+def _paid_with_dates():
+    t = models.Transaction
+    return and_(t.is_repaid == True, t.date_repaid.isnot(None), t.date_given.isnot(None))
+
+
+def delays_by_week_of_month(db, owner_id):
+    # {week: (delay_sum, count)} — week 4 also takes days 29-31
+    t = models.Transaction
+    day = extract("day", t.date_given)
+    week = case((day <= 7, 1), (day <= 14, 2), (day <= 21, 3), else_=4)
+    rows = _shop_transactions(
+        db, owner_id, week, func.sum(delay_days(db)), func.count(t.id)
+    ).filter(_paid_with_dates()).group_by(week).all()
+    return {int(w): (int(delay_sum), count) for w, delay_sum, count in rows}
+
+
+def collections_by_month(db, owner_id):
+    # {month number: (total, collected, count)} across all years
+    t = models.Transaction
+    month = extract("month", t.date_given)
+    rows = _shop_transactions(
+        db, owner_id,
+        month,
+        func.sum(t.amount),
+        func.sum(case((t.is_repaid == True, t.amount), else_=0)),
+        func.count(t.id)
+    ).filter(t.date_given.isnot(None)).group_by(month).all()
+    return {int(m): (total, collected, count) for m, total, collected, count in rows}
+
+
+def collections_since(db, owner_id, since):
+    # {(year, month): (collected, outstanding)} for credit given on or after since
+    t = models.Transaction
+    year = extract("year", t.date_given)
+    month = extract("month", t.date_given)
+    rows = _shop_transactions(
+        db, owner_id,
+        year,
+        month,
+        func.sum(case((t.is_repaid == True, t.amount), else_=0)),
+        func.sum(case((t.is_repaid == True, 0), else_=t.amount))
+    ).filter(t.date_given >= since).group_by(year, month).all()
+    return {(int(y), int(m)): (collected, outstanding) for y, m, collected, outstanding in rows}
+
+
+def repayment_halves(db, owner_id):
+    """
+    Split every customer's paid history (ordered by date_given) into an early
+    and a recent half. Returns {customer_id: (paid_count, early_delay_sum, recent_delay_sum)};
+    the early half is the first paid_count // 2 transactions.
+    """
+    t = models.Transaction
+    ranked = _shop_transactions(
+        db, owner_id,
+        t.customer_id.label("customer_id"),
+        delay_days(db).label("delay"),
+        func.row_number().over(
+            partition_by=t.customer_id, order_by=(t.date_given, t.id)
+        ).label("rn"),
+        func.count(t.id).over(partition_by=t.customer_id).label("paid_count")
+    ).filter(_paid_with_dates()).subquery()
+
+    is_early = ranked.c.rn * 2 <= ranked.c.paid_count
+    rows = db.query(
+        ranked.c.customer_id,
+        func.max(ranked.c.paid_count),
+        func.sum(case((is_early, ranked.c.delay), else_=0)),
+        func.sum(case((is_early, 0), else_=ranked.c.delay))
+    ).group_by(ranked.c.customer_id).all()
+    return {cid: (count, int(early), int(recent)) for cid, count, early, recent in rows}
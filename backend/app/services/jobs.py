@@ -0,0 +1,293 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, and_
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from app import models
+from app.database import SessionLocal, not_user_data
+from app.services.ai_agent import generate_cashflow_insight, generate_whatsapp_message
+
+load_dotenv()
+
+# Background queue for LLM work, stored in the ai_jobs table so every uvicorn
+# worker (and a restart) sees the same jobs. Each process runs a few asyncio
+# workers that claim pending jobs with a conditional UPDATE, so a job runs once
+# even when several processes poll the same table.
+#
+#   AI_JOB_WORKERS        concurrent jobs per process, default 4 (0 = only enqueue here)
+#   AI_JOB_RESULT_TTL     seconds a finished job is kept and served, default 3600
+#   AI_JOB_POLL_INTERVAL  seconds between checks for jobs queued by other processes, default 1
+#   AI_JOB_STALE_AFTER    seconds before a running job whose worker died is retried, default 120
+#   AI_JOB_MAX_ATTEMPTS   tries before a job is marked failed, default 3
+
+JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+RESULT_TTL = int(os.getenv("AI_JOB_RESULT_TTL", "3600"))
+POLL_INTERVAL = float(os.getenv("AI_JOB_POLL_INTERVAL", "1"))
+STALE_AFTER = int(os.getenv("AI_JOB_STALE_AFTER", "120"))
+MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+JANITOR_INTERVAL = 60
+MAX_BACKOFF = 30  # seconds a worker waits after repeated errors
+
+logger = logging.getLogger("app.jobs")
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+@handler("cashflow_insight")
+async def _cashflow_insight(payload):
+    return await generate_cashflow_insight(payload["cashflow"], payload["shop_name"])
+
+
+@handler("reminder_message")
+async def _reminder_message(payload):
+    return await generate_whatsapp_message(**payload)
+
+
+# counters for this process; queue depth itself comes from the table
+metrics = {"enqueued": 0, "deduplicated": 0, "completed": 0, "failed": 0, "retried": 0}
+wait_times = deque(maxlen=500)  # seconds from enqueue to start
+run_times = deque(maxlen=500)   # seconds from start to finish
+
+_wakeup = None
+_loop = None
+_tasks = []
+
+
+# --- request side -------------------------------------------------------------
+
+def enqueue(db, kind, owner_id, payload, dedupe_key):
+    """
+    Queue a job unless one with the same dedupe_key is already pending, running
+    or finished and unexpired — that job is returned instead. Commits.
+    """
+    j = models.AIJob
+    existing = db.query(j).filter(
+        j.dedupe_key == dedupe_key,
+        or_(j.status.in_([PENDING, RUNNING]), and_(j.status == DONE, j.expires_at > datetime.utcnow()))
+    ).order_by(j.id.desc()).first()
+    if existing:
+        metrics["deduplicated"] += 1
+        return existing
+
+    # two requests racing here can both insert; the second job is just redundant work
+    job = j(kind=kind, dedupe_key=dedupe_key, owner_id=owner_id, payload=json.dumps(payload),
+            status=PENDING, attempts=0, created_at=datetime.utcnow())
+    db.add(job)
+    # the queue is read from the primary only, so this doesn't pin the user's reads there
+    with not_user_data():
+        db.commit()
+    metrics["enqueued"] += 1
+    _wake()
+    return job
+
+
+def get_job(db, job_id, owner_id):
+    return db.query(models.AIJob).filter(
+        models.AIJob.id == job_id, models.AIJob.owner_id == owner_id
+    ).first()
+
+
+def last_result(db, owner_id, kind):
+    # the newest finished result of this kind for a shop, even if its inputs have changed since
+    j = models.AIJob
+    row = db.query(j.result).filter(
+        j.owner_id == owner_id, j.kind == kind, j.status == DONE
+    ).order_by(j.finished_at.desc()).first()
+    return json.loads(row[0]) if row else None
+
+
+def find_result(db, dedupe_key):
+    j = models.AIJob
+    row = db.query(j.result).filter(
+        j.dedupe_key == dedupe_key, j.status == DONE, j.expires_at > datetime.utcnow()
+    ).order_by(j.id.desc()).first()
+    return json.loads(row[0]) if row else None
+
+
+def save_result(kind, owner_id, dedupe_key, result):
+    # record work that was done inline (e.g. a streamed insight) as a finished job.
+    # Uses its own session, so it is safe after the request's session is closed.
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        db.add(models.AIJob(
+            kind=kind, dedupe_key=dedupe_key, owner_id=owner_id, payload="{}",
+            status=DONE, result=json.dumps(result), attempts=1, created_at=now,
+            started_at=now, finished_at=now, expires_at=now + timedelta(seconds=RESULT_TTL)
+        ))
+        with not_user_data():
+            db.commit()
+
+
+def job_view(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 3)
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1], 3)}
+
+
+def stats(db):
+    j = models.AIJob
+    counts = dict(db.query(j.status, func.count(j.id)).group_by(j.status).all())
+    oldest = db.query(func.min(j.created_at)).filter(j.status == PENDING).scalar()
+    return {
+        "depth": counts.get(PENDING, 0),
+        "running": counts.get(RUNNING, 0),
+        "stored": {"done": counts.get(DONE, 0), "failed": counts.get(FAILED, 0)},
+        "oldest_pending_seconds": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None,
+        "workers": JOB_WORKERS if _tasks else 0,
+        # below: this process only, since it started
+        **metrics,
+        "wait_seconds": _percentiles(wait_times),
+        "run_seconds": _percentiles(run_times)
+    }
+
+
+# --- worker side --------------------------------------------------------------
+
+def _wake():
+    # enqueue() runs on the threadpool; the workers wait on the event loop
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def _claim_next():
+    # (id, kind, payload, created_at, started_at) of a job this process now owns, or None
+    j = models.AIJob
+    with SessionLocal() as db:
+        candidates = db.query(j.id).filter(j.status == PENDING).order_by(j.id).limit(10).all()
+        for (job_id,) in candidates:
+            claimed = db.query(j).filter(j.id == job_id, j.status == PENDING).update(
+                {j.status: RUNNING, j.started_at: datetime.utcnow(), j.attempts: j.attempts + 1},
+                synchronize_session=False
+            )
+            db.commit()
+            if claimed:
+                job = db.query(j.id, j.kind, j.payload, j.created_at, j.started_at).filter(j.id == job_id).one()
+                return tuple(job)
+    return None
+
+
+def _finish(job_id, result, error):
+    j = models.AIJob
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        db.query(j).filter(j.id == job_id).update({
+            j.status: FAILED if error else DONE,
+            j.result: None if error else json.dumps(result),
+            j.error: error,
+            j.finished_at: now,
+            j.expires_at: now + timedelta(seconds=RESULT_TTL)
+        }, synchronize_session=False)
+        db.commit()
+
+
+def _clean_up():
+    # retry jobs whose worker died mid-run, drop expired results
+    j = models.AIJob
+    now = datetime.utcnow()
+    stale = and_(j.status == RUNNING, j.started_at < now - timedelta(seconds=STALE_AFTER))
+    with SessionLocal() as db:
+        retried = db.query(j).filter(stale, j.attempts < MAX_ATTEMPTS).update(
+            {j.status: PENDING}, synchronize_session=False
+        )
+        db.query(j).filter(stale).update(
+            {j.status: FAILED, j.error: "worker lost", j.finished_at: now,
+             j.expires_at: now + timedelta(seconds=RESULT_TTL)},
+            synchronize_session=False
+        )
+        db.query(j).filter(j.expires_at < now).delete(synchronize_session=False)
+        db.commit()
+    metrics["retried"] += retried
+    return retried
+
+
+async def _run(job_id, kind, payload, created_at, started_at):
+    wait_times.append((started_at - created_at).total_seconds())
+    start = time.perf_counter()
+    try:
+        result = await HANDLERS[kind](json.loads(payload))
+    except Exception as e:
+        await run_in_threadpool(_finish, job_id, None, f"{type(e).__name__}: {e}")
+        metrics["failed"] += 1
+    else:
+        await run_in_threadpool(_finish, job_id, result, None)
+        metrics["completed"] += 1
+    run_times.append(time.perf_counter() - start)
+
+
+async def _worker():
+    errors = 0
+    while True:
+        try:
+            job = await run_in_threadpool(_claim_next)
+            if job is not None:
+                await _run(*job)
+        except Exception:
+            # a database hiccup while claiming or saving; a job left running is
+            # retried by the janitor once it is stale. Back off, then carry on
+            errors += 1
+            logger.exception("AI job worker error")
+            await asyncio.sleep(min(POLL_INTERVAL * 2 ** errors, MAX_BACKOFF))
+            continue
+        errors = 0
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def _janitor():
+    while True:
+        try:
+            await run_in_threadpool(_clean_up)
+        except Exception:
+            logger.exception("AI job janitor error")
+        await asyncio.sleep(JANITOR_INTERVAL)
+
+
+def start_workers():
+    global _wakeup, _loop
+    if JOB_WORKERS <= 0 or _tasks:
+        return
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    _tasks.extend(asyncio.ensure_future(_worker()) for _ in range(JOB_WORKERS))
+    _tasks.append(asyncio.ensure_future(_janitor()))
+
+
+async def stop_workers():
+    global _loop
+    _loop = None
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,248 @@
+import calendar
+from datetime import datetime
+from sqlalchemy import func, case, cast, and_, or_, Integer
+from app import models
+from app.services.aitbaar_score import score_from_stats
+
+
+def delay_days(db):
+    # (date_repaid - date_given).days computed inside the database.
+    # Postgres gives us an interval, SQLite (local dev) only has text dates.
+    t = models.Transaction
+    if db.bind.dialect.name == "sqlite":
+        seconds = cast(func.strftime("%s", t.date_repaid), Integer) - cast(func.strftime("%s", t.date_given), Integer)
+        days = seconds / 86400.0
+        whole = cast(days, Integer)  # truncates towards zero, timedelta.days floors
+        return case((days < whole, whole - 1), else_=whole)
+    seconds = func.extract("epoch", t.date_repaid - t.date_given)
+    # extract() is numeric, so without the cast the sums come back as Decimal
+    return cast(func.floor(seconds / 86400), Integer)
+
+
+def _epoch(db, column):
+    # seconds since 1970 of a naive UTC timestamp column
+    if db.bind.dialect.name == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    return func.extract("epoch", column)
+
+
+def overdue_criterion(db, now):
+    """
+    True for customers with an unpaid transaction older than their average
+    repayment delay (30 days without history) — the rule /ai/cashflow uses for
+    is_overdue. Correlates on CustomerLedgerStats, so the query must include it.
+    """
+    t, s = models.Transaction, models.CustomerLedgerStats
+    avg_delay = case((s.delay_count > 0, s.delay_sum * 1.0 / s.delay_count), else_=30.0)
+    return db.query(t.id).filter(
+        t.customer_id == s.customer_id,
+        models.UNPAID,
+        _epoch(db, t.date_given) + avg_delay * 86400 < calendar.timegm(now.utctimetuple())
+    ).exists()
+
+
+def summary_score(summary):
+    return score_from_stats(
+        summary["total_transactions"],
+        summary["repaid_count"],
+        summary["delay_sum"],
+        summary["delay_count"]
+    )
+
+
+def get_ledger_summaries(db, *criteria):
+    """
+    Customers matching criteria together with their ledger stats, in one query.
+    Returns [(customer, summary)] where summary has the numbers needed for
+    total_due, total_transactions and the Aitbaar score — no transaction rows are loaded.
+    """
+    s = models.CustomerLedgerStats
+    rows = db.query(
+        models.Customer,
+        func.coalesce(s.total_count, 0),
+        func.coalesce(s.repaid_count, 0),
+        func.coalesce(s.unpaid_amount, 0),
+        func.coalesce(s.delay_sum, 0),
+        func.coalesce(s.delay_count, 0),
+    ).outerjoin(
+        s, s.customer_id == models.Customer.id
+    ).filter(*criteria).order_by(models.Customer.id).all()
+
+    return [(customer, _summary(*numbers)) for customer, *numbers in rows]
+
+
+def get_ledger_summary(db, customer_id):
+    stats = db.query(models.CustomerLedgerStats).filter(
+        models.CustomerLedgerStats.customer_id == customer_id
+    ).first()
+    if not stats:
+        return _summary(0, 0, 0, 0, 0)
+    return _summary(stats.total_count, stats.repaid_count, stats.unpaid_amount,
+                    stats.delay_sum, stats.delay_count)
+
+
+def get_oldest_unpaid(db, owner_id):
+    # {customer_id: date_given of the oldest unpaid transaction} for a shop
+    t = models.Transaction
+    rows = db.query(t.customer_id, func.min(t.date_given)).join(
+        models.Customer, models.Customer.id == t.customer_id
+    ).filter(
+        models.Customer.owner_id == owner_id,
+        models.UNPAID
+    ).group_by(t.customer_id).all()
+    return dict(rows)
+
+
+def _summary(total, repaid_count, unpaid_amount, delay_sum, delay_count):
+    return {
+        "total_transactions": total,
+        "repaid_count": repaid_count,
+        "total_due": unpaid_amount,
+        "delay_sum": delay_sum,
+        "delay_count": delay_count,
+    }
+
+
+# --- keeping customer_ledger_stats in sync -------------------------------
+
+def _contribution(txn):
+    # what a single transaction adds to its customer's stats row
+    repaid = bool(txn.is_repaid)
+    has_delay = repaid and txn.date_repaid is not None and txn.date_given is not None
+    return {
+        "total_count": 1,
+        "repaid_count": 1 if repaid else 0,
+        "unpaid_amount": 0 if repaid else (txn.amount or 0),
+        "delay_sum": (txn.date_repaid - txn.date_given).days if has_delay else 0,
+        "delay_count": 1 if has_delay else 0,
+    }
+
+
+def _activity(txn):
+    # latest date the transaction was touched on, for sorting by last activity
+    return txn.date_repaid or txn.date_given
+
+
+def _increment(db, customer_id, delta, activity=None):
+    s = models.CustomerLedgerStats
+    # increments happen in SQL so two requests for the same customer can't lose an update
+    values = {getattr(s, k): getattr(s, k) + v for k, v in delta.items()}
+    if activity is not None:
+        values[s.last_activity] = case(
+            (or_(s.last_activity.is_(None), s.last_activity < activity), activity),
+            else_=s.last_activity
+        )
+    return db.query(s).filter(s.customer_id == customer_id).update(values, synchronize_session=False)
+
+
+def _refresh_score(db, customer_id):
+    # the stored score is only there to sort and filter on; it is recomputed with
+    # score_from_stats after every change, from the row as it is after the increment
+    s = models.CustomerLedgerStats
+    numbers = db.query(s.total_count, s.repaid_count, s.delay_sum, s.delay_count).filter(
+        s.customer_id == customer_id
+    ).one()
+    db.query(s).filter(s.customer_id == customer_id).update(
+        {s.score: score_from_stats(*numbers)}, synchronize_session=False
+    )
+
+
+def _apply(db, customer_id, delta, activity=None):
+    if not _increment(db, customer_id, delta, activity):
+        # customer from before the stats table existed — build the row from
+        # the transactions already in the database, then apply this change on top
+        rebuild_ledger_stats(db, [customer_id])
+        _increment(db, customer_id, delta, activity)
+    _refresh_score(db, customer_id)
+
+
+def record_transaction(db, txn):
+    # call after db.add(txn) but before it is flushed/committed
+    _apply(db, txn.customer_id, _contribution(txn), _activity(txn))
+
+
+def unrecord_transaction(db, txn):
+    # call while txn still has its old values, before changing or deleting it
+    _apply(db, txn.customer_id, {k: -v for k, v in _contribution(txn).items()})
+
+
+def create_ledger_stats(db, customer_id, owner_id):
+    db.add(models.CustomerLedgerStats(
+        customer_id=customer_id, owner_id=owner_id, total_count=0, repaid_count=0,
+        unpaid_amount=0, delay_sum=0, delay_count=0,
+        score=score_from_stats(0, 0, 0, 0), last_activity=datetime.utcnow()
+    ))
+
+
+def delete_ledger_stats(db, customer_id):
+    db.query(models.CustomerLedgerStats).filter(
+        models.CustomerLedgerStats.customer_id == customer_id
+    ).delete(synchronize_session=False)
+
+
+# --- rebuild / consistency check against the transactions table -----------
+
+def _raw_stats_query(db, *extra):
+    t = models.Transaction
+    has_delay = and_(t.is_repaid == True, t.date_repaid.isnot(None), t.date_given.isnot(None))
+    return db.query(
+        models.Customer.id,
+        func.count(t.id),
+        func.coalesce(func.sum(case((t.is_repaid == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((t.is_repaid == True, 0), else_=t.amount)), 0),
+        func.coalesce(func.sum(case((has_delay, delay_days(db)), else_=0)), 0),
+        func.coalesce(func.sum(case((has_delay, 1), else_=0)), 0),
+        *extra
+    ).outerjoin(
+        t, t.customer_id == models.Customer.id
+    ).group_by(models.Customer.id)
+
+
+def rebuild_ledger_stats(db, customer_ids=None):
+    """Recompute stats rows from the transactions table. Caller commits."""
+    s = models.CustomerLedgerStats
+    c, t = models.Customer, models.Transaction
+    # a customer with no transactions was last active when it was added
+    query = _raw_stats_query(
+        db, c.owner_id, func.coalesce(func.max(func.coalesce(t.date_repaid, t.date_given)), c.created_at)
+    ).group_by(c.owner_id, c.created_at)
+    delete = db.query(s)
+    if customer_ids is not None:
+        query = query.filter(models.Customer.id.in_(customer_ids))
+        delete = delete.filter(s.customer_id.in_(customer_ids))
+    delete.delete(synchronize_session=False)
+
+    rows = query.all()
+    db.bulk_insert_mappings(s, [
+        {
+            "customer_id": customer_id,
+            "owner_id": owner_id,
+            "total_count": total,
+            "repaid_count": repaid_count,
+            "unpaid_amount": unpaid_amount,
+            "delay_sum": int(delay_sum),
+            "delay_count": delay_count,
+            "score": score_from_stats(total, repaid_count, int(delay_sum), delay_count),
+            "last_activity": last_activity,
+        }
+        for customer_id, total, repaid_count, unpaid_amount, delay_sum, delay_count, owner_id, last_activity in rows
+    ])
+    return len(rows)
+
+
+def check_ledger_stats(db):
+    """Compare the stats table against the transactions table. Returns a list of mismatches."""
+    stored = {
+        st.customer_id: st for st in db.query(models.CustomerLedgerStats).all()
+    }
+    mismatches = []
+    for customer_id, total, repaid_count, unpaid_amount, delay_sum, delay_count in _raw_stats_query(db).all():
+        expected = _summary(total, repaid_count, unpaid_amount, int(delay_sum), delay_count)
+        st = stored.get(customer_id)
+        actual = _summary(st.total_count, st.repaid_count, st.unpaid_amount,
+                          st.delay_sum, st.delay_count) if st else None
+        if actual is None or st.score != summary_score(expected) or any(
+            abs((actual[k] or 0) - (expected[k] or 0)) > 0.01 for k in expected
+        ):
+            mismatches.append({"customer_id": customer_id, "expected": expected, "actual": actual})
+    return mismatches
@@ -0,0 +1,268 @@
+import csv
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_
+from dotenv import load_dotenv
+from app import models
+from app.services.ledger import rebuild_ledger_stats
+from app.services.community import refresh_risk_entries
+from app.services.cache import bump_ledger_version
+
+load_dotenv()
+
+# Bulk ledger import. Rows are validated and inserted a chunk at a time, each
+# chunk in one DB transaction together with the import's rows_done, so an
+# interrupted upload can be sent again with the same import id and carries on
+# after the last committed chunk. Ledger stats, the community risk index and the
+# shop's ledger version are brought up to date once, when the upload ends.
+#
+# One record per line: CSV with a header row, or NDJSON. A quoted CSV field may
+# span lines (a note with a line break, as spreadsheets export it). Fields:
+#   phone (required), name, area, amount, type (credit/payment, default credit),
+#   date_given (ISO date/time, default now), date_repaid, is_repaid
+# Customers are matched by phone within the shop and created if missing; a record
+# without amount only creates the customer.
+#
+#   IMPORT_CHUNK_ROWS   rows per batch insert and commit, default 1000
+#   IMPORT_MAX_ERRORS   row errors kept on the import, default 1000
+#   IMPORT_STALE_AFTER  seconds before a running import whose upload died can be resumed, default 120
+
+CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+STALE_AFTER = int(os.getenv("IMPORT_STALE_AFTER", "120"))
+
+RUNNING, INTERRUPTED, FAILED, DONE = "running", "interrupted", "failed", "done"
+TYPES = ("credit", "payment")
+TRUE, FALSE = ("1", "true", "yes", "y"), ("0", "false", "no", "n", "")
+
+
+def create_import(db, owner_id):
+    now = datetime.utcnow()
+    imp = models.LedgerImport(owner_id=owner_id, status=RUNNING, rows_done=0, customers_created=0,
+                              transactions_created=0, error_count=0, errors="[]",
+                              created_at=now, updated_at=now)
+    db.add(imp)
+    db.commit()
+    return imp
+
+
+def resume_import(db, import_id, owner_id):
+    """
+    Claim an unfinished import for another upload. Returns it, or None if it
+    doesn't exist, is done, or another upload is still running it.
+    """
+    li = models.LedgerImport
+    now = datetime.utcnow()
+    claimed = db.query(li).filter(
+        li.id == import_id,
+        li.owner_id == owner_id,
+        li.status != DONE,
+        or_(li.status != RUNNING, li.updated_at < now - timedelta(seconds=STALE_AFTER))
+    ).update({li.status: RUNNING, li.updated_at: now}, synchronize_session=False)
+    db.commit()
+    return get_import(db, import_id, owner_id) if claimed else None
+
+
+def get_import(db, import_id, owner_id):
+    return db.query(models.LedgerImport).filter(
+        models.LedgerImport.id == import_id,
+        models.LedgerImport.owner_id == owner_id
+    ).first()
+
+
+def import_view(imp):
+    return {
+        "import_id": imp.id,
+        "status": imp.status,
+        "rows_done": imp.rows_done,
+        "customers_created": imp.customers_created,
+        "transactions_created": imp.transactions_created,
+        "error_count": imp.error_count,
+        "errors": json.loads(imp.errors or "[]"),
+        "created_at": imp.created_at,
+        "finished_at": imp.finished_at
+    }
+
+
+# --- parsing and validation ----------------------------------------------------
+
+def unclosed_quote(text):
+    """Whether CSV text ends inside a quoted field, so the record goes on past the line break."""
+    if '"' not in text:
+        return False
+    try:
+        next(csv.reader([text], strict=True), None)
+    except csv.Error as e:
+        return str(e) == "unexpected end of data"
+    return False
+
+
+def parse_header(line):
+    return [h.strip().lower() for h in next(csv.reader([line]))]
+
+
+def _parse(line, header):
+    if header is None:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("expected a JSON object")
+        return record
+    if unclosed_quote(line):
+        raise ValueError("a quoted field is never closed")
+    try:
+        values = next(csv.reader([line]))
+    except csv.Error as e:
+        raise ValueError(f"not valid CSV: {e}")
+    if len(values) != len(header):
+        raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+    return dict(zip(header, values))
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _date(value, field):
+    value = _text(value)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO date: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)  # stored as naive UTC
+    return parsed
+
+
+def _validate(record):
+    phone = _text(record.get("phone"))
+    if phone is None:
+        raise ValueError("phone is required")
+
+    amount = _text(record.get("amount"))
+    if amount is not None:
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise ValueError(f"amount is not a number: {amount!r}")
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+
+    txn_type = (_text(record.get("type")) or "credit").lower()
+    if txn_type not in TYPES:
+        raise ValueError(f"type must be credit or payment, got {txn_type!r}")
+
+    date_given = _date(record.get("date_given"), "date_given") or datetime.utcnow()
+    date_repaid = _date(record.get("date_repaid"), "date_repaid")
+    if date_repaid is not None and date_repaid < date_given:
+        raise ValueError("date_repaid is before date_given")
+
+    is_repaid = record.get("is_repaid")
+    if is_repaid is None or isinstance(is_repaid, bool):
+        is_repaid = bool(is_repaid) or date_repaid is not None
+    elif str(is_repaid).strip().lower() in TRUE:
+        is_repaid = True
+    elif str(is_repaid).strip().lower() in FALSE:
+        is_repaid = date_repaid is not None
+    else:
+        raise ValueError(f"is_repaid must be true or false, got {is_repaid!r}")
+
+    return {
+        "phone": phone,
+        "name": _text(record.get("name")),
+        "area": _text(record.get("area")),
+        "amount": amount,
+        "type": txn_type,
+        "date_given": date_given,
+        "date_repaid": date_repaid,
+        "is_repaid": is_repaid,
+    }
+
+
+# --- writing ----------------------------------------------------------------------
+
+def _resolve_customers(db, owner_id, records):
+    # ({phone: customer_id}, customers created) — one lookup and one batch insert
+    c = models.Customer
+    phones = {r["phone"] for r in records}
+    ids = {}
+    # newest first, so the oldest customer with a phone wins when a shop has duplicates
+    for customer_id, phone in db.query(c.id, c.phone).filter(
+        c.owner_id == owner_id, c.phone.in_(phones)
+    ).order_by(c.id.desc()):
+        ids[phone] = customer_id
+
+    new = {}
+    for r in records:
+        if r["phone"] not in ids and r["phone"] not in new:
+            new[r["phone"]] = {"name": r["name"] or r["phone"], "phone": r["phone"],
+                               "area": r["area"] or "Unknown", "owner_id": owner_id,
+                               "created_at": datetime.utcnow()}
+    if new:
+        db.execute(c.__table__.insert(), list(new.values()))
+        ids.update(db.query(c.phone, c.id).filter(c.owner_id == owner_id, c.phone.in_(new)).all())
+    return ids, len(new)
+
+
+def import_chunk(db, import_id, first_row, lines, header):
+    """
+    Validate and insert one chunk of raw lines (row numbers start at first_row)
+    and record the progress, all in one transaction. Returns the row errors.
+    """
+    imp = db.query(models.LedgerImport).filter(models.LedgerImport.id == import_id).one()
+    records, errors = [], []
+    for row, line in enumerate(lines, start=first_row):
+        try:
+            records.append(_validate(_parse(line, header)))
+        except ValueError as e:  # includes bad JSON
+            errors.append({"row": row, "error": str(e)})
+
+    try:
+        ids, created = _resolve_customers(db, imp.owner_id, records) if records else ({}, 0)
+        txns = [
+            {"customer_id": ids[r["phone"]], "amount": r["amount"], "type": r["type"],
+             "date_given": r["date_given"], "date_repaid": r["date_repaid"], "is_repaid": r["is_repaid"]}
+            for r in records if r["amount"] is not None
+        ]
+        if txns:
+            # executemany — batched by the driver (psycopg2 execute_values on Postgres)
+            db.execute(models.Transaction.__table__.insert(), txns)
+
+        kept = json.loads(imp.errors or "[]")
+        imp.errors = json.dumps((kept + errors)[:MAX_ERRORS])
+        imp.error_count += len(errors)
+        imp.customers_created += created
+        imp.transactions_created += len(txns)
+        imp.rows_done = first_row + len(lines) - 1
+        imp.updated_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return errors
+
+
+def finish_import(db, import_id, status):
+    """
+    Bring the shop's derived data up to date for what the import added and set its
+    final status. Runs once per upload, also when the upload broke off. Commits.
+    """
+    db.rollback()  # in case the last chunk failed half way
+    imp = db.query(models.LedgerImport).filter(models.LedgerImport.id == import_id).one()
+    if imp.customers_created or imp.transactions_created:
+        c = models.Customer
+        customers = db.query(c.id, c.phone, c.area).filter(c.owner_id == imp.owner_id).all()
+        rebuild_ledger_stats(db, [customer_id for customer_id, _, _ in customers])
+        refresh_risk_entries(db, [(phone, area) for _, phone, area in customers])
+        bump_ledger_version(db, imp.owner_id)
+    imp.status = status
+    imp.updated_at = datetime.utcnow()
+    if status == DONE:
+        imp.finished_at = imp.updated_at
+    db.commit()
+    return imp
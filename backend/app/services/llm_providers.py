@@ -0,0 +1,297 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate
+from openai import AsyncOpenAI
+from app.metrics import record_llm_call
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Async clients for the AI fallback chain, with hedging: if the primary hasn't
+# answered within its recent p95 latency, the secondary is fired as well and
+# whichever answers first wins.
+#
+#   GITHUB_MODELS_BASE_URL  default https://models.inference.ai.azure.com
+#   GROQ_BASE_URL           default is the Groq SDK's own
+#   LLM_TIMEOUT             per-call deadline in seconds, default 15
+#   LLM_HEDGE_DELAY         hedge delay until enough latency samples exist, default 2
+#   LLM_HEDGING             set to 0 to only try the secondary after the primary failed
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "15"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "1") != "0"
+MIN_SAMPLES = 20
+
+# Circuit breaker per provider: once too many of the last calls failed (or were
+# too slow), the provider is skipped for a cooldown, then one probe call decides
+# whether it comes back.
+#
+#   LLM_BREAKER_WINDOW      recent calls considered, default 20
+#   LLM_BREAKER_MIN_CALLS   calls needed before the breaker can open, default 5
+#   LLM_BREAKER_ERROR_RATE  failure share that opens it, default 0.5
+#   LLM_BREAKER_SLOW_CALL   seconds after which a success, or a call cancelled while still
+#                           running, counts as failed, default 10. Calls cut off at
+#                           LLM_TIMEOUT always count as failed.
+#   LLM_BREAKER_COOLDOWN    seconds to stay open before probing, default 30
+
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL = float(os.getenv("LLM_BREAKER_SLOW_CALL", "10"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16]  # seconds
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+DEADLINE = "deadline"  # cancel message for calls still running when LLM_TIMEOUT is up
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)  # True = failed or too slow
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self):
+        if self.state == OPEN and time.time() - self.opened_at >= BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True  # one probe at a time
+        return self.state != OPEN
+
+    def record(self, failed):
+        if self.state == HALF_OPEN:
+            self.probing = False
+            if failed:
+                self._open()
+            else:
+                self.state = CLOSED
+                self.outcomes.clear()
+            return
+        self.outcomes.append(failed)
+        if len(self.outcomes) >= BREAKER_MIN_CALLS and \
+                sum(self.outcomes) / len(self.outcomes) >= BREAKER_ERROR_RATE:
+            self._open()
+
+    def release(self):
+        # a probe cancelled early (it lost a hedge race while still fast) doesn't decide anything
+        self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+
+
+class Provider:
+    def __init__(self, name, client, model):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.latencies = deque(maxlen=200)  # seconds, successful calls only
+        self.breaker = CircuitBreaker()
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self.successes = 0
+        self.failures = {}  # exception type name -> count
+        self.skipped = 0    # calls not made because the breaker was open
+
+    async def complete(self, prompt, max_tokens, timeout):
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            text = response.choices[0].message.content.strip()
+        except asyncio.CancelledError as e:
+            if DEADLINE in e.args or time.perf_counter() - start > BREAKER_SLOW_CALL:
+                # cut off at the chain's deadline, or it lost a hedge race when it was already
+                # too slow: the breaker counts it like a timeout, as it would a slow success
+                self._record_failure(asyncio.TimeoutError())
+            else:
+                self.breaker.release()
+                record_llm_call(self.name, "cancelled")
+            raise
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self._record_success(time.perf_counter() - start)
+        return text
+
+    async def stream(self, prompt, max_tokens, timeout):
+        # yields text chunks as the model produces them
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.release()
+            record_llm_call(self.name, "cancelled")
+            raise
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self._record_success(time.perf_counter() - start)
+
+    def _record_failure(self, e):
+        name = type(e).__name__
+        self.failures[name] = self.failures.get(name, 0) + 1
+        self.breaker.record(failed=True)
+        timeout = isinstance(e, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name
+        record_llm_call(self.name, "timeout" if timeout else "error")
+
+    def _record_success(self, latency):
+        self.latencies.append(latency)
+        self.histogram[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.successes += 1
+        self.breaker.record(failed=latency > BREAKER_SLOW_CALL)
+        record_llm_call(self.name, "success", latency)
+
+    def skip(self):
+        # a call not made because the breaker is open
+        self.skipped += 1
+        record_llm_call(self.name, "skipped")
+
+    def hedge_delay(self):
+        if len(self.latencies) < MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def status(self):
+        bounds = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        return {
+            "model": self.model,
+            "state": self.breaker.state,
+            "successes": self.successes,
+            "failures": dict(self.failures),
+            "skipped_while_open": self.skipped,
+            "hedge_delay": round(self.hedge_delay(), 3),
+            # cumulative counts of successful calls at or under each bound (seconds)
+            "latency_histogram": dict(zip(bounds, accumulate(self.histogram)))
+        }
+
+
+# Primary — GitHub Models (GPT-4o)
+github = Provider("github", AsyncOpenAI(
+    base_url=os.getenv("GITHUB_MODELS_BASE_URL", "https://models.inference.ai.azure.com"),
+    api_key=os.getenv("GITHUB_TOKEN"),
+    max_retries=0
+), "gpt-4o")
+
+# Fallback — Groq (Llama 3.1)
+try:
+    from groq import AsyncGroq
+    groq = Provider("groq", AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        base_url=os.getenv("GROQ_BASE_URL") or None,
+        max_retries=0
+    ), "llama-3.1-8b-instant")
+except Exception:
+    groq = None
+
+PROVIDERS = [p for p in (github, groq) if p is not None]
+
+
+def status():
+    return {p.name: p.status() for p in PROVIDERS}
+
+
+async def complete(prompt, max_tokens, providers=None):
+    """
+    First successful answer from the provider chain within LLM_TIMEOUT, or None.
+    Providers with an open circuit breaker are skipped without a call.
+    """
+    providers = providers or PROVIDERS
+    deadline = time.perf_counter() + LLM_TIMEOUT
+    waiting = list(providers)
+    running = {}
+
+    def start_next():
+        # start the next provider whose breaker lets a call through
+        while waiting:
+            provider = waiting.pop(0)
+            if not provider.breaker.allow():
+                provider.skip()
+                continue
+            remaining = max(deadline - time.perf_counter(), 0.1)
+            task = asyncio.ensure_future(provider.complete(prompt, max_tokens, remaining))
+            running[task] = provider
+            return provider
+        return None
+
+    first = start_next()
+    if first is None:
+        return None
+    hedge_at = time.perf_counter() + first.hedge_delay() if LLM_HEDGING else None
+    timed_out = False
+
+    try:
+        while running:
+            now = time.perf_counter()
+            if now >= deadline:
+                timed_out = True
+                break
+            timeout = deadline - now
+            if hedge_at is not None and waiting:
+                timeout = min(timeout, max(hedge_at - now, 0))
+
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                # primary is slow — hedge with the next provider
+                if hedge_at is not None and waiting and time.perf_counter() >= hedge_at:
+                    hedge_at = None
+                    start_next()
+                continue
+
+            for task in done:
+                running.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                # the provider has already counted the failure by type
+
+            if waiting and not running:
+                start_next()
+        return None
+    finally:
+        for task in running:
+            task.cancel(DEADLINE if timed_out else None)
+
+
+async def stream(prompt, max_tokens, providers=None):
+    """
+    Stream chunks from the first available provider. If a provider fails before
+    sending anything the next one is tried; a failure mid-stream is raised.
+    Raises RuntimeError if no provider produced an answer.
+    """
+    for provider in providers or PROVIDERS:
+        if not provider.breaker.allow():
+            provider.skip()
+            continue
+        sent = False
+        try:
+            async for text in provider.stream(prompt, max_tokens, LLM_TIMEOUT):
+                sent = True
+                yield text
+            if sent:
+                return
+        except Exception:
+            if sent:
+                raise
+    raise RuntimeError("no AI provider available")
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# bcrypt runs in its own process pool so a burst of logins can't tie up the
+# request threadpool or the GIL. The pool has a queue limit: past it, callers get
+# PasswordPoolBusy (a 503 in the auth router) instead of waiting behind the burst.
+#
+#   BCRYPT_ROUNDS          cost factor for new hashes, default 12. Hashes made with a
+#                          different cost are redone on the user's next login
+#   PASSWORD_WORKERS       processes, default one per CPU (0 = hash on the request threadpool)
+#   PASSWORD_QUEUE_LIMIT   hashes queued or running before new ones are refused,
+#                          default 8 per worker
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(8 * max(PASSWORD_WORKERS, 1))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+metrics = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+
+_executor = None
+_in_flight = 0
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+# these run inside the pool processes
+
+def hash_password(password):
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password, hashed):
+    # (matches, new hash if the stored one should be replaced else None)
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def _ping():
+    return os.getpid()
+
+
+# --- called from the event loop --------------------------------------------
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the parent has an event loop and DB connections we don't want copied
+        _executor = ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _in_flight
+    if _in_flight >= QUEUE_LIMIT:
+        metrics["rejected"] += 1
+        raise PasswordPoolBusy()
+    _in_flight += 1
+    try:
+        if PASSWORD_WORKERS <= 0:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.wrap_future(_pool().submit(fn, *args))
+    except BrokenProcessPool:
+        stop_pool()  # a worker died (e.g. OOM killed) — the next call starts a fresh pool
+        raise
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password_async(password):
+    hashed = await _submit(hash_password, password)
+    metrics["hashed"] += 1
+    return hashed
+
+
+async def verify_password_async(password, hashed):
+    """Returns (matches, new_hash). new_hash is set when the cost factor changed and should be saved."""
+    matches, new_hash = await _submit(verify_and_update, password, hashed)
+    metrics["verified"] += 1
+    if new_hash:
+        metrics["rehashed"] += 1
+    return matches, new_hash
+
+
+def stats():
+    return {"workers": PASSWORD_WORKERS, "rounds": BCRYPT_ROUNDS, "queue_limit": QUEUE_LIMIT,
+            "in_flight": _in_flight, **metrics}
+
+
+async def start_pool():
+    # start the processes now rather than on the first login after a deploy
+    if PASSWORD_WORKERS > 0:
+        await asyncio.gather(*(asyncio.wrap_future(_pool().submit(_ping)) for _ in range(PASSWORD_WORKERS)))
+
+
+def stop_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
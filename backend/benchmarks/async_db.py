@@ -0,0 +1,223 @@
+# Throughput and tail latency of the async database stack against the sync one,
+# under concurrent load. The async build is this tree. The sync build is a git
+# worktree of --baseline, by default the commit before this script was added,
+# the last one whose routers ran sync Sessions on the threadpool. Each build runs
+# as one uvicorn worker against the same database, with the LLM replaced by
+# benchmarks.fake_llm_server and the analytics and LLM caches off. Then it is hit
+# by N concurrent clients for --duration seconds with a mix of reads, writes and
+# one LLM-backed endpoint. Point DATABASE_URL at a throwaway local Postgres (it is
+# filled by benchmarks.synthetic if empty), then from backend/:
+#   python -m benchmarks.async_db --concurrency 10 --concurrency 100 --output async_db.json
+# The load comes from a single asyncio process, so at high concurrency check its
+# CPU use before blaming the server.
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.endpoints import percentile, git_commit
+
+LLM_PORT = 9202
+SERVER_PORT = 9203
+
+# (name, weight, method, path, kwargs); path and kwargs are filled from the shop
+MIX = [
+    ("GET /customers/ page", 30, "get", "/customers/", lambda s: {"params": {"limit": 50}}),
+    ("GET /customers/{id} page", 25, "get", lambda s: f"/customers/{random.choice(s['ids'])}",
+     lambda s: {"params": {"transactions_limit": 20}}),
+    ("GET /community/risk", 10, "get", "/community/risk", lambda s: {}),
+    ("GET /ai/intelligence", 10, "get", "/ai/intelligence", lambda s: {}),
+    ("POST /transactions/", 15, "post", "/transactions/", lambda s: {"json": {
+        "customer_id": random.choice(s["ids"]), "amount": 100, "type": "credit"}}),
+    ("POST /ai/message", 10, "post", "/ai/message", lambda s: {"json": {"customer_id": random.choice(s["ids"])}}),
+]
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], capture_output=True, text=True, check=True, cwd=cwd).stdout.strip()
+
+
+def default_baseline():
+    added = git("log", "--diff-filter=A", "--format=%H", "-1", "--", "benchmarks/async_db.py")
+    return f"{added}^" if added else None
+
+
+def seed(shops, customers):
+    from app.database import SessionLocal, engine, Base
+    from app import models
+    from benchmarks import synthetic
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(models.User).filter(~models.User.email.like(f"%@{synthetic.EMAIL_DOMAIN}")).first():
+            raise SystemExit("DATABASE_URL has real users in it — point it at a throwaway database")
+        if not db.query(models.User).first():
+            synthetic.generate(db, shops, customers, years=1)
+        return [email for (email,) in db.query(models.User.email).order_by(models.User.id)]
+    finally:
+        db.close()
+
+
+def start_server(backend_dir, env):
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(SERVER_PORT),
+                               "--log-level", "warning"], cwd=backend_dir, env=env)
+    for _ in range(120):
+        if server.poll() is not None:
+            raise SystemExit(f"server in {backend_dir} exited with {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{SERVER_PORT}/").status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise SystemExit(f"server in {backend_dir} didn't come up")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def log_in(http, emails, password):
+    shops = []
+    for email in emails:
+        token = (await http.post("/auth/login", json={"email": email, "password": password})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ids = [c["id"] for c in (await http.get("/customers/", headers=headers, params={"limit": 200})).json()]
+        if ids:
+            shops.append({"headers": headers, "ids": ids})
+    return shops
+
+
+async def load(http, shops, concurrency, duration, warmup):
+    names = [name for name, *_ in MIX]
+    weights = [weight for _, weight, *_ in MIX]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            name, _, method, path, kwargs = random.choices(MIX, weights)[0]
+            shop = random.choice(shops)
+            sent = time.perf_counter()
+            try:
+                response = await http.request(method, path(shop) if callable(path) else path,
+                                              headers=shop["headers"], **kwargs(shop))
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if sent >= measure_from:
+                samples[name].append((time.perf_counter() - sent) * 1000)
+                errors[name] += not ok
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    every = [ms for name in names for ms in samples[name]]
+    summary = lambda ms: {"p50_ms": round(percentile(ms, 0.5), 1), "p99_ms": round(percentile(ms, 0.99), 1)} if ms else {}
+    return {
+        "requests": len(every),
+        "rps": round(len(every) / duration, 1),
+        "errors": sum(errors.values()),
+        **summary(every),
+        "endpoints": {name: {"requests": len(samples[name]), "errors": errors[name], **summary(samples[name])}
+                      for name in names},
+    }
+
+
+async def run_build(label, shops_emails, password, levels, duration, warmup, log=print):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{SERVER_PORT}", limits=limits, timeout=120) as http:
+        shops = await log_in(http, shops_emails, password)
+        results = {}
+        for concurrency in levels:
+            result = await load(http, shops, concurrency, duration, warmup)
+            results[str(concurrency)] = result
+            log(f"  {label:5s} c={concurrency:<4d} {result['rps']:8.1f} req/s   p50 {result.get('p50_ms', 0):8.1f} ms   "
+                f"p99 {result.get('p99_ms', 0):8.1f} ms   {result['errors']} errors")
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="git ref of the sync build (default: the commit before this script)")
+    parser.add_argument("--concurrency", type=int, action="append", help="concurrent clients, repeatable (default 10, 50, 200)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--shops", type=int, default=10, help="when seeding an empty database")
+    parser.add_argument("--customers", type=int, default=200, help="customers per shop, when seeding")
+    parser.add_argument("--llm-median", default="0.3", help="fake LLM latency in seconds")
+    parser.add_argument("--output", default="async_db_results.json")
+    args = parser.parse_args()
+
+    baseline = args.baseline or default_baseline()
+    if not baseline:
+        raise SystemExit("this script isn't committed yet — pass --baseline")
+    levels = args.concurrency or [10, 50, 200]
+
+    env = {
+        **os.environ,
+        "GITHUB_MODELS_BASE_URL": f"http://127.0.0.1:{LLM_PORT}",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{LLM_PORT}",
+        "GITHUB_TOKEN": os.environ.get("GITHUB_TOKEN", "fake"),
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "fake"),
+        # every request does its database and model work, so the two builds are compared on that
+        "ANALYTICS_CACHE_SIZE": "0",
+        "LLM_CACHE_SIZE": "0",
+        "LLM_CACHE_PATH": "",
+        "AI_JOB_WORKERS": "0",
+    }
+    os.environ.update(env)
+
+    from benchmarks import synthetic
+    emails = seed(args.shops, args.customers)
+
+    worktree = tempfile.mkdtemp(prefix="async-db-baseline-")
+    git("worktree", "add", "--detach", worktree, baseline)
+    llm = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(LLM_PORT),
+                            "--median", args.llm_median, "--jitter", "0.1", "--slow-rate", "0"])
+    report = {
+        "commit": git_commit(),
+        "baseline": git("rev-parse", "--short", baseline),
+        "created_at": datetime.utcnow().isoformat(),
+        "database": env["DATABASE_URL"].split(":", 1)[0],
+        "duration_s": args.duration,
+        "llm_median_s": float(args.llm_median),
+        "builds": {},
+    }
+    try:
+        for label, backend_dir in (("sync", os.path.join(worktree, "backend")), ("async", os.getcwd())):
+            print(f"\n{label} build ({backend_dir})")
+            server = start_server(backend_dir, env)
+            try:
+                report["builds"][label] = asyncio.run(run_build(
+                    label, emails, synthetic.PASSWORD, levels, args.duration, args.warmup))
+            finally:
+                stop_server(server)
+    finally:
+        llm.terminate()
+        git("worktree", "remove", "--force", worktree)
+        shutil.rmtree(worktree, ignore_errors=True)
+
+    print()
+    for level in map(str, levels):
+        sync, async_ = report["builds"]["sync"][level], report["builds"]["async"][level]
+        print(f"c={level:<4s} req/s {sync['rps']:8.1f} -> {async_['rps']:8.1f}   "
+              f"p99 {sync.get('p99_ms', 0):8.1f} -> {async_.get('p99_ms', 0):8.1f} ms")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nwrote {args.output}")
@@ -0,0 +1,70 @@
+# SQL statements and latency per authenticated request, with and without the
+# principal cache in routers/auth.py. Point DATABASE_URL at a throwaway local
+# database, then from backend/:
+#   python -m benchmarks.auth_principal --requests 500
+import argparse
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.main import app
+from app.routers import auth
+
+statements = []
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def run(client, headers, path, requests):
+    # (per-request ms, statements per request, users queries per request)
+    del statements[:]
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get(path, headers=headers).raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+    users_queries = sum(1 for s in statements if "FROM users" in s)
+    return samples, len(statements) / requests, users_queries / requests
+
+
+def report(label, result):
+    samples, per_request, users_per_request = result
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<22} median {statistics.median(samples):6.2f} ms   p95 {p95:6.2f} ms   "
+          f"{per_request:4.1f} statements/request ({users_per_request:.1f} on users)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--path", default="/customers/")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    db.add(models.User(name="Bench", shop_name="Bench Store", email="bench@bench.local",
+                       hashed_password=auth.hash_password("bench1234"), city="Lahore"))
+    db.commit()
+    db.close()
+
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={"email": "bench@bench.local", "password": "bench1234"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ttl = auth.PRINCIPAL_CACHE_TTL
+
+        auth.PRINCIPAL_CACHE_TTL = 0
+        auth.principal_cache.clear()
+        report("no principal cache", run(client, headers, args.path, args.requests))
+
+        auth.PRINCIPAL_CACHE_TTL = ttl or 300
+        report("principal cache", run(client, headers, args.path, args.requests))
@@ -0,0 +1,100 @@
+# Checks single-flight coalescing: concurrent identical requests should share one
+# computation and one model call. Fires --concurrency copies of each request at
+# once (as a double click or several open tabs would), with the LLM replaced by
+# benchmarks.fake_llm_server, and reads the leader/coalesced counts from
+# /ai/cache-stats. Point DATABASE_URL at an empty local database, then from backend/:
+#   python -m benchmarks.coalescing
+# Analytics builds take milliseconds, so some copies can miss the flight and run
+# their own build; that check only needs some to have joined. A model call takes
+# --llm-median seconds, so all copies of a reminder should share one call.
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_PORT = 9204
+
+failures = 0
+
+
+def check(ok, label):
+    global failures
+    failures += not ok
+    print(f"{'✅' if ok else '❌'} {label}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--customers", type=int, default=300)
+    parser.add_argument("--llm-median", default="0.5", help="fake LLM latency in seconds")
+    args = parser.parse_args()
+
+    os.environ["GITHUB_MODELS_BASE_URL"] = f"http://127.0.0.1:{LLM_PORT}"
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{LLM_PORT}"
+    os.environ.setdefault("GITHUB_TOKEN", "fake")
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ["LLM_CACHE_PATH"] = ""  # memory only, nothing left behind
+    os.environ["AI_JOB_WORKERS"] = "0"  # /ai/cashflow's insight job stays queued
+
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(LLM_PORT),
+                               "--median", args.llm_median, "--jitter", "0.1", "--slow-rate", "0"])
+    try:
+        from fastapi.testclient import TestClient
+        from app.database import SessionLocal, engine, Base
+        from app import models
+        from app.main import app
+        from app.services.cache import analytics_cache, llm_cache
+        from benchmarks import synthetic
+
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal()
+        if db.query(models.User).first():
+            raise SystemExit("DATABASE_URL must point at an empty database")
+        synthetic.generate(db, 1, args.customers, years=2, log=lambda line: None)
+        db.close()
+        time.sleep(2)  # fake LLM server start-up
+
+        # one event loop for the whole run; requests from several threads run concurrently on it
+        with TestClient(app) as client, ThreadPoolExecutor(args.concurrency) as pool:
+            token = client.post("/auth/login", json={"email": f"shop0@{synthetic.EMAIL_DOMAIN}",
+                                                      "password": synthetic.PASSWORD}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            ids = [c["id"] for c in client.get("/customers/", headers=headers, params={"limit": 5}).json()]
+
+            def burst(flight, calls):
+                # (all ok, responses, leaders, coalesced) for (method, path, kwargs) calls sent at once
+                before = client.get("/ai/cache-stats", headers=headers).json()["coalescing"][flight]
+                responses = list(pool.map(
+                    lambda call: getattr(client, call[0])(call[1], headers=headers, **call[2]), calls))
+                after = client.get("/ai/cache-stats", headers=headers).json()["coalescing"][flight]
+                ok = all(r.status_code == 200 for r in responses) and after["in_flight"] == 0
+                return ok, responses, after["leaders"] - before["leaders"], after["coalesced"] - before["coalesced"]
+
+            n = args.concurrency
+            for label, path in (("intelligence", "/ai/intelligence"), ("cashflow", "/ai/cashflow")):
+                analytics_cache.backend.clear()
+                ok, responses, leaders, coalesced = burst("analytics", [("get", path, {})] * n)
+                numbers = {r.json().get("total_outstanding", r.text) for r in responses}
+                check(ok and coalesced > 0 and leaders + coalesced == n and len(numbers) == 1,
+                      f"{n} x {label}: {leaders} builds, {coalesced} joined")
+
+            llm_cache.memory.clear()
+            same_reminder = ("post", "/ai/message", {"json": {"customer_id": ids[0]}})
+            ok, responses, leaders, coalesced = burst("llm", [same_reminder] * n)
+            check(ok and leaders == 1 and coalesced == n - 1 and len({r.json()["message"] for r in responses}) == 1,
+                  f"{n} x reminder for one customer: {leaders} model calls, {coalesced} joined")
+
+            llm_cache.memory.clear()
+            others = [("post", "/ai/message", {"json": {"customer_id": cid}}) for cid in ids[1:5]]
+            ok, responses, leaders, coalesced = burst("llm", others)
+            check(ok and leaders == len(others) and coalesced == 0,
+                  f"{len(others)} reminders for different customers: {leaders} model calls, {coalesced} joined")
+    finally:
+        server.terminate()
+
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
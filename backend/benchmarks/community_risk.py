@@ -0,0 +1,116 @@
+# Latency of GET /community/risk on a large synthetic city.
+# Point DATABASE_URL at a throwaway local database, then from backend/:
+#   python -m benchmarks.community_risk --shops 1000 --customers 100
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.routers.community import get_community_risk
+from app.services.aitbaar_score import calculate_score
+from app.services.ledger import rebuild_ledger_stats
+from app.services.community import rebuild_risk_index
+
+AREAS = [f"Area {i}" for i in range(20)]
+
+
+def generate(db, shops, customers_per_shop, txns_per_customer):
+    now = datetime.utcnow()
+    phones = [f"03{n:09d}" for n in range(int(shops * customers_per_shop * 0.6))]
+
+    db.execute(models.User.__table__.insert(), [
+        {"name": f"Shop {s}", "shop_name": f"Shop {s}", "email": f"shop{s}@bench.local",
+         "hashed_password": "x", "city": "Lahore"}
+        for s in range(shops)
+    ])
+    user_ids = [u for (u,) in db.query(models.User.id).order_by(models.User.id)]
+
+    customers = []
+    for owner_id in user_ids:
+        home = random.sample(AREAS, 3)
+        for _ in range(customers_per_shop):
+            customers.append({"name": "Customer", "phone": random.choice(phones),
+                              "area": random.choice(home), "owner_id": owner_id})
+    db.execute(models.Customer.__table__.insert(), customers)
+    customer_ids = [c for (c,) in db.query(models.Customer.id)]
+
+    txns = []
+    for customer_id in customer_ids:
+        for _ in range(txns_per_customer):
+            given = now - timedelta(days=random.randint(1, 365))
+            repaid = random.random() < 0.7
+            txns.append({"customer_id": customer_id, "amount": random.choice([500, 1000, 2000]),
+                         "type": "credit", "date_given": given, "is_repaid": repaid,
+                         "date_repaid": given + timedelta(days=random.randint(0, 40)) if repaid else None})
+            if len(txns) >= 50000:
+                db.execute(models.Transaction.__table__.insert(), txns)
+                txns = []
+    if txns:
+        db.execute(models.Transaction.__table__.insert(), txns)
+    db.commit()
+
+    rebuild_ledger_stats(db)
+    rebuild_risk_index(db)
+    db.commit()
+    return user_ids
+
+
+def scan_community_risk(db, user):
+    # the pre-index implementation: lazy-load and score every customer in the areas
+    my_areas = set(c.area for c in db.query(models.Customer).filter(models.Customer.owner_id == user.id))
+    phone_map = defaultdict(list)
+    for c in db.query(models.Customer).filter(
+        models.Customer.area.in_(my_areas), models.Customer.owner_id != user.id
+    ):
+        phone_map[c.phone].append((calculate_score(c.transactions),
+                                   sum(t.amount for t in c.transactions if not t.is_repaid)))
+    return phone_map
+
+
+def timed(fn, db, users):
+    samples = []
+    for user in users:
+        db.expire_all()
+        start = time.perf_counter()
+        fn(db, user)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<24} median {statistics.median(samples):8.1f} ms   p95 {p95:8.1f} ms   (n={len(samples)})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=1000)
+    parser.add_argument("--customers", type=int, default=100, help="customers per shop")
+    parser.add_argument("--transactions", type=int, default=5, help="transactions per customer")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--scan-requests", type=int, default=0,
+                        help="also time the old per-customer scan (very slow at full scale)")
+    args = parser.parse_args()
+
+    random.seed(42)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+
+    start = time.perf_counter()
+    user_ids = generate(db, args.shops, args.customers, args.transactions)
+    print(f"Generated {args.shops * args.customers} customers in {time.perf_counter() - start:.1f}s")
+
+    users = db.query(models.User).filter(
+        models.User.id.in_(random.sample(user_ids, args.requests))
+    ).all()
+    report("indexed /community/risk", timed(lambda db, u: get_community_risk(db=db, current_user=u), db, users))
+    if args.scan_requests:
+        report("full scan (old)", timed(scan_community_risk, db, users[:args.scan_requests]))
+    db.close()
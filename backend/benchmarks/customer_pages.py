@@ -0,0 +1,73 @@
+# Checks GET /customers/ paging: walking the X-Next-Cursor pages must give the
+# same customers, in the same order, as the unpaged list, for every sort and
+# order. The shop includes customers the keyset has to handle specially: no
+# name, no created_at and no activity (NULL sort values). Some start without a
+# ledger stats row, as in a database from before the stats table, and must be
+# listed once app.migrate has run.
+# Point DATABASE_URL at an empty local database, then from backend/:
+#   python -m benchmarks.customer_pages
+import argparse
+import os
+import sys
+
+os.environ.setdefault("AI_JOB_WORKERS", "0")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.migrate import customers_without_stats, upgrade
+from app.main import app
+from app.routers.customers import SORTS
+from benchmarks import synthetic
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=40)
+    parser.add_argument("--page", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    synthetic.generate(db, 1, args.customers, years=1, log=lambda line: None)
+    c, s = models.Customer, models.CustomerLedgerStats
+    ids = [i for (i,) in db.query(c.id).order_by(c.id)]
+    db.query(s).filter(s.customer_id.in_(ids[4:9])).delete(synchronize_session=False)
+    db.commit()
+    upgrade()
+    failures = 0
+    missing = customers_without_stats()
+    failures += bool(missing)
+    print(f"{'❌' if missing else '✅'} migrate left {missing} customers without a stats row")
+    db.execute(update(c).where(c.id.in_(ids[:6])).values(name=None, created_at=None))
+    db.execute(update(s).where(s.customer_id.in_(ids[:4])).values(last_activity=None))
+    db.commit()
+    db.close()
+
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={"email": f"shop0@{synthetic.EMAIL_DOMAIN}",
+                                                  "password": synthetic.PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for sort in SORTS:
+            for order in ("asc", "desc"):
+                params = {"sort": sort, "order": order}
+                everyone = [row["id"] for row in client.get("/customers/", headers=headers, params=params).json()]
+                paged, cursor, pages = [], None, 0
+                while pages <= len(ids):
+                    response = client.get("/customers/", headers=headers,
+                                          params={**params, "limit": args.page, **({"cursor": cursor} if cursor else {})})
+                    paged += [row["id"] for row in response.json()]
+                    pages += 1
+                    cursor = response.headers.get("X-Next-Cursor")
+                    if not cursor:
+                        break
+                ok = paged == everyone and sorted(everyone) == ids
+                failures += not ok
+                print(f"{'✅' if ok else '❌'} {sort:14s} {order:4s} {len(paged):3d}/{len(ids)} customers "
+                      f"in {pages} pages")
+
+    print(f"\n{engine.dialect.name}: {failures} orders differ" if failures else f"\n{engine.dialect.name}: all orders match")
+    sys.exit(1 if failures else 0)
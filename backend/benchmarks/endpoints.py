@@ -0,0 +1,236 @@
+# Latency of every API endpoint at several data sizes, with the LLM replaced by
+# benchmarks.fake_llm_server. For each scale the database is wiped and filled by
+# benchmarks.synthetic, then each endpoint is called --requests times as one shop;
+# caches are cleared before an endpoint's first call, so first_ms is the cold
+# path and the percentiles are mostly warm. Results go to JSON so runs on two
+# commits can be compared. Point DATABASE_URL at a throwaway local database (its
+# tables are dropped), then from backend/:
+#   python -m benchmarks.endpoints --scale 20x100x1 --scale 100x300x2 --output before.json
+#   python -m benchmarks.endpoints --compare before.json after.json
+# A scale is SHOPSxCUSTOMERSxYEARS. --compare exits 1 if an endpoint's p50 got
+# slower by more than --threshold percent (and at least 2 ms).
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+LLM_PORT = 9201
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "") if commit else None
+    except OSError:
+        return None
+
+
+def parse_scale(text):
+    shops, customers, years = text.lower().split("x")
+    return int(shops), int(customers), float(years)
+
+
+def endpoints(ctx):
+    """
+    (name, method, path, request kwargs) for every route. path and kwargs may be
+    callables of the request number, for endpoints that use something up once.
+    """
+    cid = ctx["customer_id"]
+    import_csv = "phone,name,area,amount,date_given\n" + "\n".join(
+        f"039{n:08d},Imported {n},Area 0,500,2024-01-01" for n in range(100)
+    )
+    return [
+        ("POST /auth/login", "post", "/auth/login", {"json": {"email": ctx["email"], "password": ctx["password"]}}),
+        ("POST /auth/register", "post", "/auth/register", lambda i: {"json": {
+            "name": "Bench", "shop_name": "Bench", "email": f"register{i}@bench.local", "password": "bench1234"}}),
+        ("GET /auth/me", "get", "/auth/me", {}),
+        ("GET /customers/", "get", "/customers/", {}),
+        ("GET /customers/ page", "get", "/customers/", {"params": {"limit": 50}}),
+        ("GET /customers/ page by name", "get", "/customers/", {"params": {"limit": 50, "sort": "name"}}),
+        ("GET /customers/ overdue", "get", "/customers/", {"params": {"limit": 50, "overdue": "true"}}),
+        ("GET /customers/{id}", "get", f"/customers/{cid}", {}),
+        ("GET /customers/{id} page", "get", f"/customers/{cid}", {"params": {"transactions_limit": 20}}),
+        ("GET /customers/{id}/transactions", "get", f"/customers/{cid}/transactions", {"params": {"limit": 50}}),
+        ("POST /customers/", "post", "/customers/", lambda i: {"json": {
+            "name": f"Bench {i}", "phone": f"0388{i:07d}", "area": "Area 0"}}),
+        ("DELETE /customers/{id}", "delete", lambda i: f"/customers/{ctx['deletable'][i]}", {}),
+        ("POST /transactions/", "post", "/transactions/", {"json": {"customer_id": cid, "amount": 500, "type": "credit"}}),
+        ("PATCH /transactions/repaid/{id}", "patch", lambda i: f"/transactions/repaid/{ctx['unpaid'][i]}", {}),
+        ("GET /community/risk", "get", "/community/risk", {}),
+        ("GET /ai/cashflow", "get", "/ai/cashflow", {}),
+        ("GET /ai/cashflow/stream", "get", "/ai/cashflow/stream", {}),
+        ("GET /ai/intelligence", "get", "/ai/intelligence", {}),
+        ("POST /ai/message", "post", "/ai/message", {"json": {"customer_id": cid}}),
+        ("POST /ai/messages/batch", "post", "/ai/messages/batch", {"json": {"customer_ids": ctx["batch"]}}),
+        ("POST /ai/message/job", "post", "/ai/message/job", {"json": {"customer_id": cid}}),
+        ("GET /ai/jobs/stats", "get", "/ai/jobs/stats", {}),
+        ("GET /ai/jobs/{id}", "get", f"/ai/jobs/{ctx['job_id']}", {}),
+        ("GET /ai/cache-stats", "get", "/ai/cache-stats", {}),
+        ("GET /ai/providers", "get", "/ai/providers", {}),
+        ("POST /imports/ledger", "post", "/imports/ledger", {"content": import_csv.encode()}),
+        ("GET /imports/", "get", "/imports/", {}),
+        ("GET /imports/{id}", "get", f"/imports/{ctx['import_id']}", {}),
+        ("GET /export/ledger", "get", "/export/ledger", {}),
+        ("GET /test-db", "get", "/test-db", {}),
+    ]
+
+
+def run_scale(client, scale, requests, log=print):
+    # imported here: the app reads the fake LLM's address from the environment at import
+    from app.database import SessionLocal, engine, async_engine, Base
+    from app.profiling import count_queries
+    from app import models
+    from app.routers.auth import principal_cache
+    from app.services.cache import analytics_cache, llm_cache
+    from benchmarks import synthetic
+
+    shops, customers, years = scale
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    client.portal.call(async_engine.dispose)  # pooled connections may hold plans for the old tables
+    principal_cache.clear()
+    db = SessionLocal()
+    log(f"\n{shops} shops x {customers} customers x {years:g} years")
+    data = synthetic.generate(db, shops, customers, years, log=log)
+    db.close()
+
+    email, password = f"shop0@{synthetic.EMAIL_DOMAIN}", synthetic.PASSWORD
+    token = client.post("/auth/login", json={"email": email, "password": password}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    # things the endpoints use up or look up, made before anything is timed
+    ids = [c["id"] for c in client.get("/customers/", headers=headers).json()]
+    ctx = {"email": email, "password": password, "customer_id": ids[0], "batch": ids[:5]}
+    ctx["deletable"] = [client.post("/customers/", headers=headers, json={
+        "name": "Doomed", "phone": f"0377{i:07d}", "area": "Area 0"}).json()["id"] for i in range(requests)]
+    victim = ids[1]
+    for _ in range(requests):
+        client.post("/transactions/", headers=headers, json={"customer_id": victim, "amount": 100, "type": "credit"})
+    ctx["unpaid"] = [t["id"] for t in client.get(f"/customers/{victim}/transactions", headers=headers,
+                                                    params={"status": "unpaid", "limit": 200}).json()]
+    ctx["job_id"] = client.post("/ai/message/job", headers=headers, json={"customer_id": ids[2]}).json()["id"]
+    ctx["import_id"] = client.post("/imports/ledger", headers=headers,
+                                   content=b"phone,amount\n03990000000,100\n").json()["import_id"]
+
+    results = {}
+    with count_queries() as statements:
+        for name, method, path, kwargs in endpoints(ctx):
+            analytics_cache.backend.clear()
+            llm_cache.memory.clear()
+            samples, statuses = [], Counter()
+            del statements[:]
+            for i in range(requests):
+                p = path(i) if callable(path) else path
+                kw = kwargs(i) if callable(kwargs) else kwargs
+                start = time.perf_counter()
+                response = getattr(client, method)(p, headers=headers, **kw)
+                samples.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+            status = statuses.most_common(1)[0][0]
+            results[name] = {
+                "requests": requests,
+                "status": status,
+                "first_ms": round(samples[0], 2),
+                "p50_ms": round(statistics.median(samples), 2),
+                "p95_ms": round(percentile(samples, 0.95), 2),
+                "max_ms": round(max(samples), 2),
+                "mean_ms": round(statistics.mean(samples), 2),
+                "statements": round(len(statements) / requests, 1),
+            }
+            flag = "" if status < 400 else f"   (HTTP {status})"
+            log(f"  {name:34s} first {samples[0]:8.1f} ms   p50 {results[name]['p50_ms']:8.1f} ms   "
+                f"p95 {results[name]['p95_ms']:8.1f} ms   {results[name]['statements']:6.1f} stmts{flag}")
+    return {"scale": f"{shops}x{customers}x{years:g}", "data": data, "endpoints": results}
+
+
+def compare(before_path, after_path, threshold):
+    before, after = json.load(open(before_path)), json.load(open(after_path))
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    old_scales = {s["scale"]: s for s in before["scales"]}
+    regressions = 0
+    for scale in after["scales"]:
+        old = old_scales.get(scale["scale"])
+        if not old:
+            continue
+        print(f"\n{scale['scale']}")
+        for name, new in scale["endpoints"].items():
+            prev = old["endpoints"].get(name)
+            if not prev:
+                print(f"  {name:34s} new")
+                continue
+            change = (new["p50_ms"] - prev["p50_ms"]) / prev["p50_ms"] * 100 if prev["p50_ms"] else 0
+            worse = change > threshold and new["p50_ms"] - prev["p50_ms"] >= 2
+            regressions += worse
+            print(f"  {name:34s} p50 {prev['p50_ms']:8.1f} -> {new['p50_ms']:8.1f} ms ({change:+6.0f}%)   "
+                  f"stmts {prev['statements']:6.1f} -> {new['statements']:6.1f}{'   ❌ slower' if worse else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", action="append", help="SHOPSxCUSTOMERSxYEARS, repeatable (default 20x100x1, 100x300x2)")
+    parser.add_argument("--requests", type=int, default=20, help="calls per endpoint")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--llm-median", default="0.05", help="fake LLM latency in seconds")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=20, help="percent slower that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    os.environ["GITHUB_MODELS_BASE_URL"] = f"http://127.0.0.1:{LLM_PORT}"
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{LLM_PORT}"
+    os.environ.setdefault("GITHUB_TOKEN", "fake")
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ["LLM_CACHE_PATH"] = ""  # memory only, nothing left behind between runs
+    os.environ["AI_JOB_WORKERS"] = "0"  # only requests touch the database
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(LLM_PORT),
+                               "--median", args.llm_median, "--jitter", "0.1", "--slow-rate", "0"])
+    try:
+        from fastapi.testclient import TestClient
+        from app.database import SessionLocal, engine
+        from app import models
+        from app.main import app
+        from benchmarks import synthetic
+
+        db = SessionLocal()
+        try:
+            foreign = db.query(models.User).filter(~models.User.email.like(f"%@{synthetic.EMAIL_DOMAIN}"),
+                                                   ~models.User.email.like("%@bench.local")).first()
+        except Exception:
+            foreign = None  # no tables yet
+        db.close()
+        if foreign:
+            raise SystemExit("DATABASE_URL has real users in it — point it at a throwaway database")
+
+        time.sleep(2)  # fake LLM server start-up
+        # one event loop for the whole run: pooled async connections belong to the loop that opened them
+        with TestClient(app) as client:
+            report = {
+                "commit": git_commit(),
+                "created_at": datetime.utcnow().isoformat(),
+                "database": engine.dialect.name,
+                "python": platform.python_version(),
+                "requests": args.requests,
+                "llm_median_s": float(args.llm_median),
+                "scales": [run_scale(client, parse_scale(s), args.requests)
+                           for s in (args.scale or ["20x100x1", "100x300x2"])],
+            }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"\nwrote {args.output}")
+    finally:
+        server.terminate()
@@ -0,0 +1,73 @@
+# OpenAI/Groq-compatible stand-in for offline latency testing of the AI layer.
+#   python -m benchmarks.fake_llm_server --port 9001 --median 0.8 --slow-rate 0.05
+# then point GITHUB_MODELS_BASE_URL=http://127.0.0.1:9001 (or GROQ_BASE_URL) at it.
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(median, jitter, slow_rate, slow_factor, fail_rate):
+    app = FastAPI()
+
+    @app.post("/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        delay = median * random.lognormvariate(0, jitter)
+        if random.random() < slow_rate:
+            delay *= slow_factor
+        await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return JSONResponse({"error": {"message": "fake upstream error"}}, status_code=500)
+        text = f"Fake reply after {delay:.2f}s"
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(body.get("model"), text), media_type="text/event-stream")
+        return {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    async def stream_chunks(model, text):
+        # the first chunk arrives after the latency above, the rest one word at a time
+        for word in text.split(" "):
+            chunk = {
+                "id": "fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0.02)
+        yield "data: [DONE]\n\n"
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--median", type=float, default=0.8, help="median latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.25, help="lognormal sigma")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of requests that stall")
+    parser.add_argument("--slow-factor", type=float, default=10)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.median, args.jitter, args.slow_rate, args.slow_factor, args.fail_rate),
+        host="127.0.0.1", port=args.port, log_level="warning"
+    )
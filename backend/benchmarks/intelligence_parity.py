@@ -0,0 +1,223 @@
+# Parity check for /ai/intelligence: the grouped-SQL build must return exactly what
+# the implementation it replaced returned, which loaded every transaction of the
+# shop and aggregated in Python (kept below as reference_intelligence). Seeds
+# benchmarks.synthetic shops plus one shop of edge cases: equal date_given, repayments
+# dated before the credit, delays a second short of a day, missing dates, credit
+# given on the 29th-31st. Then it compares the two per shop. Run it against both
+# dialects; point DATABASE_URL at an empty local database, then from backend/:
+#   python -m benchmarks.intelligence_parity
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.routers.ai import build_business_intelligence
+from app.routers.auth import principal_for
+from app.services.ledger import get_ledger_summaries, summary_score, rebuild_ledger_stats
+from benchmarks import synthetic
+
+
+def reference_intelligence(db, owner_id):
+    # the pre-SQL implementation, unchanged apart from taking the owner id
+    summaries = get_ledger_summaries(db, models.Customer.owner_id == owner_id)
+    customers = [c for c, _ in summaries]
+
+    all_transactions = []
+    for c in customers:
+        for t in c.transactions:
+            all_transactions.append({
+                "customer_id": c.id, "customer_name": c.name, "amount": t.amount, "type": t.type,
+                "date_given": t.date_given, "date_repaid": t.date_repaid, "is_repaid": t.is_repaid
+            })
+
+    week_delays = defaultdict(list)
+    for t in all_transactions:
+        if t["is_repaid"] and t["date_repaid"] and t["date_given"]:
+            week_num = min(4, (t["date_given"].day - 1) // 7 + 1)
+            week_delays[week_num].append((t["date_repaid"] - t["date_given"]).days)
+
+    week_labels = {1: "Week 1", 2: "Week 2", 3: "Week 3", 4: "Week 4"}
+    payment_by_week = []
+    for week in [1, 2, 3, 4]:
+        delays = week_delays.get(week, [])
+        avg = round(sum(delays) / len(delays), 1) if delays else None
+        payment_by_week.append({"week": week_labels[week], "avgDays": avg, "transactions": len(delays)})
+
+    filled = [w for w in payment_by_week if w["avgDays"] is not None]
+    worst_week = max(filled, key=lambda x: x["avgDays"]) if filled else None
+    best_week = min(filled, key=lambda x: x["avgDays"]) if filled else None
+
+    monthly_data = defaultdict(lambda: {"total": 0, "collected": 0, "count": 0})
+    for t in all_transactions:
+        if t["date_given"]:
+            month_key = t["date_given"].strftime("%b")
+            monthly_data[month_key]["total"] += t["amount"]
+            monthly_data[month_key]["count"] += 1
+            if t["is_repaid"]:
+                monthly_data[month_key]["collected"] += t["amount"]
+
+    month_order = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    monthly_pattern = []
+    for month in month_order:
+        if month in monthly_data:
+            d = monthly_data[month]
+            rate = round((d["collected"] / d["total"]) * 100) if d["total"] > 0 else 0
+            monthly_pattern.append({"month": month, "collectionRate": rate, "totalAmount": d["total"],
+                                    "collectedAmount": d["collected"], "transactions": d["count"]})
+
+    danger_months = [m for m in monthly_pattern if m["collectionRate"] < 60]
+
+    customer_trends = []
+    for c, summary in summaries:
+        paid = sorted([t for t in c.transactions if t.is_repaid and t.date_repaid and t.date_given],
+                      key=lambda t: t.date_given)
+        if len(paid) < 4:
+            trend, trend_label = "insufficient_data", "New Customer"
+        else:
+            half = len(paid) // 2
+            early, recent = paid[:half], paid[half:]
+            early_avg = sum((t.date_repaid - t.date_given).days for t in early) / len(early)
+            recent_avg = sum((t.date_repaid - t.date_given).days for t in recent) / len(recent)
+            if recent_avg > early_avg * 1.5:
+                trend, trend_label = "deteriorating", "↓ Deteriorating"
+            elif recent_avg < early_avg * 0.8:
+                trend, trend_label = "improving", "↑ Improving"
+            else:
+                trend, trend_label = "stable", "→ Stable"
+        customer_trends.append({"id": c.id, "name": c.name, "trend": trend, "trend_label": trend_label,
+                                "aitbaar_score": summary_score(summary), "total_due": summary["total_due"]})
+
+    trend_order = {"deteriorating": 0, "stable": 1, "improving": 2, "insufficient_data": 3}
+    customer_trends.sort(key=lambda x: trend_order.get(x["trend"], 3))
+
+    today = datetime.utcnow()
+    current_week_label = week_labels[min(4, (today.day - 1) // 7 + 1)]
+    current_week_data = next((w for w in payment_by_week if w["week"] == current_week_label), None)
+    forecast = None
+    if current_week_data and current_week_data["avgDays"] is not None:
+        avg = current_week_data["avgDays"]
+        if avg > 20:
+            forecast = {"type": "warning",
+                        "english": f"Historically your slowest collection week. Average payment delay is {avg} days. Avoid extending new credit.",
+                        "action": "Focus on collecting from existing overdue customers only."}
+        elif avg < 10:
+            forecast = {"type": "positive",
+                        "english": f"Historically your best collection week. Average delay is only {avg} days.",
+                        "action": "Follow up aggressively on all overdue accounts now."}
+        else:
+            forecast = {"type": "neutral",
+                        "english": f"Average collection week. Expected delay around {avg} days.",
+                        "action": "Routine follow-ups. Monitor at-risk customers closely."}
+
+    cashflow_history = []
+    for i in range(5, -1, -1):
+        month_offset = today.month - i
+        year = today.year
+        if month_offset <= 0:
+            month_offset += 12
+            year -= 1
+        label = datetime(year, month_offset, 1).strftime("%b")
+        month_txns = [t for t in all_transactions if t["date_given"] and
+                      t["date_given"].month == month_offset and t["date_given"].year == year]
+        collected = sum(t["amount"] for t in month_txns if t["is_repaid"])
+        outstanding = sum(t["amount"] for t in month_txns if not t["is_repaid"])
+        cashflow_history.append({"month": label, "collected": collected, "outstanding": outstanding})
+
+    return {
+        "payment_by_week": payment_by_week, "monthly_pattern": monthly_pattern,
+        "customer_trends": customer_trends, "danger_months": danger_months,
+        "worst_week": worst_week, "best_week": best_week, "this_week_forecast": forecast,
+        "cashflow_history": cashflow_history, "current_week": current_week_label,
+        "total_customers": len(customers),
+        "deteriorating_count": len([c for c in customer_trends if c["trend"] == "deteriorating"]),
+        "improving_count": len([c for c in customer_trends if c["trend"] == "improving"])
+    }
+
+
+def add_edge_shop(db):
+    owner = models.User(name="Edge", shop_name="Edge", email="edge@bench.local", hashed_password="-")
+    db.add(owner)
+    db.flush()
+    now = datetime.utcnow().replace(microsecond=0)
+    base = datetime(now.year - 1, 1, 31, 12)
+    ledgers = {
+        # five repayments given at the same moment: the halves split on the id
+        "same moment": [(base, timedelta(days=d)) for d in (1, 2, 30, 40, 50)],
+        "repaid early": [(base + timedelta(days=10 * i), timedelta(days=-2, hours=3)) for i in range(4)]
+                        + [(base + timedelta(days=50), timedelta(days=9))] * 2,
+        "sub-day delays": [(base + timedelta(days=29 + 30 * i), timedelta(hours=23, minutes=59, seconds=59))
+                           for i in range(6)],
+        "slowing down": [(now - timedelta(days=160 - 25 * i), timedelta(days=2 + 12 * i)) for i in range(6)],
+        "missing dates": [(None, None), (base, None)],
+    }
+    for name, ledger in ledgers.items():
+        customer = models.Customer(name=name, phone=f"0399{len(name):07d}", area="Edge", owner_id=owner.id)
+        db.add(customer)
+        db.flush()
+        for n, (given, delay) in enumerate(ledger):
+            repaid = given is not None and delay is not None
+            db.add(models.Transaction(customer_id=customer.id, amount=100.0 + n, type="credit", is_repaid=repaid,
+                                      date_given=given, date_repaid=given + delay if repaid else None))
+        # an unpaid credit this month, so cashflow_history has outstanding money
+        db.add(models.Transaction(customer_id=customer.id, amount=55.5, type="credit", is_repaid=False,
+                                  date_given=now - timedelta(hours=1)))
+    db.flush()
+    rebuild_ledger_stats(db)
+    db.commit()
+
+
+def normalized(result):
+    # JSON as the endpoint sends it, with float sums rounded past the order they were added in
+    def walk(value):
+        if isinstance(value, float):
+            return round(value, 6)
+        if isinstance(value, dict):
+            return {k: walk(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [walk(v) for v in value]
+        return value
+    return walk(json.loads(json.dumps(result)))
+
+
+def differences(expected, got, path=""):
+    if isinstance(expected, dict) and isinstance(got, dict):
+        for key in sorted(set(expected) | set(got)):
+            yield from differences(expected.get(key), got.get(key), f"{path}.{key}")
+    elif isinstance(expected, list) and isinstance(got, list) and len(expected) == len(got):
+        for i, (e, g) in enumerate(zip(expected, got)):
+            yield from differences(e, g, f"{path}[{i}]")
+    elif expected != got:
+        yield f"{path}: expected {expected!r}, got {got!r}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=3)
+    parser.add_argument("--customers", type=int, default=80, help="customers per synthetic shop")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    synthetic.generate(db, args.shops, args.customers, years=2, log=lambda line: None)
+    add_edge_shop(db)
+
+    failures = 0
+    for owner in db.query(models.User).order_by(models.User.id):
+        expected = normalized(reference_intelligence(db, owner.id))
+        got = normalized(build_business_intelligence(db, principal_for(owner)))
+        diffs = list(differences(expected, got))
+        failures += bool(diffs)
+        trends = {t["trend"] for t in got["customer_trends"]}
+        print(f"{'❌' if diffs else '✅'} {owner.email:28s} {got['total_customers']:4d} customers, "
+              f"trends {', '.join(sorted(trends))}")
+        for line in diffs[:10]:
+            print(f"   {line}")
+    db.close()
+
+    print(f"\n{engine.dialect.name}: {failures} shops differ" if failures else f"\n{engine.dialect.name}: all shops match")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,101 @@
+# Memory use of the streaming ledger export over a large shop. Exits non-zero if
+# the process grows by more than --max-growth-mb while streaming, so it doubles
+# as the flat-memory check. Point DATABASE_URL at a throwaway local database,
+# then from backend/:
+#   python -m benchmarks.ledger_export --customers 10000 --transactions 100
+import argparse
+import os
+import random
+import resource
+import time
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.services.export import export_rows, gzipped
+
+
+def rss_mb():
+    # current resident set size; falls back to the peak where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate(db, customers, txns_per_customer):
+    db.add(models.User(name="Bench", shop_name="Bench Store", email="bench@bench.local",
+                       hashed_password="x", city="Lahore"))
+    db.commit()
+    owner_id = db.query(models.User.id).scalar()
+    db.execute(models.Customer.__table__.insert(), [
+        {"name": f"Customer {n}", "phone": f"03{n:09d}", "area": f"Area {n % 20}", "owner_id": owner_id}
+        for n in range(customers)
+    ])
+    customer_ids = [c for (c,) in db.query(models.Customer.id)]
+    now = datetime.utcnow()
+    txns = []
+    for customer_id in customer_ids:
+        for _ in range(txns_per_customer):
+            given = now - timedelta(days=random.randint(1, 3 * 365))
+            repaid = random.random() < 0.7
+            txns.append({"customer_id": customer_id, "amount": random.choice([500, 1000, 2000]),
+                         "type": "credit", "date_given": given, "is_repaid": repaid,
+                         "date_repaid": given + timedelta(days=random.randint(0, 40)) if repaid else None})
+            if len(txns) >= 50000:
+                db.execute(models.Transaction.__table__.insert(), txns)
+                txns = []
+    if txns:
+        db.execute(models.Transaction.__table__.insert(), txns)
+    db.commit()
+    return owner_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--transactions", type=int, default=100, help="transactions per customer")
+    parser.add_argument("--format", default="csv", choices=["csv", "ndjson"])
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--max-growth-mb", type=float, default=25)
+    args = parser.parse_args()
+
+    random.seed(42)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    owner_id = db.query(models.User.id).filter(models.User.email == "bench@bench.local").scalar()
+    if owner_id is None:
+        if db.query(models.User).first():
+            raise SystemExit("DATABASE_URL must point at an empty database (or one made by this script)")
+        start = time.perf_counter()
+        owner_id = generate(db, args.customers, args.transactions)
+        print(f"Generated {args.customers * args.transactions} transactions in {time.perf_counter() - start:.1f}s")
+    db.close()
+
+    chunks = export_rows(owner_id, args.format)
+    if args.gzip:
+        chunks = gzipped(chunks)
+
+    start = last_report = time.perf_counter()
+    baseline = None
+    peak = 0
+    sent = 0
+    for i, chunk in enumerate(chunks):
+        sent += len(chunk)
+        if i == 10:
+            baseline = peak = rss_mb()  # after the cursor and buffers are warmed up
+        elif baseline is not None and i % 100 == 0:
+            peak = max(peak, rss_mb())
+        if time.perf_counter() - last_report >= 2:
+            last_report = time.perf_counter()
+            print(f"  {sent / 2 ** 20:8.1f} MB sent   rss {rss_mb():6.1f} MB")
+    seconds = time.perf_counter() - start
+    peak = max(peak, rss_mb())
+    baseline = baseline or peak
+
+    growth = peak - baseline
+    print(f"exported {sent / 2 ** 20:.1f} MB in {seconds:.1f}s, rss {baseline:.1f} MB after warm-up, "
+          f"peak {peak:.1f} MB (+{growth:.1f} MB)")
+    if growth > args.max_growth_mb:
+        raise SystemExit(f"memory grew by {growth:.1f} MB while streaming (limit {args.max_growth_mb} MB)")
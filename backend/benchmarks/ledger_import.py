@@ -0,0 +1,68 @@
+# Bulk import (POST /imports/ledger) vs one POST /transactions/ per entry.
+# Point DATABASE_URL at a throwaway local database, then from backend/:
+#   python -m benchmarks.ledger_import --rows 50000 --customers 2000
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.main import app
+from app.routers import auth
+
+
+def make_csv(rows, customers):
+    now = datetime.utcnow()
+    lines = ["phone,name,area,amount,type,date_given,date_repaid,is_repaid"]
+    for _ in range(rows):
+        n = random.randrange(customers)
+        given = now - timedelta(days=random.randint(1, 3 * 365))
+        repaid = given + timedelta(days=random.randint(0, 60)) if random.random() < 0.7 else None
+        # some names as spreadsheets export a cell with a line break and quotes in it
+        name = f'"Customer {n}\n(""{n % 7}"" bazaar, row 2)"' if n % 50 == 0 else f"Customer {n}"
+        lines.append(f"03{n:09d},{name},Area {n % 20},{random.choice([500, 1000, 2000])},credit,"
+                     f"{given.isoformat()},{repaid.isoformat() if repaid else ''},{'yes' if repaid else 'no'}")
+    return "\n".join(lines).encode()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--single-requests", type=int, default=500,
+                        help="per-row POST /transactions/ calls to time for the comparison")
+    args = parser.parse_args()
+
+    random.seed(42)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    db.add(models.User(name="Bench", shop_name="Bench Store", email="bench@bench.local",
+                       hashed_password=auth.hash_password("bench1234"), city="Lahore"))
+    db.commit()
+    db.close()
+    body = make_csv(args.rows, args.customers)
+
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={"email": "bench@bench.local", "password": "bench1234"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        start = time.perf_counter()
+        result = client.post("/imports/ledger", content=body, headers=headers).json()
+        seconds = time.perf_counter() - start
+        print(f"bulk import       {args.rows} rows in {seconds:6.1f}s   {args.rows / seconds:8.0f} rows/s   "
+              f"({result['customers_created']} customers, {result['rows_done']} rows, {result['error_count']} errors)")
+
+        customer_ids = [c["id"] for c in client.get("/customers/", headers=headers).json()]
+        start = time.perf_counter()
+        for _ in range(args.single_requests):
+            client.post("/transactions/", json={"customer_id": random.choice(customer_ids), "amount": 500,
+                                                "type": "credit"}, headers=headers)
+        seconds = time.perf_counter() - start
+        rate = args.single_requests / seconds
+        print(f"POST /transactions/  {args.single_requests} rows in {seconds:6.1f}s   {rate:8.0f} rows/s   "
+              f"(~{args.rows / rate / 60:.0f} min for {args.rows})")
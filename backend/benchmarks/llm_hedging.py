@@ -0,0 +1,79 @@
+# Tail latency of the AI provider chain against two local fake providers,
+# with and without hedging. From backend/:
+#   python -m benchmarks.llm_hedging --requests 200
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def start_server(port, *extra):
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(port), *extra]
+    )
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run(llm_providers, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            text = await llm_providers.complete(f"benchmark prompt {i}", 50)
+            samples.append(time.perf_counter() - start)
+            failures += text is None
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return samples, failures
+
+
+async def compare(llm_providers, requests, concurrency):
+    for hedging in (False, True):
+        llm_providers.LLM_HEDGING = hedging
+        # warm-up so the hedge delay comes from observed p95, not the default
+        await run(llm_providers, 40, concurrency)
+        samples, failures = await run(llm_providers, requests, concurrency)
+        print(f"{'hedged' if hedging else 'sequential':<11}"
+              f" p50 {statistics.median(samples):6.2f}s"
+              f"  p95 {percentile(samples, 0.95):6.2f}s"
+              f"  p99 {percentile(samples, 0.99):6.2f}s"
+              f"  failures {failures}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--primary-median", default="0.8")
+    parser.add_argument("--primary-slow-rate", default="0.04")
+    parser.add_argument("--secondary-median", default="0.5")
+    parser.add_argument("--secondary-slow-rate", default="0.02")
+    args = parser.parse_args()
+
+    os.environ["GITHUB_MODELS_BASE_URL"] = "http://127.0.0.1:9101"
+    os.environ["GROQ_BASE_URL"] = "http://127.0.0.1:9102"
+    os.environ.setdefault("GITHUB_TOKEN", "fake")
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+
+    servers = [
+        start_server(9101, "--median", args.primary_median, "--slow-rate", args.primary_slow_rate),
+        start_server(9102, "--median", args.secondary_median, "--slow-rate", args.secondary_slow_rate),
+    ]
+    try:
+        time.sleep(2)
+        from app.services import llm_providers
+        asyncio.run(compare(llm_providers, args.requests, args.concurrency))
+    finally:
+        for server in servers:
+            server.terminate()
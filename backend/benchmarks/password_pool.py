@@ -0,0 +1,96 @@
+# Logins per second per core: bcrypt inline on a request-style threadpool (before)
+# vs the password process pool (after), plus how long a trivial request waits for
+# a threadpool slot while the burst is running. From backend/:
+#   python -m benchmarks.password_pool --logins 200 --rounds 12
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def report(label, logins, seconds, probe_waits):
+    cores = os.cpu_count() or 1
+    rate = logins / seconds
+    probe = f"   other request waits median {statistics.median(probe_waits) * 1000:6.1f} ms" if probe_waits else ""
+    print(f"{label:<26} {rate:7.1f} logins/s   {rate / cores:7.1f} per core{probe}")
+
+
+async def probe(executor, stop, waits):
+    # what a cheap sync endpoint would see: time until the threadpool runs it
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = time.perf_counter()
+        await loop.run_in_executor(executor, lambda: None)
+        waits.append(time.perf_counter() - start)
+        await asyncio.sleep(0.02)
+
+
+async def inline(passwords, hashed, logins, threads):
+    executor = ThreadPoolExecutor(threads)  # anyio's default request threadpool is 40
+    loop = asyncio.get_running_loop()
+    stop, waits = asyncio.Event(), []
+    prober = asyncio.ensure_future(probe(executor, stop, waits))
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        loop.run_in_executor(executor, passwords.verify_and_update, "bench1234", hashed)
+        for _ in range(logins)
+    ))
+    seconds = time.perf_counter() - start
+    stop.set()
+    await prober
+    executor.shutdown()
+    return seconds, waits
+
+
+async def pooled(passwords, hashed, logins, threads):
+    executor = ThreadPoolExecutor(threads)
+    stop, waits = asyncio.Event(), []
+    await passwords.start_pool()
+    prober = asyncio.ensure_future(probe(executor, stop, waits))
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        while True:
+            try:
+                return await passwords.verify_password_async("bench1234", hashed)
+            except passwords.PasswordPoolBusy:
+                # a client retrying after its 503
+                rejected += 1
+                await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    seconds = time.perf_counter() - start
+    stop.set()
+    await prober
+    executor.shutdown()
+    passwords.stop_pool()
+    return seconds, waits, rejected
+
+
+async def main(args):
+    from app.services import passwords
+    hashed = passwords.hash_password("bench1234")
+    print(f"bcrypt cost {passwords.BCRYPT_ROUNDS}, {os.cpu_count()} cores, {passwords.PASSWORD_WORKERS} pool workers, "
+          f"queue limit {passwords.QUEUE_LIMIT}")
+
+    seconds, waits = await inline(passwords, hashed, args.logins, args.threads)
+    report("inline on threadpool", args.logins, seconds, waits)
+
+    seconds, waits, rejected = await pooled(passwords, hashed, args.logins, args.threads)
+    report("process pool", args.logins, seconds, waits)
+    print(f"{'':<26} {rejected} attempts got 503 and retried")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost (default BCRYPT_ROUNDS)")
+    parser.add_argument("--threads", type=int, default=40, help="request threadpool size")
+    args = parser.parse_args()
+    if args.rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    asyncio.run(main(args))
@@ -0,0 +1,112 @@
+# Query budgets per endpoint, so an N+1 load (a query per customer or per
+# transaction) fails the build instead of turning up as a slow page in
+# production. Seeds a throwaway database through benchmarks.synthetic with
+# enough customers that a per-row query blows any budget. Then it calls each
+# endpoint with cold caches and fails if it runs more statements than BUDGETS
+# allows. Point DATABASE_URL at an empty local database, then from backend/:
+#   python -m benchmarks.query_counts
+# When an endpoint legitimately needs another query, raise its budget here in
+# the same commit.
+import argparse
+import os
+import sys
+
+os.environ.setdefault("AI_JOB_WORKERS", "0")  # only requests run SQL, no background jobs
+
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.main import app
+from app.profiling import assert_max_queries
+from app.services.cache import analytics_cache
+from benchmarks import synthetic
+
+# endpoint -> most statements one call may run, with cold caches
+BUDGETS = {
+    "customers": 1,
+    "customers page": 1,
+    "customers overdue": 1,
+    "customer detail": 3,
+    "customer history": 2,
+    "add customer": 7,  # includes the shop's first ledger version row
+    "delete customer": 9,
+    "add transaction": 8,
+    "mark repaid": 11,
+    "community risk": 3,
+    "cashflow": 6,
+    "intelligence": 6,
+    "queue reminder": 4,
+    "job stats": 2,
+    "import": 16,
+    "imports": 1,
+    "export": 1,
+}
+
+
+def endpoint_calls(customer_id, other_customer_id, unpaid_id):
+    # (name, method, path, kwargs) — only endpoints that don't call an LLM
+    csv = "phone,name,area,amount\n03999000001,New One,Model Town,500\n03999000002,,,700\n"
+    return [
+        ("customers", "get", "/customers/", {}),
+        ("customers page", "get", "/customers/", {"params": {"limit": 50, "sort": "name"}}),
+        ("customers overdue", "get", "/customers/", {"params": {"limit": 50, "overdue": "true"}}),
+        ("customer detail", "get", f"/customers/{customer_id}", {}),
+        ("customer history", "get", f"/customers/{customer_id}/transactions", {"params": {"limit": 50}}),
+        ("add customer", "post", "/customers/", {"json": {"name": "Budget", "phone": "03998000001", "area": "Model Town"}}),
+        ("delete customer", "delete", f"/customers/{other_customer_id}", {}),
+        ("add transaction", "post", "/transactions/", {"json": {"customer_id": customer_id, "amount": 300, "type": "credit"}}),
+        ("mark repaid", "patch", f"/transactions/repaid/{unpaid_id}", {}),
+        ("community risk", "get", "/community/risk", {}),
+        ("cashflow", "get", "/ai/cashflow", {}),
+        ("intelligence", "get", "/ai/intelligence", {}),
+        ("queue reminder", "post", "/ai/message/job", {"json": {"customer_id": customer_id}}),
+        ("job stats", "get", "/ai/jobs/stats", {}),
+        ("import", "post", "/imports/ledger", {"content": csv.encode()}),
+        ("imports", "get", "/imports/", {}),
+        ("export", "get", "/export/ledger", {}),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--customers", type=int, default=60, help="customers per shop")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    synthetic.generate(db, args.shops, args.customers, years=1, log=lambda line: None)
+    owner_id = db.query(models.User.id).filter(models.User.email == f"shop0@{synthetic.EMAIL_DOMAIN}").scalar()
+    customer_id, other_customer_id = [c for (c,) in db.query(models.Customer.id).filter(
+        models.Customer.owner_id == owner_id).order_by(models.Customer.id).limit(2)]
+    unpaid_id = db.query(models.Transaction.id).join(models.Customer).filter(
+        models.Customer.owner_id == owner_id, models.Customer.id != other_customer_id, models.UNPAID).limit(1).scalar()
+    db.close()
+
+    # one event loop for the whole run: pooled async connections belong to the loop that opened them
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={"email": f"shop0@{synthetic.EMAIL_DOMAIN}",
+                                                  "password": synthetic.PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        client.get("/customers/", headers=headers)  # the token's principal is cached from here on
+
+        failures = 0
+        for name, method, path, kwargs in endpoint_calls(customer_id, other_customer_id, unpaid_id):
+            analytics_cache.backend.clear()
+            try:
+                with assert_max_queries(BUDGETS[name], name) as statements:
+                    response = getattr(client, method)(path, headers=headers, **kwargs)
+            except AssertionError as e:
+                failures += 1
+                print(f"❌ {e}")
+                continue
+            if response.status_code >= 400:
+                raise SystemExit(f"{name}: {method.upper()} {path} returned {response.status_code}: {response.text}")
+            print(f"✅ {name:20s} {len(statements):3d} queries (budget {BUDGETS[name]})")
+
+    if failures:
+        print(f"\n{failures} endpoints over their query budget")
+        sys.exit(1)
@@ -0,0 +1,207 @@
+# Query-plan regression check for the ledger schema. Seeds a throwaway database
+# with a few busy shops, calls every endpoint that reads or writes the ledger
+# while recording the SQL it runs, then EXPLAINs each statement and fails if one
+# reads a whole ledger table instead of going through an index. Postgres plans
+# are taken with enable_seqscan off, so a Seq Scan there means no index fits.
+# Point DATABASE_URL at an empty local SQLite or Postgres database, then from backend/:
+#   python -m benchmarks.query_plans
+#   python -m benchmarks.query_plans --verbose   print every plan
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+os.environ.setdefault("AI_JOB_WORKERS", "0")  # only requests run SQL, no background jobs
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine, async_engine, Base
+from app import models
+from app.main import app
+from app.services.community import rebuild_risk_index
+from app.services.ledger import rebuild_ledger_stats
+from app.services.passwords import hash_password
+
+# tables a full scan of which grows with the whole deployment, not one shop
+WATCHED = {"customers", "transactions", "customer_ledger_stats", "community_risk_index",
+           "ai_jobs", "ledger_imports"}
+# (endpoint, table) scans that are expected, with why they stay cheap
+ALLOWED = {
+    ("job stats", "ai_jobs"): "queue-wide counts by status; finished jobs expire after AI_JOB_RESULT_TTL",
+}
+AREAS = [f"Area {n}" for n in range(40)]
+
+statements = []
+
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+        statements.append((statement, parameters))
+
+
+# routers run on the async engine, the export stream on the sync one
+event.listen(engine, "before_cursor_execute", record_statement)
+event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+
+
+def seed(db, shops, customers, transactions):
+    now = datetime.utcnow()
+    hashed = hash_password("plans1234")
+    for n in range(shops):
+        db.add(models.User(name=f"Shop {n}", shop_name=f"Shop {n}", email=f"shop{n}@plans.local",
+                           hashed_password=hashed, city="Lahore"))
+    db.commit()
+    owners = [u for (u,) in db.query(models.User.id).order_by(models.User.id)]
+    rows = []
+    for owner_id in owners:
+        # each shop serves a couple of areas; phones repeat within an area, so
+        # neighbouring shops share customers the way the community index expects
+        areas = random.sample(range(len(AREAS)), 2)
+        for n in range(customers):
+            area = random.choice(areas)
+            rows.append({"name": f"Customer {n}", "phone": f"03{area:03d}{random.randrange(customers * 2):06d}",
+                         "area": AREAS[area], "owner_id": owner_id, "created_at": now - timedelta(days=400)})
+    db.execute(models.Customer.__table__.insert(), rows)
+    txns = []
+    for (customer_id,) in db.query(models.Customer.id):
+        for _ in range(transactions):
+            given = now - timedelta(days=random.randint(1, 365))
+            repaid = random.random() < 0.7
+            txns.append({"customer_id": customer_id, "amount": random.choice([500, 1000, 2000]), "type": "credit",
+                         "date_given": given, "is_repaid": repaid,
+                         "date_repaid": given + timedelta(days=random.randint(0, 40)) if repaid else None})
+    db.execute(models.Transaction.__table__.insert(), txns)
+    rebuild_ledger_stats(db)
+    rebuild_risk_index(db)
+    db.commit()
+    db.connection().exec_driver_sql("ANALYZE")  # planner statistics, as a live database has
+    db.commit()
+    return owners
+
+
+def endpoint_calls(client, headers, customer_id, other_customer_id):
+    # (name, method, path, kwargs) — only endpoints that don't call an LLM
+    csv = "phone,name,area,amount\n03999000001,New One,Area 1,500\n03001000003,,,700\n"
+    return [
+        ("customers by due", "get", "/customers/", {}),
+        ("customers page by due", "get", "/customers/", {"params": {"limit": 50}}),
+        ("customers page by score", "get", "/customers/", {"params": {"limit": 50, "sort": "score"}}),
+        ("customers page by name", "get", "/customers/", {"params": {"limit": 50, "sort": "name"}}),
+        ("customers page by activity", "get", "/customers/", {"params": {"limit": 50, "sort": "last_activity"}}),
+        ("customers overdue", "get", "/customers/", {"params": {"limit": 50, "overdue": "true", "area": "Area 1"}}),
+        ("customer detail", "get", f"/customers/{customer_id}", {}),
+        ("customer detail page", "get", f"/customers/{customer_id}", {"params": {"transactions_limit": 20}}),
+        ("customer history", "get", f"/customers/{customer_id}/transactions", {"params": {"limit": 5}}),
+        ("customer unpaid history", "get", f"/customers/{customer_id}/transactions",
+         {"params": {"limit": 5, "status": "unpaid"}}),
+        ("add transaction", "post", "/transactions/", {"json": {"customer_id": customer_id, "amount": 300, "type": "credit"}}),
+        ("add customer", "post", "/customers/", {"json": {"name": "Plan", "phone": "03001000001", "area": "Area 1"}}),
+        ("delete customer", "delete", f"/customers/{other_customer_id}", {}),
+        ("community risk", "get", "/community/risk", {}),
+        ("cashflow", "get", "/ai/cashflow", {}),
+        ("intelligence", "get", "/ai/intelligence", {}),
+        ("queue reminder", "post", "/ai/message/job", {"json": {"customer_id": customer_id}}),
+        ("job stats", "get", "/ai/jobs/stats", {}),
+        ("import", "post", "/imports/ledger", {"content": csv.encode()}),
+        ("imports", "get", "/imports/", {}),
+        ("export", "get", "/export/ledger", {"params": {"customer_id": customer_id}}),
+    ]
+
+
+def explain(statement, parameters):
+    # [(table, plan line)] for every step of the plan; table is None for non-scan steps
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            steps = []
+            for row in cursor.fetchall():
+                # SEARCH is an index lookup; SCAN reads the whole table (or walks a whole index)
+                words = row[-1].split()
+                steps.append((words[1] if words[0] == "SCAN" else None, row[-1]))
+            return steps
+        cursor.execute("SET enable_seqscan = off")
+        if isinstance(parameters, dict):
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        else:
+            # asyncpg's numbered $1, $2 parameters: psycopg2 can't bind them, so plan the
+            # statement prepared and pass the values to EXECUTE
+            cursor.execute("DEALLOCATE ALL")  # the pooled connection kept the last one
+            cursor.execute("PREPARE plan_check AS " + statement)
+            values = ", ".join(["%s"] * len(parameters))
+            cursor.execute(f"EXPLAIN (FORMAT JSON) EXECUTE plan_check{f' ({values})' if parameters else ''}",
+                           tuple(parameters))
+        plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        steps = []
+
+        def walk(node, depth):
+            relation = node.get("Relation Name")
+            line = "  " * depth + node["Node Type"] + (f" on {relation}" if relation else "")
+            if node.get("Index Name"):
+                line += f" using {node['Index Name']}"
+            steps.append((relation if node["Node Type"] == "Seq Scan" else None, line))
+            for child in node.get("Plans", []):
+                walk(child, depth + 1)
+
+        walk(plan[0]["Plan"], 0)
+        return steps
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=100, help="customers per shop")
+    parser.add_argument("--transactions", type=int, default=8, help="transactions per customer")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(42)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    owners = seed(db, args.shops, args.customers, args.transactions)
+    customer_id, other_customer_id = [c for (c,) in db.query(models.Customer.id).filter(
+        models.Customer.owner_id == owners[0]).order_by(models.Customer.id).limit(2)]
+    db.close()
+
+    # one event loop for the whole run: pooled async connections belong to the loop that opened them
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={"email": "shop0@plans.local", "password": "plans1234"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        failures = 0
+        for name, method, path, kwargs in endpoint_calls(client, headers, customer_id, other_customer_id):
+            del statements[:]
+            response = getattr(client, method)(path, headers=headers, **kwargs)
+            if response.status_code >= 400:
+                raise SystemExit(f"{name}: {method.upper()} {path} returned {response.status_code}: {response.text}")
+            scans = []
+            for statement, parameters in list(statements):
+                steps = explain(statement, parameters)
+                scans += [table for table, _ in steps if table in WATCHED]
+                if args.verbose:
+                    print(f"\n[{name}] {' '.join(statement.split())[:160]}")
+                    for _, line in steps:
+                        print(f"    {line}")
+            allowed = {t for t in scans if (name, t) in ALLOWED}
+            scans = set(scans) - allowed
+            if scans:
+                failures += 1
+                print(f"❌ {name:28s} full scan of {', '.join(sorted(scans))}")
+            else:
+                print(f"✅ {name:28s} {len(statements)} statements, all indexed")
+            for table in sorted(allowed):
+                print(f"   allowed scan of {table}: {ALLOWED[(name, table)]}")
+
+    if failures:
+        print(f"\n{failures} endpoints scan whole tables — run with --verbose for the plans")
+        sys.exit(1)
@@ -0,0 +1,188 @@
+# Checks the read-replica routing end to end on two local SQLite databases, with
+# replication simulated by copying the primary over the replica (sqlite3's backup
+# API). It needs no database of its own: both files go in a temporary directory.
+# From backend/:
+#   python -m benchmarks.read_replica
+# It checks that:
+# - read endpoints run their queries on the replica;
+# - writes run on the primary; queueing an AI job doesn't count as one;
+# - right after a write, that shop's reads go to the primary and see the write,
+#   while another shop still reads the replica;
+# - a worker that didn't take the write (its memory of writes cleared) sends the
+#   shop to the primary only when the request carries the response's X-Last-Write
+#   marker, and ignores a marker that is tampered with or belongs to another shop;
+# - a worker that remembers an older write of the shop still follows the
+#   marker's newer one;
+# - once the sticky window has passed, the shop reads the replica again, which
+#   only has the write after the next copy.
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+directory = tempfile.mkdtemp(prefix="read-replica-")
+PRIMARY = os.path.join(directory, "primary.db")
+REPLICA = os.path.join(directory, "replica.db")
+STICKY_SECONDS = 1.0
+
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY}"
+os.environ["DATABASE_READ_URL"] = f"sqlite:///{REPLICA}"
+os.environ.pop("DATABASE_ASYNC_URL", None)
+os.environ.pop("DATABASE_READ_ASYNC_URL", None)
+os.environ["DATABASE_READ_STICKY_SECONDS"] = str(STICKY_SECONDS)
+os.environ["AI_JOB_WORKERS"] = "0"  # only requests run SQL, no background jobs
+os.environ["ANALYTICS_CACHE_SIZE"] = "0"  # every read goes to a database
+os.environ.setdefault("GITHUB_TOKEN", "fake")
+os.environ.setdefault("GROQ_API_KEY", "fake")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import SessionLocal, POOLS, _last_write
+from app import models
+from app.main import app
+from benchmarks import synthetic
+
+
+def replicate():
+    source, target = sqlite3.connect(PRIMARY), sqlite3.connect(REPLICA)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+class StatementLog:
+    """Which pools the statements inside the block ran on."""
+
+    def __init__(self):
+        self.pools = []
+        self.listeners = []
+
+    def __enter__(self):
+        for name, engine in POOLS.items():
+            def record(*args, name=name):
+                self.pools.append(name)
+            event.listen(engine, "before_cursor_execute", record)
+            self.listeners.append((engine, record))
+        return self
+
+    def __exit__(self, *exc):
+        for engine, record in self.listeners:
+            event.remove(engine, "before_cursor_execute", record)
+
+    @property
+    def on_replica(self):
+        return sum(name in ("read", "async_read") for name in self.pools)
+
+    @property
+    def on_primary(self):
+        return len(self.pools) - self.on_replica
+
+
+failures = 0
+
+
+def check(ok, label):
+    global failures
+    failures += not ok
+    print(f"{'✅' if ok else '❌'} {label}")
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    synthetic.generate(db, shops=2, customers=20, years=1, log=lambda line: None)
+    shop0_id = db.query(models.User.id).filter(models.User.email == f"shop0@{synthetic.EMAIL_DOMAIN}").scalar()
+    db.close()
+    replicate()
+
+    with TestClient(app) as client:
+        def log_in(shop):
+            token = client.post("/auth/login", json={"email": f"shop{shop}@{synthetic.EMAIL_DOMAIN}",
+                                                     "password": synthetic.PASSWORD}).json()["access_token"]
+            return {"Authorization": f"Bearer {token}"}
+
+        shop0, shop1 = log_in(0), log_in(1)
+        # caches both principals, so auth adds no primary queries below
+        client.get("/customers/", headers=shop1, params={"limit": 1})
+        customer_id = client.get("/customers/", headers=shop0, params={"limit": 1}).json()[0]["id"]
+
+        def total_due(headers=shop0):
+            return client.get(f"/customers/{customer_id}", headers=headers).json()["total_due"]
+
+        time.sleep(STICKY_SECONDS)  # logging in doesn't commit, but start clean anyway
+        for label, path in (("customers", "/customers/"), ("customer detail", f"/customers/{customer_id}"),
+                            ("community risk", "/community/risk"), ("intelligence", "/ai/intelligence"),
+                            ("cashflow numbers", "/ai/cashflow")):
+            with StatementLog() as log:
+                response = client.get(path, headers=shop0)
+            # /ai/cashflow also queues its insight job, which has to be on the primary
+            expect_primary = path == "/ai/cashflow"
+            check(response.status_code == 200 and log.on_replica > 0 and (expect_primary or not log.on_primary),
+                  f"{label}: {log.on_replica} statements on the replica, {log.on_primary} on the primary")
+        # queueing the job isn't a write of shop0's data
+        with StatementLog() as log:
+            client.get("/customers/", headers=shop0)
+        check("X-Last-Write" not in response.headers and log.on_replica and not log.on_primary,
+              "after /ai/cashflow queued its job, shop0 still reads the replica")
+
+        before = total_due()
+        with StatementLog() as log:
+            response = client.post("/transactions/", headers=shop0,
+                                   json={"customer_id": customer_id, "amount": 700, "type": "credit"})
+        check(response.status_code < 400 and log.on_primary > 0 and not log.on_replica,
+              f"add transaction: {log.on_primary} statements on the primary, {log.on_replica} on the replica")
+
+        marker = response.headers.get("X-Last-Write")
+        with StatementLog() as log:
+            after = total_due()
+        check(after == before + 700 and not log.on_replica,
+              f"right after the write, shop0 reads the primary and sees it ({before} -> {after})")
+
+        # as another worker would see it: no memory of the write, only what the request carries
+        saved = dict(_last_write)
+        _last_write.clear()
+        check(marker is not None, f"the write's response carries an X-Last-Write marker ({marker})")
+        with StatementLog() as log:
+            echoed = total_due({**shop0, "X-Last-Write": marker or ""})
+        check(echoed == before + 700 and not log.on_replica,
+              f"another worker sends shop0 with the marker to the primary ({echoed})")
+        # that worker took an earlier write of shop0's, now past the window
+        _last_write[shop0_id] = time.time() - 2 * STICKY_SECONDS
+        with StatementLog() as log:
+            echoed = total_due({**shop0, "X-Last-Write": marker or ""})
+        check(echoed == before + 700 and not log.on_replica,
+              f"an older write remembered there doesn't hide the marker's newer one ({echoed})")
+        _last_write.clear()
+        with StatementLog() as log:
+            unmarked = total_due()
+        check(unmarked == before and log.on_replica and not log.on_primary,
+              f"another worker sends shop0 without the marker to the replica ({unmarked})")
+        forged = (marker or "0.0")[:-1] + ("0" if (marker or "x")[-1] != "0" else "1")
+        with StatementLog() as log:
+            client.get("/customers/", headers={**shop0, "X-Last-Write": forged})
+        check(log.on_replica and not log.on_primary, "a tampered marker is ignored")
+        with StatementLog() as log:
+            client.get("/customers/", headers={**shop1, "X-Last-Write": marker or ""})
+        check(log.on_replica and not log.on_primary, "shop0's marker doesn't send shop1 to the primary")
+        _last_write.update(saved)
+
+        with StatementLog() as log:
+            client.get("/customers/", headers=shop1)
+        check(log.on_replica > 0 and not log.on_primary,
+              f"shop1 still reads the replica: {log.on_replica} statements there, {log.on_primary} on the primary")
+
+        time.sleep(STICKY_SECONDS)
+        with StatementLog() as log:
+            stale = total_due({**shop0, "X-Last-Write": marker or ""})
+        check(stale == before and log.on_replica > 0 and not log.on_primary,
+              f"after {STICKY_SECONDS:g}s shop0 reads the replica again, marker or not, which lags ({stale})")
+
+        replicate()
+        check(total_due() == before + 700, "after the next copy the replica has the write")
+
+    if failures:
+        print(f"\n{failures} checks failed")
+        sys.exit(1)
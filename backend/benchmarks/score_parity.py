@@ -0,0 +1,122 @@
+# Property check: every way the app computes an Aitbaar score must give exactly
+# what calculate_score gives for the customer's transactions. Random ledgers
+# include missing dates, repayments dated before the credit, delays a second
+# short of a whole day, and averages right on the 7/14/30 day boundaries.
+#   python -m benchmarks.score_parity --cases 5000
+# checks scores_from_stats_batch (used by /community/risk) in memory. With
+#   DATABASE_URL=<empty local database> python -m benchmarks.score_parity --database
+# it also writes the ledgers and checks the stats rows built in SQL
+# (rebuild_ledger_stats, which /customers and the analytics read), so run it on
+# SQLite and on Postgres.
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.services.aitbaar_score import calculate_score, score_from_stats, scores_from_stats_batch
+
+START = datetime(2024, 1, 1)
+# delays that sit on the boundaries of timedelta.days and of the score bands
+EDGE_DELAYS = [timedelta(days=d) for d in (0, 7, 14, 30, 31)] + [
+    timedelta(days=7, seconds=-1), timedelta(days=14, seconds=1), timedelta(seconds=-1),
+    timedelta(days=-3, hours=5), timedelta(hours=23, minutes=59, seconds=59)]
+
+
+def random_ledger(rng):
+    rows = []
+    for _ in range(rng.choice([0, 1, 2, 3, 4, 5, 8, 13, 40])):
+        given = START + timedelta(days=rng.randint(0, 700), seconds=rng.randint(0, 86399))
+        is_repaid = rng.random() < 0.7
+        delay = rng.choice(EDGE_DELAYS) if rng.random() < 0.3 else timedelta(
+            days=rng.randint(-2, 90), seconds=rng.randint(0, 86399))
+        rows.append(SimpleNamespace(
+            amount=float(rng.randint(1, 500) * 10),
+            is_repaid=is_repaid,
+            date_given=None if rng.random() < 0.05 else given,
+            date_repaid=(given + delay) if is_repaid and rng.random() > 0.05 else None,
+        ))
+    return rows
+
+
+def python_stats(rows):
+    # (total, repaid_count, delay_sum, delay_count) the way calculate_score counts them
+    delays = [(t.date_repaid - t.date_given).days for t in rows if t.is_repaid and t.date_repaid and t.date_given]
+    return len(rows), sum(1 for t in rows if t.is_repaid), sum(delays), len(delays)
+
+
+def check_batch(ledgers):
+    stats = [python_stats(rows) for rows in ledgers]
+    expected = [calculate_score(rows) for rows in ledgers]
+    batch = scores_from_stats_batch(*zip(*stats)).tolist()
+    return [f"ledger {i}: calculate_score {e}, batch {b}, stats {s}"
+            for i, (e, b, s) in enumerate(zip(expected, batch, stats)) if e != b or score_from_stats(*s) != e]
+
+
+def check_database(ledgers):
+    from app.database import SessionLocal, engine, Base
+    from app import models
+    from app.services.ledger import rebuild_ledger_stats
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    owner = models.User(name="Parity", shop_name="Parity", email="parity@bench.local", hashed_password="-")
+    db.add(owner)
+    db.flush()
+    customers = []
+    for i, rows in enumerate(ledgers):
+        customer = models.Customer(name=f"Parity {i}", phone=f"0300{i:07d}", area="Parity", owner_id=owner.id)
+        db.add(customer)
+        customers.append(customer)
+    db.flush()
+    db.bulk_insert_mappings(models.Transaction, [
+        {"customer_id": customer.id, "amount": t.amount, "type": "credit", "is_repaid": t.is_repaid,
+         "date_given": t.date_given, "date_repaid": t.date_repaid}
+        for customer, rows in zip(customers, ledgers) for t in rows
+    ])
+    rebuild_ledger_stats(db)
+    db.commit()
+
+    stored = {s.customer_id: s for s in db.query(models.CustomerLedgerStats)}
+    mismatches = []
+    for i, (customer, rows) in enumerate(zip(customers, ledgers)):
+        s = stored[customer.id]
+        got = (s.total_count, s.repaid_count, s.delay_sum, s.delay_count)
+        if got != python_stats(rows) or s.score != calculate_score(rows):
+            mismatches.append(f"ledger {i}: expected {python_stats(rows)} score {calculate_score(rows)}, "
+                              f"stats row {got} score {s.score}")
+    db.close()
+    return engine.dialect.name, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=5000, help="random ledgers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database", action="store_true", help="also check the SQL-built stats rows")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ledgers = [random_ledger(rng) for _ in range(args.cases)]
+    # one repayment at each edge delay, so the average sits right on a band boundary
+    ledgers += [[SimpleNamespace(amount=10.0, is_repaid=True, date_given=START, date_repaid=START + delay)]
+                for delay in EDGE_DELAYS]
+
+    failures = 0
+    mismatches = check_batch(ledgers)
+    failures += bool(mismatches)
+    print(f"{'❌' if mismatches else '✅'} scores_from_stats_batch: {len(ledgers) - len(mismatches)}/{len(ledgers)} match")
+    for line in mismatches[:10]:
+        print(f"   {line}")
+
+    if args.database:
+        dialect, mismatches = check_database(ledgers)
+        failures += bool(mismatches)
+        print(f"{'❌' if mismatches else '✅'} ledger stats built in {dialect}: "
+              f"{len(ledgers) - len(mismatches)}/{len(ledgers)} match")
+        for line in mismatches[:10]:
+            print(f"   {line}")
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,150 @@
+# Synthetic city for load tests: N shops with M customers each, years of credit
+# history, drawn from the same behaviour profiles as app/seed.py. Customers of
+# shops that share an area overlap (same phone, same habits at every shop), the
+# way the community risk index sees real borrowers. Everything goes in with bulk
+# inserts, then ledger stats and the risk index are rebuilt once.
+# Point DATABASE_URL at an empty local database, then from backend/:
+#   python -m benchmarks.synthetic --shops 200 --customers 500 --years 3
+# Every shop logs in as shop<n>@synthetic.local with password "bench1234".
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.seed import BEHAVIORS, LAHORE_AREAS
+from app.services.community import rebuild_risk_index
+from app.services.ledger import rebuild_ledger_stats
+from app.services.passwords import hash_password
+
+PASSWORD = "bench1234"
+EMAIL_DOMAIN = "synthetic.local"
+# share of borrowers with each profile
+BEHAVIOR_MIX = {"excellent": 0.15, "good": 0.30, "average": 0.30, "risky": 0.15, "bad": 0.10}
+AMOUNTS = [500, 800, 1000, 1500, 2000, 2500, 3000]
+FIRST_NAMES = ["Imran", "Salman", "Usman", "Bilal", "Kamran", "Tariq", "Zeeshan", "Hassan", "Rizwan",
+               "Asif", "Waseem", "Junaid", "Ahmed", "Farhan", "Naveed", "Adeel", "Shahid", "Yasir"]
+LAST_NAMES = ["Butt", "Raza", "Ali", "Sheikh", "Iqbal", "Mehmood", "Malik", "Nawaz", "Ch",
+              "Javed", "Akram", "Khan", "Siddiqui", "Ahmed", "Qureshi", "Mirza"]
+INSERT_BATCH = 50000
+
+
+def areas_for(shops):
+    # about five shops per area, the named Lahore areas first
+    count = max(len(LAHORE_AREAS), shops // 5)
+    return LAHORE_AREAS + [f"Area {n}" for n in range(len(LAHORE_AREAS), count)]
+
+
+def _person(rng, phone):
+    behavior = rng.choices(list(BEHAVIOR_MIX), weights=list(BEHAVIOR_MIX.values()))[0]
+    return {"name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "phone": phone, "behavior": behavior}
+
+
+def _transactions(rng, customer_id, behavior, now, years, per_year):
+    # credit spread over the years; repaid after the profile's delay, unless the
+    # borrower defaults or the repayment date hasn't come yet
+    profile = BEHAVIORS[behavior]
+    for _ in range(max(1, round(rng.gauss(per_year * years, per_year * years / 4)))):
+        given = now - timedelta(days=rng.uniform(0, 365 * years))
+        repaid = None
+        if rng.random() > profile["default_chance"]:
+            repaid = given + timedelta(days=max(0, profile["delay"] + rng.randint(-2, 5)), hours=rng.randint(0, 12))
+            if repaid > now:
+                repaid = None
+        yield {"customer_id": customer_id, "amount": rng.choice(AMOUNTS), "type": "credit",
+               "date_given": given, "date_repaid": repaid, "is_repaid": repaid is not None}
+
+
+def generate(db, shops, customers, years=2, per_year=12, overlap=0.2, seed=42, log=print):
+    """
+    Fill an empty database. overlap is the share of a shop's customers who are
+    also customers of other shops in the same area. Returns counts and timings.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    areas = areas_for(shops)
+
+    hashed = hash_password(PASSWORD)
+    db.execute(models.User.__table__.insert(), [
+        {"name": f"Shopkeeper {n}", "shop_name": f"Shop {n}", "email": f"shop{n}@{EMAIL_DOMAIN}",
+         "hashed_password": hashed, "city": "Lahore"}
+        for n in range(shops)
+    ])
+    owners = [u for (u,) in db.query(models.User.id).order_by(models.User.id)]
+
+    shared = {area: [] for area in areas}  # borrowers known to several shops, per area
+    next_phone = 0
+    rows, behaviors = [], {}
+
+    def new_person():
+        nonlocal next_phone
+        next_phone += 1
+        return _person(rng, f"03{next_phone:09d}")
+
+    for owner_id in owners:
+        home = rng.sample(areas, rng.randint(1, 2))
+        phones = set()
+        while len(phones) < customers:
+            area = rng.choice(home)
+            if rng.random() < overlap:
+                pool = shared[area]
+                if pool and rng.random() < 2 / 3:  # each shared borrower ends up at about three shops
+                    person = rng.choice(pool)
+                else:
+                    person = new_person()
+                    pool.append(person)
+            else:
+                person = new_person()
+            if person["phone"] in phones:
+                continue  # one customer per phone within a shop, draw again
+            phones.add(person["phone"])
+            rows.append({"name": person["name"], "phone": person["phone"], "area": area,
+                         "owner_id": owner_id, "created_at": now - timedelta(days=365 * years)})
+            behaviors[(owner_id, person["phone"])] = person["behavior"]
+    for i in range(0, len(rows), INSERT_BATCH):
+        db.execute(models.Customer.__table__.insert(), rows[i:i + INSERT_BATCH])
+    db.commit()
+    log(f"  {len(owners)} shops, {len(rows)} customers ({next_phone} distinct phones) "
+        f"in {time.perf_counter() - start:.1f}s")
+
+    c = models.Customer
+    txns, total = [], 0
+    for customer_id, owner_id, phone in db.query(c.id, c.owner_id, c.phone).order_by(c.id):
+        txns.extend(_transactions(rng, customer_id, behaviors[(owner_id, phone)], now, years, per_year))
+        if len(txns) >= INSERT_BATCH:
+            db.execute(models.Transaction.__table__.insert(), txns)
+            total += len(txns)
+            txns = []
+    if txns:
+        db.execute(models.Transaction.__table__.insert(), txns)
+        total += len(txns)
+    db.commit()
+    log(f"  {total} transactions in {time.perf_counter() - start:.1f}s")
+
+    rebuild_ledger_stats(db)
+    rebuild_risk_index(db)
+    db.commit()
+    seconds = time.perf_counter() - start
+    log(f"  ledger stats and risk index rebuilt, {seconds:.1f}s in all")
+    return {"shops": len(owners), "customers": len(rows), "phones": next_phone,
+            "transactions": total, "seconds": round(seconds, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=200, help="customers per shop")
+    parser.add_argument("--years", type=float, default=2, help="years of history")
+    parser.add_argument("--per-year", type=float, default=12, help="credit transactions per customer per year")
+    parser.add_argument("--overlap", type=float, default=0.2, help="share of customers shared with other shops")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(models.User).first():
+        raise SystemExit("DATABASE_URL must point at an empty database")
+    generate(db, args.shops, args.customers, args.years, args.per_year, args.overlap, args.seed)
+    db.close()
@@ -7,15 +7,23 @@ const api = axios.create({
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token')
   if (token) config.headers.Authorization = `Bearer ${token}`
+  // our last write, so whichever server worker answers reads it back, not a lagging replica
+  const lastWrite = localStorage.getItem('lastWrite')
+  if (lastWrite) config.headers['X-Last-Write'] = lastWrite
   return config
 })
 
 api.interceptors.response.use(
-  (res) => res,
+  (res) => {
+    const lastWrite = res.headers['x-last-write']
+    if (lastWrite) localStorage.setItem('lastWrite', lastWrite)
+    return res
+  },
   (err) => {
     if (err.response?.status === 401) {
       localStorage.removeItem('token')
       localStorage.removeItem('user')
+      localStorage.removeItem('lastWrite')
       window.location.href = '/login'
     }
     return Promise.reject(err)
@@ -0,0 +1,32 @@
+import api from './axiosClient'
+
+// Poll /ai/jobs/{id} until the background job has finished. Resolves with the
+// job (status "done" or "failed"), or null if cancelled or it took too long.
+export async function waitForJob(id, { interval = 2000, attempts = 30, isCancelled = () => false } = {}) {
+  for (let i = 0; i < attempts && !isCancelled(); i++) {
+    const { data } = await api.get(`/ai/jobs/${id}`)
+    if (data.status === 'done' || data.status === 'failed') return data
+    await new Promise((resolve) => setTimeout(resolve, interval))
+  }
+  return null
+}
+
+// Follow the cashflow insight job of a /ai/cashflow response while its insight
+// is pending or stale; onInsight gets the model's text once the job is done,
+// onEnd is called if it fails or takes too long. Returns the cleanup for useEffect
+export function followCashflowInsight(jobId, status, onInsight, onEnd) {
+  let cancelled = false
+  if (jobId && (status === 'pending' || status === 'stale')) {
+    waitForJob(jobId, { isCancelled: () => cancelled })
+      .then((job) => {
+        if (cancelled) return
+        if (job?.status === 'done') onInsight(job.result)
+        else onEnd()
+      })
+      .catch((err) => {
+        console.error(err)
+        if (!cancelled) onEnd()
+      })
+  }
+  return () => { cancelled = true }
+}
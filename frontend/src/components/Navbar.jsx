@@ -10,6 +10,7 @@ export default function Navbar() {
   function logout() {
     localStorage.removeItem('token')
     localStorage.removeItem('user')
+    localStorage.removeItem('lastWrite')
     navigate('/login')
   }
 
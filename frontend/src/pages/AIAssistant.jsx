@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react'
 import api from '../api/axiosClient'
+import { followCashflowInsight } from '../api/jobs'
 import robot from '../assets/robot.png'
 import cashflow from '../assets/cash-flow.png'
 import emergency from '../assets/emergency.png'
@@ -27,6 +28,14 @@ export default function AIAssistant() {
 
   useEffect(() => { loadAll() }, [])
 
+  // the AI insight is made in the background; swap it in when it's ready
+  useEffect(() => followCashflowInsight(
+    cf?.insight_job_id,
+    cf?.insight_status,
+    (insight) => setCf((prev) => ({ ...prev, ai_insight: insight, insight_status: 'ready' })),
+    () => setCf((prev) => ({ ...prev, insight_status: 'unavailable' }))
+  ), [cf?.insight_job_id, cf?.insight_status])
+
   async function loadAll() {
     setLoading(true)
     try {
@@ -176,6 +185,9 @@ export default function AIAssistant() {
             <p className="text-white/80 text-sm leading-relaxed italic">
               {cf.ai_insight || 'Add your GitHub token in .env to enable AI insights.'}
             </p>
+            {(cf.insight_status === 'pending' || cf.insight_status === 'stale') && (
+              <p className="text-white/30 text-xs mt-2">Updating with AI...</p>
+            )}
           </div>
 
           {cf.upcoming_collections?.length > 0 && (
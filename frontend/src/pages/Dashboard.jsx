@@ -4,6 +4,7 @@ import {
   AreaChart, Area, XAxis, YAxis, Tooltip, ResponsiveContainer,
 } from "recharts";
 import api from "../api/axiosClient";
+import { followCashflowInsight } from "../api/jobs";
 import ledger from "../assets/ledger.png";
 import money from "../assets/money.png";
 import cashflow from "../assets/cash-flow.png";
@@ -41,6 +42,14 @@ export default function Dashboard() {
     load();
   }, []);
 
+  // the AI insight is made in the background; swap it in when it's ready
+  useEffect(() => followCashflowInsight(
+    cf?.insight_job_id,
+    cf?.insight_status,
+    (insight) => setCf((prev) => ({ ...prev, ai_insight: insight, insight_status: "ready" })),
+    () => setCf((prev) => ({ ...prev, insight_status: "unavailable" }))
+  ), [cf?.insight_job_id, cf?.insight_status]);
+
   if (loading) return (
     <div className="flex items-center justify-center min-h-[60vh]">
       <div className="text-center">
@@ -230,6 +239,9 @@ export default function Dashboard() {
             <p className="text-white/70 text-sm leading-relaxed italic">
               {cf?.ai_insight || "GitHub token .env میں شامل کریں تاکہ AI مشورے فعال ہوں۔"}
             </p>
+            {(cf?.insight_status === "pending" || cf?.insight_status === "stale") && (
+              <p className="text-white/30 text-xs mt-2">AI مشورہ تیار ہو رہا ہے... · Updating</p>
+            )}
           </div>
           <button
             onClick={() => navigate("/ai")}